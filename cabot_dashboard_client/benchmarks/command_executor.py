@@ -0,0 +1,119 @@
+"""Show what a robot does while a long software_update runs
+
+Usage (from cabot_dashboard_client):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/command_executor.py --update-s 5
+
+Runs the server with uvicorn and the real CabotDashboardClient against it,
+with system commands replaced by sleeps: --update-s for updates, --exec-ms for
+everything else. A software_update is queued, then 0.5 s later a ros-stop, two
+get-env and a second software_update. "inline" awaits every command before
+polling again (the old client), "executor" is the current CommandExecutor.
+Prints the enqueue-to-result time per command from the server's CommandTracker,
+and how many status reports (polls or heartbeats) arrived during the update.
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "cabot_dashboard_server" / "benchmarks"))
+
+import harness  # noqa: E402
+from app.dependencies import command_queue_manager  # noqa: E402
+from app.main import app  # noqa: E402
+
+UPDATES = ("software_update", "site_update", "env_update")
+
+
+class CountingApp:
+    """ASGI wrapper counting robot status reports"""
+
+    def __init__(self, app):
+        self.app = app
+        self.reports = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["path"].startswith("/api/client/poll"):
+            self.reports += 1
+        elif scope["path"].startswith("/api/client/ws"):
+            async def counting_receive():
+                message = await receive()
+                if '"heartbeat"' in (message.get("text") or ""):
+                    self.reports += 1
+                return message
+            return await self.app(scope, counting_receive, send)
+        await self.app(scope, receive, send)
+
+
+class InlineExecutor:
+    """The old behavior: the command runs before the robot polls again"""
+
+    async def submit(self, command_type, run, command_id=None):
+        await run()
+
+    def cancel(self):
+        pass
+
+
+async def measure(url: str, counter: CountingApp, use_websocket: bool, inline: bool, update_s: float, exec_ms: float):
+    robot_id = f"bench_{'ws' if use_websocket else 'poll'}_{'inline' if inline else 'executor'}"
+    client = harness.robot_client(robot_id, url, use_websocket=use_websocket, heartbeat_interval=0.5, polling_interval=0.1)
+
+    async def execute(command, on_output=None):
+        await asyncio.sleep(update_s if command[0] in UPDATES else exec_ms / 1000)
+        return True, "CABOT_SITE=bench"
+
+    async def collect_status():
+        return {"cabot_system_status": "inactive", "cabot_disk_usage": "42%", "cabot_wifi_status": "unknown"}
+
+    client.system_command.execute = execute
+    client.collect_status = collect_status
+    if inline:
+        client.command_executor = InlineExecutor()
+    tracker = command_queue_manager.tracker
+    task = asyncio.ensure_future(client.run())
+    await asyncio.sleep(1.5)  # connect and the get-env for a new robot
+    tracker.histograms.clear()
+    tracker.outcomes.clear()
+
+    update = {"command": "software_update", "commandOption": {"images": [{"version": "v1"}]}}
+    await command_queue_manager.add_command(robot_id, update)
+    await asyncio.sleep(0.5)
+    reports = counter.reports
+    await command_queue_manager.add_command(robot_id, {"command": "ros-stop", "commandOption": {}})
+    await command_queue_manager.add_command(robot_id, {"command": "get-env", "commandOption": {"n": 1}})
+    await command_queue_manager.add_command(robot_id, {"command": "get-env", "commandOption": {"n": 2}})
+    await command_queue_manager.add_command(robot_id, {"command": "software_update", "commandOption": {"images": [{"version": "v2"}]}})
+    await asyncio.sleep(update_s - 0.5)
+    reports = counter.reports - reports
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + 3 * update_s + 5
+    while tracker.in_flight.get(robot_id) and loop.time() < deadline:
+        await asyncio.sleep(0.05)
+    await harness.stop(task)
+    return tracker.get_latency(), reports
+
+
+async def run(update_s: float, exec_ms: float):
+    counter = CountingApp(app)
+    async with harness.serve(counter) as url:
+        print(f"software_update of {update_s:g} s, then ros-stop, get-env x2 and another software_update; {exec_ms:g} ms per other command")
+        print(f"{'channel':10} {'client':9} {'ros-stop ms':>12} {'get-env ms':>11} {'updates ms':>11} {'reports during update':>22}")
+        for channel, use_websocket in (("long-poll", False), ("websocket", True)):
+            for name, inline in (("inline", True), ("executor", False)):
+                latency, reports = await measure(url, counter, use_websocket, inline, update_s, exec_ms)
+                means = [latency.get(command, {}).get("stages", {}).get("total", {}).get("mean_ms") for command in ("ros-stop", "get-env", "software_update")]
+                print(f"{channel:10} {name:9} " + " ".join(f"{mean:11.0f}" if mean is not None else f"{'-':>11}" for mean in means)
+                      + f" {reports:22d}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--update-s", type=float, default=5)
+    parser.add_argument("--exec-ms", type=float, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.update_s, args.exec_ms))
+
+
+if __name__ == "__main__":
+    main()
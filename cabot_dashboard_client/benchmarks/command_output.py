@@ -0,0 +1,123 @@
+"""Measure when dashboards see the output of a long software_update, buffered vs streamed
+
+Usage (from cabot_dashboard_client):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/command_output.py --seconds 5 --lines 3000
+
+Runs the server with uvicorn and the real CabotDashboardClient against it, over
+long-polling and the WebSocket channel. remote-exec.sh is replaced by a script
+printing --lines lines of pull progress (every tenth one on stderr) spread over
+--seconds. "buffered" collects the output when the command exits (the old
+client), "streamed" is the current OutputBatcher. Reports when the first line
+reached dashboards, how many command_output broadcasts and HTTP progress posts
+it took, and the output the server kept under CABOT_DASHBOARD_COMMAND_OUTPUT_MAX_BYTES.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "cabot_dashboard_server" / "benchmarks"))
+
+import harness  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.dependencies import command_queue_manager  # noqa: E402
+from app.services.websocket import manager as websocket_manager  # noqa: E402
+
+REMOTE_EXEC = """#!/bin/sh
+i=0
+while [ $i -lt {lines} ]; do
+    if [ $((i % 10)) -eq 9 ]; then
+        echo "layer $i: retrying download" >&2
+    else
+        echo "layer $i: Pull complete sha256:0123456789abcdef0123456789abcdef0123456789abcdef"
+    fi
+    i=$((i + 1))
+    if [ $((i % 100)) -eq 0 ]; then sleep {pause}; fi
+done
+"""
+
+
+async def measure(url: str, use_websocket: bool, streamed: bool, seconds: float):
+    robot_id = f"bench_{'ws' if use_websocket else 'poll'}_{'streamed' if streamed else 'buffered'}"
+    client = harness.robot_client(robot_id, url, use_websocket=use_websocket, heartbeat_interval=0.5, polling_interval=0.1)
+
+    async def collect_status():
+        return {"cabot_system_status": "inactive", "cabot_disk_usage": "42%", "cabot_wifi_status": "unknown"}
+
+    client.collect_status = collect_status
+    if not streamed:
+        execute = client.system_command.execute
+        client.system_command.execute = lambda command, on_output=None: execute(command)
+
+    broadcasts, first_line, sent = [], [], []
+    broadcast = websocket_manager.broadcast
+
+    async def recording_broadcast(message):
+        if message.get("type") == "command_output" and robot_id in message["output"]:
+            broadcasts.append(message)
+            if not first_line:
+                first_line.append(time.perf_counter())
+        await broadcast(message)
+
+    send_status = client._make_request
+
+    async def counting_request(transport, method, endpoint, data=None, timeout=None, idempotent=False):
+        if endpoint.startswith("send/"):
+            sent.append(data.get("status"))
+        return await send_status(transport, method, endpoint, data, timeout, idempotent)
+
+    client._make_request = counting_request
+    task = asyncio.ensure_future(client.run())
+    await asyncio.sleep(1.5)  # connect and the get-env for a new robot
+    websocket_manager.broadcast = recording_broadcast
+    tracker = command_queue_manager.tracker
+    started = time.perf_counter()
+    await command_queue_manager.add_command(robot_id, {"command": "software_update", "commandOption": {"images": [{"version": "v1"}]}})
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + seconds * 3 + 10
+    while not tracker.outcomes.get("software_update") and loop.time() < deadline:
+        await asyncio.sleep(0.05)
+    finished = time.perf_counter()
+    await asyncio.sleep(0.5)  # the last coalesced broadcast
+    websocket_manager.broadcast = broadcast
+    tracker.outcomes.clear()
+    await harness.stop(task)
+
+    outputs = tracker.get_output(robot_id)[robot_id]
+    kept = outputs[-1] if outputs else {"lines": [], "dropped_bytes": 0}
+    return {
+        "first_line_s": first_line[0] - started if first_line else None,
+        "result_s": finished - started,
+        "broadcasts": len(broadcasts),
+        "progress": sent.count("progress"),
+        "kept_lines": len(kept["lines"]),
+        "kept_bytes": sum(len(text) for _, text in kept["lines"]),
+        "dropped_bytes": kept["dropped_bytes"],
+    }
+
+
+async def run(seconds: float, lines: int):
+    harness.remote_exec_dir(REMOTE_EXEC.format(lines=lines, pause=seconds / max(1, lines // 100)))
+
+    async with harness.serve() as url:
+        print(f"software_update printing {lines} lines over {seconds:g} s, output kept up to {settings.command_output_max_bytes} bytes")
+        print(f"{'channel':10} {'client':9} {'first line s':>13} {'result s':>9} {'broadcasts':>11} {'posts':>6} {'kept lines':>11} {'kept bytes':>11} {'dropped bytes':>14}")
+        for channel, use_websocket in (("long-poll", False), ("websocket", True)):
+            for name, streamed in (("buffered", False), ("streamed", True)):
+                result = await measure(url, use_websocket, streamed, seconds)
+                first = f"{result['first_line_s']:13.2f}" if result["first_line_s"] is not None else f"{'-':>13}"
+                print(f"{channel:10} {name:9} {first} {result['result_s']:9.2f} {result['broadcasts']:11d} {result['progress']:6d} "
+                      f"{result['kept_lines']:11d} {result['kept_bytes']:11d} {result['dropped_bytes']:14d}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--lines", type=int, default=3000)
+    args = parser.parse_args()
+    asyncio.run(run(args.seconds, args.lines))
+
+
+if __name__ == "__main__":
+    main()
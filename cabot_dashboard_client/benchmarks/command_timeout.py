@@ -0,0 +1,105 @@
+"""Show what happens to a hung software_update: no deadline, timed out, cancelled
+
+Usage (from cabot_dashboard_client):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/command_timeout.py --timeout-s 2 --wait-s 6
+
+Runs the server with uvicorn and the real CabotDashboardClient against it.
+remote-exec.sh is replaced by a script whose updates hang like an ssh to a
+powered-off host, after starting a child process of their own. "no deadline"
+is the old client (no timeout), "timeout" gives updates --timeout-s, "cancel"
+cancels the running update from the dashboard side after 1 s, and "cancel
+waiting" cancels a second update queued behind it. Prints the outcome the
+server's CommandTracker recorded, when, and the processes left behind.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "cabot_dashboard_server" / "benchmarks"))
+
+import harness  # noqa: E402
+from app.dependencies import command_queue_manager  # noqa: E402
+
+HANG = 4242  # Marks the processes a hung update leaves
+REMOTE_EXEC = f"""#!/bin/sh
+case "$1" in
+    cabot-is-active) echo inactive; exit 3;;
+    software_update) sleep {HANG} & echo "pulling"; sleep {HANG};;
+esac
+"""
+
+
+def leftover_processes() -> int:
+    count = 0
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                count += f.read().split(b"\0")[:2] == [b"sleep", str(HANG).encode()]
+        except OSError:
+            pass
+    return count
+
+
+async def measure(url: str, mode: str, timeout_s: float, wait_s: float):
+    robot_id = f"bench_{mode.replace(' ', '_')}"
+    client = harness.robot_client(robot_id, url, polling_interval=0.1)
+    client.system_command.timeouts["software_update"] = timeout_s if mode == "timeout" else float("inf") if mode == "no deadline" else 3600
+
+    tracker = command_queue_manager.tracker
+    task = asyncio.ensure_future(client.run())
+    await asyncio.sleep(1.5)  # connect and the get-env for a new robot
+    tracker.outcomes.clear()
+
+    started = time.perf_counter()
+    update = {"command": "software_update", "commandOption": {"images": [{"version": "v1"}]}}
+    target = await command_queue_manager.add_command(robot_id, update)
+    command_ids = list(tracker.in_flight.get(robot_id, {}))
+    if mode == "cancel waiting":
+        await command_queue_manager.add_command(robot_id, {"command": "site_update", "commandOption": {"CABOT_SITE": "bench"}})
+    await asyncio.sleep(1)
+    if mode.startswith("cancel"):
+        command_ids = [command_id for command_id in tracker.in_flight.get(robot_id, {}) if command_id not in command_ids or mode == "cancel"]
+        cancelled_at = time.perf_counter()
+        result = await command_queue_manager.cancel_command(robot_id, command_ids[0])
+        assert result == "sent", (target, result)
+
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + wait_s
+    watched = "site_update" if mode == "cancel waiting" else "software_update"
+    while not tracker.outcomes.get(watched) and loop.time() < deadline:
+        await asyncio.sleep(0.05)
+    outcome = ", ".join(tracker.outcomes.get(watched, {})) or "none"
+    elapsed = time.perf_counter() - (cancelled_at if mode.startswith("cancel") else started)
+    await asyncio.sleep(0.5)
+    left = leftover_processes()
+
+    await harness.stop(task)
+    os.system(f"pkill -f 'sleep {HANG}' 2>/dev/null")
+    return outcome, elapsed if outcome != "none" else None, left
+
+
+async def run(timeout_s: float, wait_s: float):
+    harness.remote_exec_dir(REMOTE_EXEC)
+
+    async with harness.serve() as url:
+        print(f"software_update hanging on the robot, {timeout_s:g} s timeout, results awaited for {wait_s:g} s")
+        print(f"{'client':15} {'outcome':10} {'after s':>8} {'processes left':>15}")
+        for mode in ("no deadline", "timeout", "cancel", "cancel waiting"):
+            outcome, elapsed, left = await measure(url, mode, timeout_s, wait_s)
+            after = f"{elapsed:8.2f}" if elapsed is not None else f"{'-':>8}"
+            print(f"{mode:15} {outcome:10} {after} {left:15d}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--timeout-s", type=float, default=2)
+    parser.add_argument("--wait-s", type=float, default=6)
+    args = parser.parse_args()
+    asyncio.run(run(args.timeout_s, args.wait_s))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Count the connections simulated robots open to the server, and what they cost
+
+Usage (from cabot_dashboard_client):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/http_transport.py --clients 20 --rtt-ms 50
+
+Runs the server with uvicorn behind a local TCP proxy that counts accepted
+connections and holds each one for --rtt-ms before forwarding, standing in for
+the TCP (and TLS) handshake to a remote server. --clients CabotDashboardClients
+connect and send --requests statuses each, like --simulate does. "per request"
+opens a session for every request (as _get_token did), "per client" gives each
+client its own session (as run() did), "shared" is the process-wide transport.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "cabot_dashboard_server" / "benchmarks"))
+
+import harness  # noqa: E402
+
+
+class HandshakeProxy:
+    def __init__(self, upstream_port: int, rtt: float):
+        self.upstream_port = upstream_port
+        self.rtt = rtt
+        self.connections = 0
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._accept, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def _accept(self, reader, writer):
+        self.connections += 1
+        await asyncio.sleep(self.rtt)
+        upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", self.upstream_port)
+        await asyncio.gather(self._pipe(reader, upstream_writer), self._pipe(upstream_reader, writer))
+
+    async def _pipe(self, reader, writer):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class PerRequestTransport:
+    """A new session, and so a new connection, for every request"""
+
+    def __init__(self, module, config):
+        self.module = module
+        self.config = config
+
+    async def request(self, *args, **kwargs):
+        transport = self.module.HttpTransport(self.config)
+        try:
+            return await transport.request(*args, **kwargs)
+        finally:
+            await transport.close()
+
+
+async def measure(module, url: str, mode: str, clients: int, requests: int):
+    robots = [harness.robot_client(f"bench_{mode.replace(' ', '_')}_{n}", url) for n in range(clients)]
+
+    if mode == "shared":
+        transports = [module.get_transport(robots[0].config)] * clients
+    elif mode == "per client":
+        transports = [module.HttpTransport(robot.config) for robot in robots]
+    else:
+        transports = [PerRequestTransport(module, robot.config) for robot in robots]
+
+    latencies = []
+
+    async def robot_loop(robot, transport):
+        assert await robot.connect(transport)
+        for n in range(requests):
+            started = time.perf_counter()
+            status, _, _ = await robot._make_request(transport, "post", f"send/{robot.cabot_id}", {"type": "status", "n": n}, timeout=10)
+            latencies.append(time.perf_counter() - started)
+            assert status == 200, status
+
+    started = time.perf_counter()
+    await asyncio.gather(*(robot_loop(robot, transport) for robot, transport in zip(robots, transports)))
+    elapsed = time.perf_counter() - started
+    if mode == "shared":
+        await module.close_transport()
+    elif mode == "per client":
+        await asyncio.gather(*(transport.close() for transport in transports))
+    latencies.sort()
+    return elapsed, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+
+async def run(clients: int, requests: int, rtt_ms: float):
+    import cabot_dashboard_client as module
+
+    async with harness.serve() as server_url:
+        print(f"{clients} clients, connect + {requests} statuses each, {rtt_ms:g} ms per new connection")
+        print(f"{'session':12} {'connections':>12} {'total s':>8} {'p50 ms':>7} {'p95 ms':>7}")
+        for mode in ("per request", "per client", "shared"):
+            proxy = HandshakeProxy(int(server_url.rsplit(":", 1)[1]), rtt_ms / 1000)
+            url = f"http://127.0.0.1:{await proxy.start()}"
+            elapsed, p50, p95 = await measure(module, url, mode, clients, requests)
+            await proxy.close()
+            print(f"{mode:12} {proxy.connections:12d} {elapsed:8.2f} {p50:7.1f} {p95:7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.requests, args.rtt_ms))
+
+
+if __name__ == "__main__":
+    main()
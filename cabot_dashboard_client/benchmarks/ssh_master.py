@@ -0,0 +1,83 @@
+"""Time remote-exec.sh with and without the client's ssh master connection
+
+Usage (from cabot_dashboard_client):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/ssh_master.py --handshake-ms 200
+
+There is no sshd here, so ssh is replaced on PATH by benchmarks/ssh_standin.py,
+which runs the command locally and charges --handshake-ms for every new
+connection (see its docstring). The client's SystemCommand runs cabot-is-active
+and get-disk-usage through the real remote-exec.sh --commands times, first with
+a connection per call and then over SshControlMaster. The master is then killed
+to check that the health check (--check-s) brings it back.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARKS = Path(__file__).resolve().parent
+CLIENT = BENCHMARKS.parent
+sys.path.insert(0, str(CLIENT))
+
+from cabot_dashboard_client import CommandType, SshControlMaster, SystemCommand  # noqa: E402
+
+COMMANDS = [CommandType.CABOT_IS_ACTIVE, CommandType.GET_DISK_USAGE]
+
+
+async def measure(system_command: SystemCommand, commands: int):
+    latencies = []
+    for n in range(commands):
+        started = time.perf_counter()
+        await system_command.execute([COMMANDS[n % len(COMMANDS)].value])
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+
+async def run(commands: int, check_s: float):
+    target = os.environ["CABOT_SSH_TARGET"]
+    print(f"{commands} remote-exec.sh calls, {os.environ['SSH_STANDIN_HANDSHAKE_MS']} ms per new ssh connection")
+    print(f"{'ssh':16} {'p50 ms':>8} {'p95 ms':>8}")
+    p50, p95 = await measure(SystemCommand("bench"), commands)
+    print(f"{'per command':16} {p50:8.1f} {p95:8.1f}")
+
+    master = SshControlMaster(target, "/dev/null", check_s)
+    p50, p95 = await measure(SystemCommand("bench", ssh_master=master), commands)
+    print(f"{'master':16} {p50:8.1f} {p95:8.1f}")
+
+    killed = master._process
+    killed.kill()
+    await killed.wait()
+    started = time.perf_counter()
+    while not master.healthy or master._process is killed:
+        await asyncio.sleep(0.05)
+    print(f"master killed, re-established after {time.perf_counter() - started:.1f} s")
+    p50, p95 = await measure(SystemCommand("bench", ssh_master=master), commands)
+    print(f"{'master (again)':16} {p50:8.1f} {p95:8.1f}")
+    await master.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commands", type=int, default=20)
+    parser.add_argument("--handshake-ms", type=float, default=200)
+    parser.add_argument("--check-s", type=float, default=1)
+    args = parser.parse_args()
+
+    bin_dir = tempfile.mkdtemp()
+    with open(os.path.join(bin_dir, "ssh"), "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{BENCHMARKS / "ssh_standin.py"}" "$@"\n')
+    os.chmod(os.path.join(bin_dir, "ssh"), 0o755)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+    os.environ["SSH_STANDIN_HANDSHAKE_MS"] = f"{args.handshake_ms:g}"
+    os.environ["CABOT_SSH_TARGET"] = "cabot@standin"
+    os.environ["CABOT_SSH_ID_FILE"] = "/dev/null"
+    os.chdir(CLIENT)  # remote-exec.sh is run as ./remote-exec.sh
+    asyncio.run(run(args.commands, args.check_s))
+
+
+if __name__ == "__main__":
+    main()
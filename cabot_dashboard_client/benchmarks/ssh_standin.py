@@ -0,0 +1,105 @@
+"""Stand-in for ssh, used by benchmarks/ssh_master.py where there is no sshd
+
+Runs the remote command locally with bash. Every new connection sleeps
+SSH_STANDIN_HANDSHAKE_MS first, standing in for the TCP, key exchange and
+authentication round-trips. As with OpenSSH, "-M -N" starts a master listening
+on the -o ControlPath socket, "-O check" / "-O exit" talk to it, and other
+invocations with a ControlPath whose master is up run their command through it
+without a handshake.
+"""
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+HANDSHAKE = float(os.environ.get("SSH_STANDIN_HANDSHAKE_MS", "200")) / 1000
+OPTIONS_WITH_VALUE = ("-o", "-i", "-O", "-p", "-l", "-F")
+
+
+def parse(argv):
+    flags, options, positional = set(), {}, []
+    args = iter(argv)
+    for arg in args:
+        if positional:
+            positional.append(arg)
+        elif arg in OPTIONS_WITH_VALUE:
+            value = next(args)
+            if arg == "-o":
+                key, _, value = value.partition("=")
+                options[key] = value
+            else:
+                options[arg] = value
+        elif arg.startswith("-"):
+            flags.update(arg[1:])
+        else:
+            positional.append(arg)
+    return flags, options, positional[1:]
+
+
+def run(command):
+    completed = subprocess.run(["bash", "-c", command], capture_output=True, text=True)
+    return {"rc": completed.returncode, "stdout": completed.stdout, "stderr": completed.stderr}
+
+
+def request(path, message):
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        return json.loads(sock.makefile().readline())
+
+
+async def master(path):
+    time.sleep(HANDSHAKE)
+    done = asyncio.Event()
+
+    async def serve(reader, writer):
+        message = json.loads(await reader.readline())
+        if message.get("op") == "exit":
+            done.set()
+            reply = {"rc": 0}
+        elif message.get("op") == "check":
+            reply = {"rc": 0}
+        else:
+            reply = await asyncio.get_event_loop().run_in_executor(None, run, message["command"])
+        writer.write(json.dumps(reply).encode() + b"\n")
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_unix_server(serve, path)
+    await done.wait()
+    server.close()
+    os.unlink(path)
+
+
+def main():
+    flags, options, command = parse(sys.argv[1:])
+    path = options.get("ControlPath")
+    if "M" in flags:
+        asyncio.run(master(path))
+        return 0
+    if "-O" in options:
+        try:
+            return request(path, {"op": options["-O"]})["rc"]
+        except OSError:
+            return 255
+    if path and options.get("ControlMaster", "no") == "no":
+        try:
+            reply = request(path, {"command": " ".join(command)})
+        except OSError:
+            reply = None
+        if reply is not None:
+            sys.stdout.write(reply["stdout"])
+            sys.stderr.write(reply["stderr"])
+            return reply["rc"]
+    time.sleep(HANDSHAKE)
+    reply = run(" ".join(command))
+    sys.stdout.write(reply["stdout"])
+    sys.stderr.write(reply["stderr"])
+    return reply["rc"]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Time the status collection that precedes every poll
+
+Usage (from cabot_dashboard_client):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/status_collector.py --ssh-ms 300
+
+Each remote-exec.sh call is replaced by a sleep of --ssh-ms, the cost of a new
+ssh to the host. "serial" awaits cabot-is-active, get-disk-usage and
+get-wifi-status one after the other before each poll (the old collect_status);
+"on demand" is the current StatusCollector, which collects the metrics older
+than their interval in the background and reports their last values. Polls follow each other every
+--interval-ms for --seconds; reports the time each poll waited for its status,
+and the number of remote-exec.sh calls made.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cabot_dashboard_client import CabotDashboardClient, CommandType  # noqa: E402
+
+
+async def serial_status(client: CabotDashboardClient):
+    cabot_system_status = await client.get_cabot_system_status()
+    _, cabot_disk_usage = await client.system_command.execute([CommandType.GET_DISK_USAGE.value])
+    _, cabot_wifi_status = await client.system_command.execute([CommandType.GET_WIFI_STATUS.value])
+    return {"cabot_system_status": cabot_system_status, "cabot_disk_usage": cabot_disk_usage, "cabot_wifi_status": cabot_wifi_status}
+
+
+async def measure(cached: bool, ssh_ms: float, interval_ms: float, seconds: float):
+    client = CabotDashboardClient("bench")
+    calls = []
+
+    async def execute(command, on_output=None):
+        calls.append(command[0])
+        await asyncio.sleep(ssh_ms / 1000)
+        return True, "42%"
+
+    client.system_command.execute = execute
+    waits = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        status = await (client.collect_status() if cached else serial_status(client))
+        waits.append(time.perf_counter() - started)
+        assert status["cabot_disk_usage"] == "42%"
+        await asyncio.sleep(interval_ms / 1000)
+    client.status_collector.stop()
+    waits.sort()
+    return len(waits), waits[len(waits) // 2] * 1000, waits[-1] * 1000, len(calls)
+
+
+async def run(ssh_ms: float, interval_ms: float, seconds: float):
+    print(f"{ssh_ms:g} ms per remote-exec.sh, a poll every {interval_ms:g} ms for {seconds:g} s")
+    print(f"{'status':9} {'polls':>6} {'p50 ms':>8} {'max ms':>8} {'ssh calls':>10}")
+    for name, cached in (("serial", False), ("on demand", True)):
+        polls, p50, worst, calls = await measure(cached, ssh_ms, interval_ms, seconds)
+        print(f"{name:9} {polls:6d} {p50:8.1f} {worst:8.1f} {calls:10d}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ssh-ms", type=float, default=300)
+    parser.add_argument("--interval-ms", type=float, default=100)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.ssh_ms, args.interval_ms, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
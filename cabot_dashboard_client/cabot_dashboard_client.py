@@ -2,16 +2,39 @@ from enum import Enum
 import aiohttp
 import asyncio
 import argparse
+import functools
+import glob
 import logging
+import math
 import os
 from aiohttp import ClientError
 from dataclasses import dataclass
-from typing import Optional, Tuple, Dict, Any, Union
+from typing import Optional, Tuple, Dict, Any, Callable, Awaitable, Mapping, Set
 import json
 import random
+import signal
 import sys
+import tempfile
+import time
 
 MAX_LOG = 500  # None
+WEBSOCKET_RETRY_SECOND = 10 * 60  # Long-poll for this long before trying the WebSocket channel again
+TRANSPORT_STATS_SECOND = 10 * 60  # Interval for logging connection reuse
+SSH_CONNECT_SECOND = 15  # Time allowed for the ssh master connection to come up
+STATUS_SEQ_HEADER = "X-Status-Seq"  # Poll response header acknowledging a status report
+OUTPUT_BATCH_BYTES = 16 * 1024  # Send command output early once this much is waiting
+OUTPUT_LINE_BYTES = 2000  # Longer output lines are cut
+KILL_GRACE_SECOND = 5  # Time a timed-out or cancelled command gets between SIGTERM and SIGKILL
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    HTTP2_AVAILABLE = httpx is not None
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 
 @dataclass
@@ -29,6 +52,23 @@ class Config:
     client_id: str
     client_secret: str
     debug_mode: bool
+    use_websocket: bool
+    heartbeat_interval: int
+    http_transport: str
+    connection_limit: int
+    keepalive_timeout: int
+    dns_cache_ttl: int
+    system_status_interval: float
+    disk_usage_interval: float
+    wifi_status_interval: float
+    ssh_multiplex: bool
+    ssh_check_interval: float
+    host_root: str
+    disk_path: str
+    metrics_interval: float
+    command_workers: int
+    output_interval: float
+    command_timeouts: Dict[str, float]
     token: Optional[str] = None
     token_type: Optional[str] = None
 
@@ -47,6 +87,27 @@ class Config:
             client_id=os.environ.get("CABOT_DASHBOARD_CLIENT_ID"),
             client_secret=os.environ.get("CABOT_DASHBOARD_CLIENT_SECRET"),
             debug_mode=os.environ.get("CABOT_DASHBOARD_DEBUG_MODE", "false").lower() == "true",
+            use_websocket=os.environ.get("CABOT_DASHBOARD_USE_WEBSOCKET", "false").lower() == "true",
+            heartbeat_interval=int(os.environ.get("CABOT_DASHBOARD_HEARTBEAT_INTERVAL", "30")),
+            http_transport=os.environ.get("CABOT_DASHBOARD_HTTP_TRANSPORT", "aiohttp").lower(),
+            connection_limit=int(os.environ.get("CABOT_DASHBOARD_CONNECTION_LIMIT", "0")),
+            keepalive_timeout=int(os.environ.get("CABOT_DASHBOARD_KEEPALIVE_TIMEOUT", "60")),
+            dns_cache_ttl=int(os.environ.get("CABOT_DASHBOARD_DNS_CACHE_TTL", "300")),
+            system_status_interval=float(os.environ.get("CABOT_DASHBOARD_SYSTEM_STATUS_INTERVAL", "2")),
+            disk_usage_interval=float(os.environ.get("CABOT_DASHBOARD_DISK_USAGE_INTERVAL", "60")),
+            wifi_status_interval=float(os.environ.get("CABOT_DASHBOARD_WIFI_STATUS_INTERVAL", "10")),
+            ssh_multiplex=os.environ.get("CABOT_DASHBOARD_SSH_MULTIPLEX", "true").lower() == "true",
+            ssh_check_interval=float(os.environ.get("CABOT_DASHBOARD_SSH_CHECK_INTERVAL", "30")),
+            host_root=os.environ.get("CABOT_DASHBOARD_HOST_ROOT", ""),
+            disk_path=os.environ.get("CABOT_DASHBOARD_DISK_PATH", "/"),
+            metrics_interval=float(os.environ.get("CABOT_DASHBOARD_METRICS_INTERVAL", "5")),
+            command_workers=int(os.environ.get("CABOT_DASHBOARD_COMMAND_WORKERS", "4")),
+            output_interval=float(os.environ.get("CABOT_DASHBOARD_OUTPUT_INTERVAL", "1")),
+            # e.g. "software_update=3600,get-env=20", on top of COMMAND_TIMEOUTS
+            command_timeouts={
+                name.strip(): float(seconds) for name, seconds in
+                (item.split("=", 1) for item in os.environ.get("CABOT_DASHBOARD_COMMAND_TIMEOUTS", "").split(",") if "=" in item)
+            },
         )
 
 
@@ -67,17 +128,265 @@ class CommandType(Enum):
     GET_WIFI_STATUS = "get-wifi-status"
     DEBUG1 = "debug1"
     DEBUG2 = "debug2"
+    CANCEL = "cancel"
+
+
+# Command types sharing a concurrency limit; types not listed are in "default"
+COMMAND_GROUPS = {
+    CommandType.SOFTWARE_UPDATE: "update",
+    CommandType.SITE_UPDATE: "update",
+    CommandType.ENV_UPDATE: "update",
+    CommandType.ROS_START: "control",
+    CommandType.CABOT_IS_ACTIVE: "query",
+    CommandType.GET_IMAGE_TAGS: "query",
+    CommandType.GET_ENV: "query",
+    CommandType.GET_DISK_USAGE: "query",
+    CommandType.GET_WIFI_STATUS: "query",
+}
+# Commands of a group running at once; None for no limit other than the worker pool
+GROUP_LIMITS = {"update": 1, "control": 1, "query": None, "default": 1}
+# Started right away, even with every worker busy (e.g. stopping during an update); the server's "safety" lane
+ALWAYS_ADMITTED = {CommandType.ROS_STOP, CommandType.SYSTEM_POWEROFF, CommandType.SYSTEM_REBOOT, CommandType.CANCEL}
+# Seconds a remote-exec.sh call may take before it is killed, per command type
+COMMAND_TIMEOUTS = {
+    CommandType.SOFTWARE_UPDATE.value: 1800,
+    CommandType.SITE_UPDATE.value: 600,
+    CommandType.ENV_UPDATE.value: 300,
+    CommandType.ROS_START.value: 120,
+    CommandType.ROS_STOP.value: 60,
+    CommandType.SYSTEM_REBOOT.value: 60,
+    CommandType.SYSTEM_POWEROFF.value: 60,
+    CommandType.CABOT_IS_ACTIVE.value: 15,
+    CommandType.GET_IMAGE_TAGS.value: 30,
+    CommandType.GET_ENV.value: 30,
+    CommandType.GET_DISK_USAGE.value: 15,
+    CommandType.GET_WIFI_STATUS.value: 15,
+}
+DEFAULT_COMMAND_TIMEOUT = 60
+
+
+class CommandTimeout(Exception):
+    """A command ran past its deadline and was killed"""
+
+
+class CommandExecutor:
+    """Runs commands in the background so polling and heartbeats go on meanwhile
+
+    At most `workers` commands run at once and each group of command types has
+    its own limit; commands wait for both in arrival order. ALWAYS_ADMITTED
+    commands skip the wait. Commands submitted with their commandId can be
+    cancelled by it, whether they are waiting or running.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = asyncio.Semaphore(max(1, workers))
+        self.groups = {group: asyncio.Semaphore(limit) for group, limit in GROUP_LIMITS.items() if limit}
+        self.tasks = set()
+        self.commands: Dict[str, asyncio.Future] = {}
+        self.started = set()
+        self.cancelled = set()
+        self.logger = logging.getLogger(__name__)
+
+    async def submit(self, command_type: Optional[str], run: Callable[[], Awaitable[None]], command_id: Optional[str] = None) -> asyncio.Future:
+        """Schedule run() and return without waiting for it"""
+        task = asyncio.ensure_future(self._run(command_type, run, command_id))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        if command_id is not None:
+            self.commands[command_id] = task
+            task.add_done_callback(lambda _: self._forget(command_id))
+        return task
+
+    def _forget(self, command_id: str) -> None:
+        self.commands.pop(command_id, None)
+        self.started.discard(command_id)
+        self.cancelled.discard(command_id)
+
+    async def _run(self, command_type: Optional[str], run: Callable[[], Awaitable[None]], command_id: Optional[str]) -> None:
+        try:
+            kind = CommandType(command_type)
+        except ValueError:
+            kind = None  # handle_command reports the invalid type
+        try:
+            if kind in ALWAYS_ADMITTED:
+                await self._start(run, command_id)
+                return
+            group = self.groups.get(COMMAND_GROUPS.get(kind, "default"))
+            if group is not None and group.locked():
+                self.logger.info(f"{command_type} waits for a running command of its kind")
+            if group is None:
+                async with self.workers:
+                    await self._start(run, command_id)
+            else:
+                async with group, self.workers:
+                    await self._start(run, command_id)
+        except Exception as e:
+            self.logger.error(f"Command {command_type} failed: {e}")
+
+    async def _start(self, run: Callable[[], Awaitable[None]], command_id: Optional[str]) -> None:
+        if command_id is not None:
+            self.started.add(command_id)
+        await run()
+
+    def cancel_command(self, command_id: str) -> Optional[bool]:
+        """Cancel a submitted command
+        Returns:
+            bool: True if it was running (it reports "cancelled" itself), False if it was
+            still waiting to start, None if there is no such command
+        """
+        task = self.commands.get(command_id)
+        if task is None or task.done():
+            return None
+        self.cancelled.add(command_id)
+        task.cancel()
+        return command_id in self.started
+
+    def was_cancelled(self, command_id: Optional[str]) -> bool:
+        return command_id in self.cancelled
+
+    def cancel(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+
+
+class SshControlMaster:
+    """One multiplexed ssh connection to $CABOT_SSH_TARGET shared by every remote-*.sh call
+
+    The scripts pass CABOT_SSH_CONTROL_PATH to ssh and scp, which then run over
+    this connection instead of doing the TCP and authentication handshake each
+    time. A periodic check re-establishes the master when it dies; while it is
+    down the scripts connect on their own as before.
+    """
+
+    def __init__(self, target: str, id_file: str, check_interval: float):
+        self.target = target
+        self.id_file = id_file
+        self.check_interval = check_interval
+        self.control_path = os.path.join(tempfile.gettempdir(), f"cabot-dashboard-ssh-{os.getpid()}.sock")
+        self.healthy = False
+        self.logger = logging.getLogger(__name__)
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._lock = asyncio.Lock()
+        self._retry_at = 0.0
+        self._check_task: Optional[asyncio.Future] = None
+
+    def _options(self) -> list[str]:
+        return ["-o", "StrictHostKeyChecking=no", "-i", self.id_file, "-o", f"ControlPath={self.control_path}"]
+
+    async def _control(self, operation: str) -> bool:
+        """Send -O check / -O exit to the master"""
+        process = await asyncio.create_subprocess_exec(
+            "ssh", *self._options(), "-O", operation, self.target,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+        try:
+            return await asyncio.wait_for(process.wait(), 10) == 0
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return False
+
+    async def env(self) -> Dict[str, str]:
+        """Environment for the remote-*.sh scripts, with the control socket while the master is up"""
+        if self._check_task is None:
+            self._check_task = asyncio.ensure_future(self._check())
+        if not self.healthy and time.monotonic() >= self._retry_at:
+            # Shielded: a command that times out or is cancelled while waiting does not abort the start for the others
+            await asyncio.shield(self._start())
+        env = dict(os.environ)
+        if self.healthy:
+            env["CABOT_SSH_CONTROL_PATH"] = self.control_path
+        return env
+
+    async def _start(self) -> None:
+        async with self._lock:
+            if self.healthy or time.monotonic() < self._retry_at:
+                return
+            await self._stop_process()
+            self._process = await asyncio.create_subprocess_exec(
+                "ssh", "-M", "-N", *self._options(), "-o", "ControlPersist=no", "-o", "BatchMode=yes",
+                "-o", "ServerAliveInterval=15", "-o", "ServerAliveCountMax=3", self.target,
+                stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+            deadline = time.monotonic() + SSH_CONNECT_SECOND
+            while time.monotonic() < deadline and self._process.returncode is None:
+                if os.path.exists(self.control_path) and await self._control("check"):
+                    self.healthy = True
+                    self.logger.info(f"SSH master connection to {self.target} established")
+                    return
+                await asyncio.sleep(0.1)
+            self.logger.warning(f"SSH master connection to {self.target} failed, retrying in {self.check_interval}s")
+            self._retry_at = time.monotonic() + self.check_interval
+            await self._stop_process()
+
+    async def _check(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            if self.healthy and (self._process.returncode is not None or not await self._control("check")):
+                self.logger.warning(f"SSH master connection to {self.target} lost, reconnecting")
+                self.healthy = False
+            if not self.healthy and time.monotonic() >= self._retry_at:
+                await self._start()
+
+    async def _stop_process(self) -> None:
+        if self._process is not None and self._process.returncode is None:
+            self._process.terminate()
+            try:
+                await asyncio.wait_for(self._process.wait(), 5)
+            except asyncio.TimeoutError:
+                self._process.kill()
+                await self._process.wait()
+        self._process = None
+        if os.path.exists(self.control_path):
+            os.unlink(self.control_path)
+
+    async def close(self) -> None:
+        if self._check_task is not None:
+            self._check_task.cancel()
+        if self.healthy:
+            await self._control("exit")
+        self.healthy = False
+        await self._stop_process()
+
+
+_ssh_master: Optional[SshControlMaster] = None
+
+
+def get_ssh_master(config: Config) -> Optional[SshControlMaster]:
+    """The process-wide ssh master, or None if CABOT_DASHBOARD_SSH_MULTIPLEX is off or there is no target"""
+    global _ssh_master
+    target = os.environ.get("CABOT_SSH_TARGET")
+    if not config.ssh_multiplex or not target:
+        return None
+    if _ssh_master is None:
+        _ssh_master = SshControlMaster(target, os.environ.get("CABOT_SSH_ID_FILE", ""), config.ssh_check_interval)
+    return _ssh_master
+
+
+async def close_ssh_master() -> None:
+    global _ssh_master
+    if _ssh_master is not None:
+        master, _ssh_master = _ssh_master, None
+        await master.close()
 
 
 class SystemCommand:
     """System command execution handler"""
 
-    def __init__(self, cabot_id: str, debug_mode: bool = False):
+    def __init__(self, cabot_id: str, debug_mode: bool = False, ssh_master: Optional[SshControlMaster] = None,
+                 timeouts: Optional[Dict[str, float]] = None):
         self.cabot_id = cabot_id
         self.debug_mode = debug_mode
+        self.ssh_master = ssh_master
+        self.timeouts = {**COMMAND_TIMEOUTS, **(timeouts or {})}
         self.logger = logging.getLogger(__name__)
 
-    async def execute(self, command: list[str]) -> Tuple[bool, Optional[str]]:
+    async def execute(self, command: list[str], on_output: Optional[Callable[[str, str], None]] = None) -> Tuple[bool, Optional[str]]:
+        """Run a command through remote-exec.sh
+        Args:
+            command (list[str]): Command type and its arguments
+            on_output (Callable): Called with ("stdout" or "stderr", line) as each line is printed
+        Raises:
+            CommandTimeout: The command ran longer than its type's timeout and was killed
+        """
         command_type = CommandType(command[0])
         if self.debug_mode:
             # Debug mode handling based on CommandType
@@ -102,8 +411,30 @@ class SystemCommand:
         try:
             command.insert(0, "./remote-exec.sh")
             self.logger.info(f"Executing command: {' '.join(command)}")
-            process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-            stdout, stderr = await process.communicate()
+            timeout = self.timeouts.get(command_type.value, DEFAULT_COMMAND_TIMEOUT)
+            process = None
+
+            async def run() -> Tuple[bytes, bytes]:
+                nonlocal process
+                # Waiting for the ssh master counts against the timeout and can be cancelled too
+                env = await self.ssh_master.env() if self.ssh_master is not None else None
+                # A session of its own, so a timeout or cancel can kill ssh and everything else the script started
+                process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                                                               env=env, start_new_session=True)
+                return await self._communicate(process, on_output)
+
+            try:
+                stdout, stderr = await asyncio.wait_for(run(), timeout)
+            except asyncio.TimeoutError:
+                self.logger.warning(f"Command {command_type.value} timed out after {timeout:g}s, killing it")
+                if process is not None:
+                    await self._kill(process)
+                raise CommandTimeout(f"{command_type.value} timed out after {timeout:g}s")
+            except asyncio.CancelledError:
+                self.logger.info(f"Command {command_type.value} cancelled, killing it")
+                if process is not None:
+                    await self._kill(process)
+                raise
 
             stdout_str = stdout.decode().strip()
             stderr_str = stderr.decode().strip()
@@ -117,10 +448,396 @@ class SystemCommand:
                 error_msg = stdout_str or stderr_str or "Unknown error"
                 return False, error_msg
 
+        except CommandTimeout:
+            raise
         except Exception as e:
             self.logger.error(f"Error executing command: {e}")
             return False, str(e)
 
+    async def _communicate(self, process: asyncio.subprocess.Process, on_output: Optional[Callable[[str, str], None]]) -> Tuple[bytes, bytes]:
+        if on_output is None:
+            return await process.communicate()
+        stdout, stderr = await asyncio.gather(
+            self._read_lines(process.stdout, "stdout", on_output), self._read_lines(process.stderr, "stderr", on_output))
+        await process.wait()
+        return stdout, stderr
+
+    async def _kill(self, process: asyncio.subprocess.Process) -> None:
+        """Stop the process group of remote-exec.sh, with SIGKILL if SIGTERM is not enough"""
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                await asyncio.wait_for(process.wait(), KILL_GRACE_SECOND)
+            except asyncio.TimeoutError:
+                os.killpg(process.pid, signal.SIGKILL)
+                await process.wait()
+        except ProcessLookupError:
+            pass
+
+    @staticmethod
+    async def _read_lines(stream: asyncio.StreamReader, name: str, on_output: Callable[[str, str], None]) -> bytes:
+        """Read a stream to the end, passing each line (ended by \\n or \\r) to on_output, and return all of it"""
+        output = bytearray()
+        line = b""
+        while True:
+            chunk = await stream.read(4096)
+            output += chunk
+            *lines, line = (line + chunk).replace(b"\r", b"\n").split(b"\n")
+            line = line[:OUTPUT_LINE_BYTES]
+            if not chunk:
+                lines.append(line)
+            for text in lines:
+                if text.strip():
+                    on_output(name, text[:OUTPUT_LINE_BYTES].decode(errors="replace"))
+            if not chunk:
+                return bytes(output)
+
+
+class OutputBatcher:
+    """Sends the output lines of a running command as periodic "progress" statuses
+
+    Lines are collected as they are printed and sent every interval seconds, or
+    sooner once OUTPUT_BATCH_BYTES are waiting. close() sends what is left, so
+    every line arrives before the command's result.
+    """
+
+    def __init__(self, send: Callable[[Dict], Awaitable[Any]], interval: float):
+        self.send = send
+        self.interval = interval
+        self.lines: list[list[str]] = []
+        self.bytes = 0
+        self._full = asyncio.Event()
+        self._closed = False
+        self._task = asyncio.ensure_future(self._run())
+
+    def add(self, stream: str, text: str) -> None:
+        self.lines.append([stream, text])
+        self.bytes += len(text.encode())
+        if self.bytes >= OUTPUT_BATCH_BYTES:
+            self._full.set()
+
+    async def _run(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            if self.lines:
+                lines, self.lines, self.bytes = self.lines, [], 0
+                await self.send({"status": "progress", "output": lines})
+
+    async def close(self) -> None:
+        self._closed = True
+        self._full.set()
+        await self._task
+
+
+class HostMetrics:
+    """Reads host metrics from /proc and /sys instead of running commands over ssh
+
+    host_root is where the host's file system is visible ("/" when running on
+    the host, the mount point of a read-only bind mount in a container). Every
+    value is a number (or a bool) so the server does not have to parse text; a
+    source that cannot be read is left out.
+    """
+
+    def __init__(self, host_root: str, disk_path: str):
+        self.host_root = host_root
+        self.disk_path = disk_path
+        self.logger = logging.getLogger(__name__)
+        self.readers = [self._disk, self._wifi, self._load, self._memory, self._thermal]
+
+    def _path(self, path: str) -> str:
+        return os.path.join(self.host_root, path.lstrip("/"))
+
+    def available(self) -> bool:
+        return bool(self.host_root) and os.path.isfile(self._path("/proc/loadavg"))
+
+    def collect(self) -> Dict[str, Any]:
+        metrics = {}
+        for reader in self.readers:
+            try:
+                metrics.update(reader())
+            except (OSError, ValueError, KeyError) as e:
+                self.logger.debug(f"Metric {reader.__name__} unavailable: {e!r}")
+        return metrics
+
+    def _disk(self) -> Dict[str, Any]:
+        stat = os.statvfs(self._path(self.disk_path))
+        used = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+        available = stat.f_bavail * stat.f_frsize
+        return {
+            # Rounded up like the Use% column of df
+            "disk_used_percent": math.ceil(used * 100 / (used + available)) if used + available else 0,
+            "disk_available_bytes": available,
+            "disk_total_bytes": stat.f_blocks * stat.f_frsize,
+        }
+
+    def _wifi(self) -> Dict[str, Any]:
+        devices = []
+        for device in glob.glob(self._path("/sys/class/rfkill/rfkill*")):
+            with open(os.path.join(device, "type")) as f:
+                if f.read().strip() != "wlan":
+                    continue
+            with open(os.path.join(device, "soft")) as f:
+                devices.append(f.read().strip() == "0")
+        return {"wifi_enabled": any(devices)} if devices else {}
+
+    def _load(self) -> Dict[str, Any]:
+        with open(self._path("/proc/loadavg")) as f:
+            load_1m, load_5m, load_15m = (float(value) for value in f.read().split()[:3])
+        return {"load_1m": load_1m, "load_5m": load_5m, "load_15m": load_15m, "cpu_count": os.cpu_count()}
+
+    def _memory(self) -> Dict[str, Any]:
+        meminfo = {}
+        with open(self._path("/proc/meminfo")) as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                meminfo[key] = int(value.split()[0]) * 1024
+        total, available = meminfo["MemTotal"], meminfo["MemAvailable"]
+        return {
+            "mem_total_bytes": total,
+            "mem_available_bytes": available,
+            "mem_used_percent": round((total - available) * 100 / total, 1),
+        }
+
+    def _thermal(self) -> Dict[str, Any]:
+        temperatures = []
+        for zone in glob.glob(self._path("/sys/class/thermal/thermal_zone*/temp")):
+            with open(zone) as f:
+                temperatures.append(int(f.read()) / 1000)
+        return {"temperature_c": round(max(temperatures), 1)} if temperatures else {}
+
+
+class StatusCollector:
+    """Collects the robot status when a poll or heartbeat is about to report it
+
+    Every metric is a remote-exec.sh call (a new ssh to the host), so it is run
+    only for a report, and only if its last value is older than the metric's
+    max age. A report does not wait for it: the collection runs in the
+    background, at most one per metric, and the report carries the last value.
+    Only a metric that has never been collected is waited for.
+    """
+
+    def __init__(self, collectors: Dict[str, Tuple[Callable[[], Awaitable[Any]], float]]):
+        self.collectors = collectors
+        self.values: Dict[str, Any] = {}
+        self.collected_at: Dict[str, float] = {}
+        self.logger = logging.getLogger(__name__)
+        self._running: Dict[str, asyncio.Future] = {}
+        self._again: Set[str] = set()
+
+    async def _collect(self, name: str) -> None:
+        collect, _ = self.collectors[name]
+        try:
+            self.values[name] = await collect()
+        except Exception as e:
+            self.logger.error(f"Collecting {name} failed: {e}")
+        self.collected_at[name] = time.monotonic()
+
+    def _start(self, name: str) -> None:
+        if name in self._running:
+            return
+        task = self._running[name] = asyncio.ensure_future(self._collect(name))
+        task.add_done_callback(lambda task, name=name: self._finished(name, task))
+
+    def _finished(self, name: str, task: asyncio.Future) -> None:
+        if self._running.get(name) is not task:
+            return
+        del self._running[name]
+        if name in self._again and not task.cancelled():
+            self._again.discard(name)
+            self._start(name)
+
+    async def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        for name, (_, max_age) in self.collectors.items():
+            if name not in self.collected_at or now - self.collected_at[name] >= max_age:
+                self._start(name)
+        first = [self._running[name] for name in self.collectors if name not in self.collected_at and name in self._running]
+        if first:
+            # Shielded: a report given up on does not cancel a collection others wait for
+            await asyncio.gather(*(asyncio.shield(task) for task in first))
+        return {name: self.values.get(name) for name in self.collectors}
+
+    def refresh(self, name: str) -> None:
+        """Collect the metric again now, even if its value is recent"""
+        if name in self._running:
+            # The running collection may have read the value before the change
+            self._again.add(name)
+        else:
+            self._start(name)
+
+    def stop(self) -> None:
+        for task in self._running.values():
+            task.cancel()
+        self._running = {}
+        self._again.clear()
+        self.collected_at.clear()
+
+
+class StatusReporter:
+    """Numbers status reports and leaves out the fields the server already has
+
+    A report carries status_seq, base_seq (the last report the server
+    acknowledged) and only the fields that differ from that report; with
+    base_seq 0 it is complete. An acknowledgement of 0, or none at all (an
+    error, an older server), makes the next report complete again.
+    """
+
+    MAX_PENDING = 8  # Reports kept while waiting for their acknowledgement
+
+    def __init__(self):
+        self.seq = 0
+        self.acked_seq = 0
+        self.acked_status: Dict[str, Any] = {}
+        self.pending: Dict[int, Dict[str, Any]] = {}
+
+    def report(self, status: Dict[str, Any]) -> Dict[str, Any]:
+        self.seq += 1
+        if self.acked_seq:
+            report = {field: value for field, value in status.items() if field not in self.acked_status or self.acked_status[field] != value}
+        else:
+            report = dict(status)
+        self.pending[self.seq] = status
+        if len(self.pending) > self.MAX_PENDING:
+            del self.pending[min(self.pending)]
+        report.update(status_seq=self.seq, base_seq=self.acked_seq)
+        return report
+
+    def acknowledged(self, seq: Optional[int]) -> None:
+        status = self.pending.get(seq) if seq else None
+        if status is None:
+            self.acked_seq, self.acked_status = 0, {}
+            self.pending.clear()
+            return
+        self.acked_seq, self.acked_status = seq, status
+        self.pending = {pending_seq: pending for pending_seq, pending in self.pending.items() if pending_seq > seq}
+
+
+class HttpTransport:
+    """Connection pool shared by every client in the process
+
+    One aiohttp session with DNS caching and keep-alive serves the token, connect,
+    poll and send requests and the WebSocket channel, so TCP and TLS handshakes are
+    only paid when a connection is first opened or has been idle too long.
+    """
+
+    name = "aiohttp"
+
+    def __init__(self, config: Config):
+        self.logger = logging.getLogger(__name__)
+        self.stats = {"requests": 0, "new_connections": 0, "reused_connections": 0, "dns_cache_hits": 0, "dns_cache_misses": 0, "stale_connections": 0}
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._count("new_connections"))
+        trace.on_connection_reuseconn.append(self._count("reused_connections"))
+        trace.on_dns_cache_hit.append(self._count("dns_cache_hits"))
+        trace.on_dns_cache_miss.append(self._count("dns_cache_misses"))
+        connector = aiohttp.TCPConnector(
+            limit=config.connection_limit,
+            ttl_dns_cache=config.dns_cache_ttl,
+            keepalive_timeout=config.keepalive_timeout,
+        )
+        self.session = aiohttp.ClientSession(connector=connector, trace_configs=[trace])
+        self._stats_task = asyncio.ensure_future(self._log_stats())
+
+    def _count(self, key: str):
+        async def count(session, context, params):
+            self.stats[key] += 1
+        return count
+
+    async def request(self, method: str, url: str, headers: Optional[Dict] = None, json_data: Optional[Dict] = None,
+                      form_data: Optional[Dict] = None, timeout: Optional[float] = None, idempotent: bool = False) -> Tuple[int, str, Mapping[str, str]]:
+        """Send a request and return its status, body and headers
+        Args:
+            idempotent (bool): Safe to send twice. Only such requests are retried when the server closed the pooled
+                connection, since it may have handled the request before closing (a poll takes a command, a send a result)
+        """
+        self.stats["requests"] += 1
+        kwargs = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout is not None else {}
+        try:
+            async with self.session.request(method.upper(), url, headers=headers, json=json_data, data=form_data, **kwargs) as response:
+                return response.status, await response.text(), response.headers
+        except aiohttp.ServerDisconnectedError:
+            if not idempotent:
+                raise
+            # Most likely a kept-alive connection the server had closed as idle; retry once on a fresh one
+            self.stats["stale_connections"] += 1
+            async with self.session.request(method.upper(), url, headers=headers, json=json_data, data=form_data, **kwargs) as response:
+                return response.status, await response.text(), response.headers
+
+    async def _log_stats(self) -> None:
+        while True:
+            await asyncio.sleep(TRANSPORT_STATS_SECOND)
+            self.logger.info(f"HTTP transport {self.name}: {self.stats}")
+
+    async def close(self) -> None:
+        self._stats_task.cancel()
+        await self.session.close()
+
+
+class HttpxTransport(HttpTransport):
+    """Sends requests with httpx, over HTTP/2 when the h2 package is installed
+
+    With HTTP/2 a parked long-poll and the status posts share one connection.
+    The WebSocket channel still goes through the aiohttp session.
+    """
+
+    name = "httpx"
+
+    def __init__(self, config: Config):
+        super().__init__(config)
+        self.http2 = HTTP2_AVAILABLE
+        self.name = "httpx/h2" if self.http2 else "httpx"
+        limits = httpx.Limits(
+            max_connections=config.connection_limit or None,
+            keepalive_expiry=config.keepalive_timeout,
+        )
+        self.client = httpx.AsyncClient(http2=self.http2, limits=limits, timeout=None)
+        self._streams = set()
+
+    async def request(self, method: str, url: str, headers: Optional[Dict] = None, json_data: Optional[Dict] = None,
+                      form_data: Optional[Dict] = None, timeout: Optional[float] = None, idempotent: bool = False) -> Tuple[int, str, Mapping[str, str]]:
+        # httpcore checks a pooled connection is still open before reusing it, so no retry here
+        self.stats["requests"] += 1
+        response = await self.client.request(method.upper(), url, headers=headers, json=json_data, data=form_data, timeout=timeout)
+        # httpcore exposes the connection's stream; a stream not seen before is a new connection
+        stream = id(response.extensions.get("network_stream"))
+        self.stats["reused_connections" if stream in self._streams else "new_connections"] += 1
+        self._streams.add(stream)
+        return response.status_code, response.text, response.headers
+
+    async def close(self) -> None:
+        await self.client.aclose()
+        await super().close()
+
+
+_transport: Optional[HttpTransport] = None
+
+
+def get_transport(config: Config) -> HttpTransport:
+    """The process-wide transport, created on first use by CABOT_DASHBOARD_HTTP_TRANSPORT
+
+    "aiohttp" (default), "httpx", or "auto" for httpx when HTTP/2 is available.
+    """
+    global _transport
+    if _transport is None or _transport.session.closed:
+        use_httpx = config.http_transport == "httpx" or (config.http_transport == "auto" and HTTP2_AVAILABLE)
+        if use_httpx and httpx is None:
+            logging.getLogger(__name__).warning("httpx is not installed, using aiohttp")
+            use_httpx = False
+        _transport = HttpxTransport(config) if use_httpx else HttpTransport(config)
+    return _transport
+
+
+async def close_transport() -> None:
+    global _transport
+    if _transport is not None:
+        transport, _transport = _transport, None
+        transport.logger.info(f"HTTP transport {transport.name}: {transport.stats}")
+        await transport.close()
+
 
 def setup_logger(config: Config) -> logging.Logger:
     logger = logging.getLogger(__name__)
@@ -146,47 +863,61 @@ class CabotDashboardClient:
         self.logger = setup_logger(self.config)
         self.auth_retry_count = 0
         self.MAX_AUTH_RETRIES = 3
-        self.system_command = SystemCommand(cabot_id, self.config.debug_mode)
+        self.system_command = SystemCommand(cabot_id, self.config.debug_mode, get_ssh_master(self.config), self.config.command_timeouts)
+        self.websocket_retry_at = 0.0
+        collectors = {"cabot_system_status": (self.get_cabot_system_status, self.config.system_status_interval)}
+        self.host_metrics = HostMetrics(self.config.host_root, self.config.disk_path)
+        if self.host_metrics.available():
+            # Disk usage and Wi-Fi come with the metrics, without a command over ssh
+            collectors["cabot_metrics"] = (self._collect_metrics, self.config.metrics_interval)
+        else:
+            collectors["cabot_disk_usage"] = (lambda: self._command_output(CommandType.GET_DISK_USAGE), self.config.disk_usage_interval)
+            collectors["cabot_wifi_status"] = (lambda: self._command_output(CommandType.GET_WIFI_STATUS), self.config.wifi_status_interval)
+        self.status_collector = StatusCollector(collectors)
+        self.status_reporter = StatusReporter()
+        self.command_executor = CommandExecutor(self.config.command_workers)
 
-    async def _get_token(self) -> None:
+    async def _get_token(self, transport: HttpTransport) -> None:
         try:
-            async with aiohttp.ClientSession() as session:
-                data = {
-                    "grant_type": "password",
-                    "client_id": self.config.client_id,
-                    "client_secret": self.config.client_secret,
-                    "username": self.config.client_id,
-                    "password": self.config.client_secret,
-                }
-
-                self.logger.debug(f"Requesting token from {self.config.server_url}/oauth/token")
-                self.logger.debug(f"Client ID: {self.config.client_id}")
-
-                async with session.post(
-                    f"{self.config.server_url}/oauth/token",
-                    data=data,
-                    headers={"Content-Type": "application/x-www-form-urlencoded"},
-                ) as response:
-                    if response.status == 200:
-                        token_data = await response.json()
-                        self.config.token = token_data["access_token"]
-                        self.config.token_type = token_data["token_type"]
-                        self.logger.debug("Token obtained successfully")
-                    else:
-                        response_text = await response.text()
-                        self.logger.error(f"Failed to get token. Status: {response.status}, Response: {response_text}")
-                        raise Exception(f"Failed to get access token: {response_text}")
+            data = {
+                "grant_type": "password",
+                "client_id": self.config.client_id,
+                "client_secret": self.config.client_secret,
+                "username": self.config.client_id,
+                "password": self.config.client_secret,
+            }
+
+            self.logger.debug(f"Requesting token from {self.config.server_url}/oauth/token")
+            self.logger.debug(f"Client ID: {self.config.client_id}")
+
+            status, text, _ = await transport.request(
+                "post",
+                f"{self.config.server_url}/oauth/token",
+                form_data=data,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                timeout=30,
+                idempotent=True,
+            )
+            if status == 200:
+                token_data = json.loads(text)
+                self.config.token = token_data["access_token"]
+                self.config.token_type = token_data["token_type"]
+                self.logger.debug("Token obtained successfully")
+            else:
+                self.logger.error(f"Failed to get token. Status: {status}, Response: {text}")
+                raise Exception(f"Failed to get access token: {text}")
         except Exception as e:
             self.logger.error(f"Token request failed: {str(e)}")
             raise
 
-    async def _make_request(self, session: aiohttp.ClientSession, method: str, endpoint: str, data: Optional[Dict] = None, timeout=None) -> Tuple[Optional[int], Optional[Dict]]:
+    async def _make_request(self, transport: HttpTransport, method: str, endpoint: str, data: Optional[Dict] = None,
+                            timeout=None, idempotent: bool = False) -> Tuple[Optional[int], Optional[Dict], Mapping[str, str]]:
         if not self.config.token:
-            await self._get_token()
+            await self._get_token(transport)
 
         if not self.config.api_key:
             self.logger.error("API key is not configured")
-            return None, None
+            return None, None, {}
 
         headers = {
             "Authorization": f"Bearer {self.config.token}",
@@ -198,22 +929,20 @@ class CabotDashboardClient:
         self.logger.debug(f"Making request to {url} with API key: {self.config.api_key[:4]}... | timeout {timeout}")
 
         try:
-            async with getattr(session, method)(url, headers=headers, json=data, timeout=timeout) as response:
-                response_data = await response.json() if response.status == 200 else None
-                if response.status == 401:
-                    self.logger.warning("Token expired, refreshing...")
-                    await self._get_token()
-                    headers["Authorization"] = f"Bearer {self.config.token}"
-                    async with session.request(method, url, json=data, headers=headers) as retry_response:
-                        return retry_response.status, (await retry_response.json() if retry_response.status == 200 else None)
-                return response.status, await response.json() if response.status == 200 else None
+            status, text, response_headers = await transport.request(method, url, headers=headers, json_data=data, timeout=timeout, idempotent=idempotent)
+            if status == 401:
+                self.logger.warning("Token expired, refreshing...")
+                await self._get_token(transport)
+                headers["Authorization"] = f"Bearer {self.config.token}"
+                status, text, response_headers = await transport.request(method, url, headers=headers, json_data=data, timeout=timeout, idempotent=idempotent)
+            return status, json.loads(text) if status == 200 else None, response_headers
         except Exception as e:
             self.logger.error(f"Request error: {str(e)}")
-            return None, None
+            return None, None, {}
 
-    async def connect(self, session: aiohttp.ClientSession) -> bool:
+    async def connect(self, transport: HttpTransport) -> bool:
         for attempt in range(self.config.max_retries):
-            status_code, _ = await self._make_request(session, "post", f"connect/{self.cabot_id}", timeout=10)
+            status_code, _, _ = await self._make_request(transport, "post", f"connect/{self.cabot_id}", timeout=10, idempotent=True)
             if status_code == 200:
                 return True
             elif status_code == 403:
@@ -221,16 +950,32 @@ class CabotDashboardClient:
             await asyncio.sleep(self.config.retry_delay)
         return False
 
-    async def handle_command(self, session: aiohttp.ClientSession, command: Dict[str, Any]) -> None:
+    async def handle_command(self, transport: HttpTransport, command: Dict[str, Any], websocket: Optional[aiohttp.ClientWebSocketResponse] = None) -> None:
         self.logger.info(f"Received command: {command}")
         command_type = command.get("command")
         status_type = "command"
 
         async def send_status(data: Dict) -> bool:
             data["type"] = status_type
-            self.logger.info(f"Sending status: {json.dumps(data, indent=2)[:MAX_LOG]}")
-            status_code, _ = await self._make_request(session, "post", f"send/{self.cabot_id}", data, timeout=10)
-            return False if status_code == 404 else True
+            if "commandId" in command:
+                # Lets the server match the status to the queued command
+                data["commandId"] = command["commandId"]
+            return await self._send_status(transport, data, websocket)
+
+        async def execute_streamed(args):
+            if "commandId" not in command:
+                # The server keeps output per queued command
+                return await self.system_command.execute(args)
+            async def send_output(data: Dict) -> bool:
+                # The status type names the result message, the server keeps the output under the command
+                data["command"] = command_type
+                return await send_status(data)
+
+            batcher = OutputBatcher(send_output, self.config.output_interval)
+            try:
+                return await self.system_command.execute(args, batcher.add)
+            finally:
+                await batcher.close()
 
         async def update_env(options, command_name):
             if not options:
@@ -241,7 +986,7 @@ class CabotDashboardClient:
             with open("/tmp/update.env", "w") as f:
                 for k, v in options.items():
                     f.write(f"{k}={v}\n")
-            success, error = await self.system_command.execute([command_type, "/tmp/update.env"])
+            success, error = await execute_streamed([command_type, "/tmp/update.env"])
             if success:
                 await send_status({"status": "success", "message": f"{command_name} completed successfully"})
             else:
@@ -288,6 +1033,18 @@ class CabotDashboardClient:
                     error_msg = "No output from docker images command" if not output else f"Error getting image tags: {output}"
                     await send_status({"status": "error", "message": error_msg})
 
+            elif cmd_type == CommandType.CANCEL:
+                target = command.get("commandOption", {}).get("commandId")
+                running = self.command_executor.cancel_command(target)
+                if running is None:
+                    await send_status({"status": "error", "message": f"No command {target} to cancel"})
+                    return
+                if not running:
+                    # Cancelled before it started, so it cannot report that itself
+                    await self._send_status(transport, {"type": "command", "status": "cancelled", "commandId": target,
+                                                         "message": "Cancelled before it started"}, websocket)
+                await send_status({"status": "success", "message": f"Cancelled {target}"})
+
             elif cmd_type == CommandType.GET_ENV:
                 status_type = "env"
                 await send_status({"status": "start", "message": "Getting environment variables..."})
@@ -301,7 +1058,9 @@ class CabotDashboardClient:
 
             else:
                 await send_status({"status": "start", "message": f"Executing {command_type}..."})
-                success, error = await self.system_command.execute([command_type])
+                success, error = await execute_streamed([command_type])
+                # ros-start / ros-stop change the system status the next poll reports
+                self.status_collector.refresh("cabot_system_status")
                 if success:
                     await send_status({"status": "success", "message": f"{command_type} completed successfully"})
                 else:
@@ -309,11 +1068,34 @@ class CabotDashboardClient:
 
         except ValueError:
             await send_status({"status": "error", "message": f"Invalid command type: {command_type}"})
+        except CommandTimeout as e:
+            await send_status({"status": "timeout", "message": str(e)})
+        except asyncio.CancelledError:
+            if not self.command_executor.was_cancelled(command.get("commandId")):
+                raise  # The client is stopping
+            await send_status({"status": "cancelled", "message": f"{command_type} cancelled"})
         except Exception as e:
             await send_status({"status": "error", "message": f"Error executing command {command_type}: {str(e)}"})
 
+    async def _send_status(self, transport: HttpTransport, data: Dict, websocket: Optional[aiohttp.ClientWebSocketResponse] = None) -> bool:
+        if data["status"] == "progress":
+            self.logger.debug(f"Sending {len(data['output'])} output lines")
+        else:
+            self.logger.info(f"Sending status: {json.dumps(data, indent=2)[:MAX_LOG]}")
+        if websocket is not None and not websocket.closed:
+            try:
+                await websocket.send_json({"type": "send", "status": data})
+                return True
+            except (ClientError, ConnectionResetError) as e:
+                self.logger.warning(f"Sending status over WebSocket failed, using HTTP: {e}")
+        status_code, _, _ = await self._make_request(transport, "post", f"send/{self.cabot_id}", data, timeout=10)
+        return False if status_code == 404 else True
+
     async def get_cabot_system_status(self) -> str:
-        success, error = await self.system_command.execute([CommandType.CABOT_IS_ACTIVE.value])
+        try:
+            success, error = await self.system_command.execute([CommandType.CABOT_IS_ACTIVE.value])
+        except CommandTimeout:
+            return "unknown"
         if not success:
             if not error:
                 return "unknown"
@@ -331,29 +1113,106 @@ class CabotDashboardClient:
 
         return "active"
 
+    async def _collect_metrics(self) -> Dict[str, Any]:
+        return self.host_metrics.collect()
+
+    async def _command_output(self, command_type: CommandType) -> Optional[str]:
+        _, output = await self.system_command.execute([command_type.value])
+        return output
+
+    async def collect_status(self) -> Dict[str, Any]:
+        """Robot status sent with every poll and heartbeat"""
+        status = await self.status_collector.snapshot()
+        self.logger.debug(f"Add status to poll request: {status['cabot_system_status']}")
+        return status
+
+    def _websocket_wanted(self) -> bool:
+        return self.config.use_websocket and time.monotonic() >= self.websocket_retry_at
+
+    async def run_polling(self, transport: HttpTransport) -> None:
+        while True:
+            report = self.status_reporter.report(await self.collect_status())
+            status_code, data, headers = await self._make_request(transport, "get", f"poll/{self.cabot_id}", report, timeout=5 * 60)
+            acknowledged = headers.get(STATUS_SEQ_HEADER)
+            self.status_reporter.acknowledged(int(acknowledged) if acknowledged is not None else None)
+
+            if status_code == 200:
+                await self.command_executor.submit(data.get("command"), functools.partial(self.handle_command, transport, data), data.get("commandId"))
+            elif status_code == 404 or status_code is None:
+                break
+
+            if self._websocket_wanted():
+                # Time to try the WebSocket channel again
+                break
+            await asyncio.sleep(self.config.polling_interval)
+
+    async def run_websocket(self, transport: HttpTransport) -> bool:
+        """Receive commands over /api/client/ws and stream status upward
+        Returns:
+            bool: False if the channel could not be opened (use long-polling instead)
+        """
+        url = f"{self.config.server_url.replace('http', 'ws', 1)}/api/client/ws/{self.cabot_id}"
+        headers = {
+            "Authorization": f"Bearer {self.config.token}",
+            "X-API-Key": self.config.api_key,
+        }
+        try:
+            websocket = await transport.session.ws_connect(url, headers=headers, heartbeat=self.config.heartbeat_interval, timeout=10)
+        except (ClientError, asyncio.TimeoutError) as e:
+            self.logger.warning(f"WebSocket channel unavailable: {e}")
+            return False
+        self.logger.info(f"WebSocket channel connected: {url}")
+
+        async def send_heartbeats():
+            try:
+                while not websocket.closed:
+                    report = self.status_reporter.report(await self.collect_status())
+                    await websocket.send_json({"type": "heartbeat", **report})
+                    await asyncio.sleep(self.config.heartbeat_interval)
+            except (ClientError, ConnectionResetError) as e:
+                self.logger.warning(f"Sending heartbeat failed: {e}")
+
+        heartbeat = asyncio.ensure_future(send_heartbeats())
+        try:
+            async for message in websocket:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = json.loads(message.data)
+                if data.get("type") == "command":
+                    await self.command_executor.submit(
+                        data["command"].get("command"), functools.partial(self.handle_command, transport, data["command"], websocket),
+                        data["command"].get("commandId"))
+                elif data.get("type") == "status_ack":
+                    self.status_reporter.acknowledged(data.get("status_seq"))
+        finally:
+            heartbeat.cancel()
+            await websocket.close()
+        self.logger.info(f"WebSocket channel closed: {websocket.close_code}")
+        return True
+
     async def run(self) -> None:
-        async with aiohttp.ClientSession() as session:
+        # Shared with the other clients of the process (--simulate), closed by main()
+        transport = get_transport(self.config)
+        try:
             while True:
                 try:
-                    if await self.connect(session):
-                        while True:
-                            cabot_system_status = await self.get_cabot_system_status()
-                            self.logger.debug(f"Add status to poll request: {cabot_system_status}")
-                            _, cabot_disk_usage = await self.system_command.execute([CommandType.GET_DISK_USAGE.value])
-                            _, cabot_wifi_status = await self.system_command.execute([CommandType.GET_WIFI_STATUS.value])
-                            status_code, data = await self._make_request(session, "get", f"poll/{self.cabot_id}", {"cabot_system_status": cabot_system_status, "cabot_disk_usage": cabot_disk_usage, "cabot_wifi_status": cabot_wifi_status}, timeout=5 * 60)
-
-                            if status_code == 200:
-                                await self.handle_command(session, data)
-                            elif status_code == 404 or status_code is None:
-                                break
-
-                            await asyncio.sleep(self.config.polling_interval)
+                    if await self.connect(transport):
+                        # The server may have reset the robot's state on connect, start from a complete report
+                        self.status_reporter.acknowledged(None)
+                        if not self._websocket_wanted():
+                            await self.run_polling(transport)
+                        elif not await self.run_websocket(transport):
+                            self.websocket_retry_at = time.monotonic() + WEBSOCKET_RETRY_SECOND
+                            self.logger.info("Falling back to long-polling")
+                            await self.run_polling(transport)
 
                     await asyncio.sleep(self.config.retry_delay)
 
                 except Exception:
                     await asyncio.sleep(self.config.retry_delay)
+        finally:
+            self.command_executor.cancel()
+            self.status_collector.stop()
 
 
 async def main():
@@ -361,17 +1220,21 @@ async def main():
     parser.add_argument("-s", "--simulate", type=int, help="Simulation mode: specify number of clients to generate")
     args = parser.parse_args()
 
-    if args.simulate:
-        clients = [CabotDashboardClient(f"cabot_{i+1}").run() for i in range(args.simulate)]
-        await asyncio.gather(*clients)
-    else:
-        cabot_id = os.environ.get("CABOT_NAME")
-        if not cabot_id:
-            logging.error("Environment variable CABOT_NAME is not set")
-            sys.exit(1)
-
-        client = CabotDashboardClient(cabot_id)
-        await client.run()
+    try:
+        if args.simulate:
+            clients = [CabotDashboardClient(f"cabot_{i+1}").run() for i in range(args.simulate)]
+            await asyncio.gather(*clients)
+        else:
+            cabot_id = os.environ.get("CABOT_NAME")
+            if not cabot_id:
+                logging.error("Environment variable CABOT_NAME is not set")
+                sys.exit(1)
+
+            client = CabotDashboardClient(cabot_id)
+            await client.run()
+    finally:
+        await close_transport()
+        await close_ssh_master()
 
 
 if __name__ == "__main__":
@@ -6,6 +6,10 @@ if [ -z "$1" ]; then
 fi
 
 options="-o StrictHostKeyChecking=no -i $CABOT_SSH_ID_FILE"
+if [ -n "$CABOT_SSH_CONTROL_PATH" ]; then
+    # Run over the client's ssh master connection (falls back to a new connection if it is gone)
+    options="$options -o ControlMaster=no -o ControlPath=$CABOT_SSH_CONTROL_PATH"
+fi
 case $1 in
     cabot-is-active)
         args="systemctl --user is-active cabot";;
@@ -11,6 +11,11 @@ update_env=$1
 result_env="/tmp/result.env"
 ssh_options="-o StrictHostKeyChecking=no -i $CABOT_SSH_ID_FILE"
 options="-o StrictHostKeyChecking=no -i $CABOT_SSH_ID_FILE -p"
+if [ -n "$CABOT_SSH_CONTROL_PATH" ]; then
+    # Run over the client's ssh master connection (falls back to a new connection if it is gone)
+    ssh_options="$ssh_options -o ControlMaster=no -o ControlPath=$CABOT_SSH_CONTROL_PATH"
+    options="$options -o ControlMaster=no -o ControlPath=$CABOT_SSH_CONTROL_PATH"
+fi
 if [ ! -f "$update_env" ]; then
   echo "Error: $update_env does not exist."
   exit 1
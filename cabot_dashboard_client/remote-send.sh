@@ -6,4 +6,8 @@ if [ -z "$2" ]; then
 fi
 
 options="-o StrictHostKeyChecking=no -i $CABOT_SSH_ID_FILE -p"
+if [ -n "$CABOT_SSH_CONTROL_PATH" ]; then
+    # Run over the client's ssh master connection (falls back to a new connection if it is gone)
+    options="$options -o ControlMaster=no -o ControlPath=$CABOT_SSH_CONTROL_PATH"
+fi
 scp $options $1 $CABOT_SSH_TARGET:$2
@@ -0,0 +1,72 @@
+import asyncio
+
+from cabot_dashboard_client import CommandExecutor
+
+
+class Commands:
+    """Runs that record when they start and block until released"""
+
+    def __init__(self):
+        self.started = []
+        self.released = asyncio.Event()
+
+    def run(self, name):
+        async def run():
+            self.started.append(name)
+            await self.released.wait()
+        return run
+
+
+def test_group_limits_and_worker_pool():
+    async def run():
+        executor, commands = CommandExecutor(workers=3), Commands()
+        await executor.submit("software_update", commands.run("update 1"))
+        await executor.submit("site_update", commands.run("update 2"))
+        await executor.submit("ros-start", commands.run("ros-start"))
+        await executor.submit("get-env", commands.run("get-env"))
+        await executor.submit("get-image-tags", commands.run("get-image-tags"))
+        await asyncio.sleep(0.01)
+        started = list(commands.started)
+        commands.released.set()
+        await asyncio.gather(*executor.tasks)
+        return started, commands.started
+
+    started, finished = asyncio.run(run())
+    # One update at a time, and three workers
+    assert started == ["update 1", "ros-start", "get-env"]
+    assert sorted(finished) == ["get-env", "get-image-tags", "ros-start", "update 1", "update 2"]
+
+
+def test_safety_commands_start_with_every_worker_busy():
+    async def run():
+        executor, commands = CommandExecutor(workers=1), Commands()
+        await executor.submit("software_update", commands.run("software_update"))
+        await executor.submit("get-env", commands.run("get-env"))
+        for command in ("ros-stop", "system-poweroff", "system-reboot", "cancel"):
+            await executor.submit(command, commands.run(command))
+        await asyncio.sleep(0.01)
+        started = list(commands.started)
+        executor.cancel()
+        await asyncio.gather(*executor.tasks, return_exceptions=True)
+        return started
+
+    assert asyncio.run(run()) == ["software_update", "ros-stop", "system-poweroff", "system-reboot", "cancel"]
+
+
+def test_cancel_running_and_waiting_commands():
+    async def run():
+        executor, commands = CommandExecutor(workers=1), Commands()
+        running = await executor.submit("software_update", commands.run("running"), "id-running")
+        waiting = await executor.submit("site_update", commands.run("waiting"), "id-waiting")
+        await asyncio.sleep(0.01)
+        results = (executor.cancel_command("id-waiting"), executor.cancel_command("id-running"), executor.cancel_command("id-unknown"))
+        cancelled = (executor.was_cancelled("id-waiting"), executor.was_cancelled("id-running"))
+        await asyncio.gather(running, waiting, return_exceptions=True)
+        return results, cancelled, running.cancelled() and waiting.cancelled(), commands.started, executor.commands
+
+    results, cancelled, both_cancelled, started, left = asyncio.run(run())
+    assert results == (False, True, None)
+    assert cancelled == (True, True)
+    assert both_cancelled
+    assert started == ["running"]
+    assert left == {}
@@ -0,0 +1,44 @@
+from cabot_dashboard_client import HostMetrics
+
+
+def host_tree(root):
+    """A host's /proc and /sys with two wlan radios, one enabled, and two thermal zones"""
+    (root / "proc").mkdir()
+    (root / "proc" / "loadavg").write_text("0.52 0.38 0.20 1/234 5678\n")
+    (root / "proc" / "meminfo").write_text("MemTotal:       8000000 kB\nMemFree:        1000000 kB\nMemAvailable:   2000000 kB\n")
+    for name, kind, soft in (("rfkill0", "bluetooth", "0"), ("rfkill1", "wlan", "1"), ("rfkill2", "wlan", "0")):
+        device = root / "sys" / "class" / "rfkill" / name
+        device.mkdir(parents=True)
+        (device / "type").write_text(f"{kind}\n")
+        (device / "soft").write_text(f"{soft}\n")
+    for name, millidegrees in (("thermal_zone0", "41000"), ("thermal_zone1", "55250")):
+        zone = root / "sys" / "class" / "thermal" / name
+        zone.mkdir(parents=True)
+        (zone / "temp").write_text(f"{millidegrees}\n")
+
+
+def test_metrics_are_read_from_the_host_tree(tmp_path):
+    host_tree(tmp_path)
+    metrics = HostMetrics(str(tmp_path), "/").collect()
+
+    assert metrics["wifi_enabled"] is True
+    assert (metrics["load_1m"], metrics["load_5m"], metrics["load_15m"]) == (0.52, 0.38, 0.2)
+    assert (metrics["mem_total_bytes"], metrics["mem_available_bytes"]) == (8000000 * 1024, 2000000 * 1024)
+    assert metrics["mem_used_percent"] == 75.0
+    assert metrics["temperature_c"] == 55.2
+    assert 0 <= metrics["disk_used_percent"] <= 100
+    assert metrics["disk_total_bytes"] >= metrics["disk_available_bytes"] > 0
+
+
+def test_unreadable_sources_are_left_out(tmp_path):
+    host_tree(tmp_path)
+    (tmp_path / "proc" / "meminfo").write_text("MemTotal: 8000000 kB\n")
+    for device in (tmp_path / "sys" / "class" / "rfkill").iterdir():
+        (device / "type").write_text("bluetooth\n")
+    host = HostMetrics(str(tmp_path), "/missing")
+
+    metrics = host.collect()
+    assert host.available()
+    assert not HostMetrics("", "/").available()
+    assert not any(key.startswith(("mem_", "disk_", "wifi_")) for key in metrics)
+    assert metrics["load_1m"] == 0.52
@@ -0,0 +1,42 @@
+import asyncio
+
+from aiohttp import web
+
+import cabot_dashboard_client as client
+
+
+async def start_server():
+    async def status(request):
+        return web.json_response({"method": request.method})
+
+    app = web.Application()
+    app.router.add_route("*", "/status", status)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/status"
+
+
+def test_requests_share_one_pooled_connection():
+    async def run():
+        runner, url = await start_server()
+        config = client.Config.from_env()
+        config.http_transport = "aiohttp"
+        try:
+            transport = client.get_transport(config)
+            same = client.get_transport(config) is transport
+            replies = [await transport.request("get", url, idempotent=True), await transport.request("post", url, json_data={})]
+            stats = dict(transport.stats)
+            await client.close_transport()
+            return same, [(status, body) for status, body, _ in replies], stats, transport.session.closed
+        finally:
+            await client.close_transport()
+            await runner.cleanup()
+
+    same, replies, stats, closed = asyncio.run(run())
+    assert same
+    assert replies == [(200, '{"method": "GET"}'), (200, '{"method": "POST"}')]
+    assert (stats["requests"], stats["new_connections"], stats["reused_connections"]) == (2, 1, 1)
+    assert closed
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from cabot_dashboard_client import SshControlMaster
+
+STANDIN = Path(__file__).resolve().parent.parent / "benchmarks" / "ssh_standin.py"
+
+
+@pytest.fixture
+def ssh_standin(tmp_path, monkeypatch):
+    """ssh on PATH replaced by benchmarks/ssh_standin.py"""
+    ssh = tmp_path / "ssh"
+    ssh.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{STANDIN}" "$@"\n')
+    ssh.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("SSH_STANDIN_HANDSHAKE_MS", "0")
+
+
+def test_master_is_shared_and_re_established(ssh_standin):
+    async def run():
+        master = SshControlMaster("cabot@standin", "/dev/null", 0.2)
+        try:
+            env = await master.env()
+            first = master._process
+            first.kill()
+            await first.wait()
+            for _ in range(100):
+                if master.healthy and master._process is not first:
+                    break
+                await asyncio.sleep(0.05)
+            again = await master.env()
+            return env, again, master._process is not first, master.control_path
+        finally:
+            await master.close()
+
+    env, again, replaced, control_path = asyncio.run(run())
+    assert env["CABOT_SSH_CONTROL_PATH"] == control_path
+    assert again["CABOT_SSH_CONTROL_PATH"] == control_path
+    assert replaced
+
+
+def test_scripts_connect_on_their_own_without_a_master(tmp_path, monkeypatch):
+    ssh = tmp_path / "ssh"
+    ssh.write_text("#!/bin/sh\nexit 255\n")  # target unreachable
+    ssh.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+    async def run():
+        master = SshControlMaster("cabot@standin", "/dev/null", 60)
+        try:
+            return await master.env(), master.healthy
+        finally:
+            await master.close()
+
+    env, healthy = asyncio.run(run())
+    assert "CABOT_SSH_CONTROL_PATH" not in env
+    assert not healthy
@@ -0,0 +1,58 @@
+import asyncio
+
+from cabot_dashboard_client import StatusCollector
+
+
+class Metrics:
+    """Collectors that count their calls and take `delay` seconds"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = {}
+
+    def collector(self, name):
+        async def collect():
+            self.calls[name] = self.calls.get(name, 0) + 1
+            await asyncio.sleep(self.delay)
+            return self.calls[name]
+        return collect
+
+
+def test_only_the_first_report_waits():
+    async def run():
+        metrics = Metrics(0.1)
+        collector = StatusCollector({"fast": (metrics.collector("fast"), 0), "slow": (metrics.collector("slow"), 60)})
+        loop = asyncio.get_running_loop()
+        # Reports arriving during the first collection share it
+        first, second = await asyncio.gather(collector.snapshot(), collector.snapshot())
+        started = loop.time()
+        third = await collector.snapshot()
+        fourth = await collector.snapshot()  # "fast" is still being collected again
+        waited = loop.time() - started
+        await asyncio.sleep(0.15)
+        fifth = await collector.snapshot()
+        collector.stop()
+        return first, second, third, fourth, fifth, waited, metrics.calls
+
+    first, second, third, fourth, fifth, waited, calls = asyncio.run(run())
+    assert first == second == third == fourth == {"fast": 1, "slow": 1}
+    assert waited < 0.05
+    assert fifth == {"fast": 2, "slow": 1}
+    assert calls == {"fast": 2, "slow": 1}  # One collection at a time
+
+
+def test_refresh_collects_again_after_a_running_collection():
+    async def run():
+        metrics = Metrics(0.05)
+        collector = StatusCollector({"status": (metrics.collector("status"), 60)})
+        await collector.snapshot()
+        collector.refresh("status")
+        collector.refresh("status")  # Already running: once more after it
+        await asyncio.sleep(0.15)
+        refreshed = await collector.snapshot()
+        collector.stop()
+        return refreshed, metrics.calls
+
+    refreshed, calls = asyncio.run(run())
+    assert refreshed == {"status": 3}
+    assert calls == {"status": 3}
@@ -0,0 +1,39 @@
+from cabot_dashboard_client import StatusReporter
+
+STATUS = {"cabot_system_status": "inactive", "cabot_disk_usage": "42%", "cabot_wifi_status": ""}
+
+
+def test_first_report_is_complete():
+    reporter = StatusReporter()
+    assert reporter.report(STATUS) == {**STATUS, "status_seq": 1, "base_seq": 0}
+
+
+def test_acknowledged_report_is_the_base_of_the_next_ones():
+    reporter = StatusReporter()
+    reporter.report(STATUS)
+    reporter.acknowledged(1)
+    assert reporter.report(STATUS) == {"status_seq": 2, "base_seq": 1}
+    changed = {**STATUS, "cabot_system_status": "active"}
+    assert reporter.report(changed) == {"cabot_system_status": "active", "status_seq": 3, "base_seq": 1}
+    reporter.acknowledged(3)
+    assert reporter.report(changed) == {"status_seq": 4, "base_seq": 3}
+
+
+def test_missing_or_zero_acknowledgement_asks_for_complete_report():
+    reporter = StatusReporter()
+    reporter.report(STATUS)
+    reporter.acknowledged(1)
+    reporter.report(STATUS)
+    reporter.acknowledged(0)
+    assert reporter.report(STATUS) == {**STATUS, "status_seq": 3, "base_seq": 0}
+    reporter.acknowledged(None)
+    assert reporter.report(STATUS)["base_seq"] == 0
+
+
+def test_acknowledgement_of_forgotten_report_asks_for_complete_report():
+    reporter = StatusReporter()
+    for _ in range(StatusReporter.MAX_PENDING + 1):
+        reporter.report(STATUS)
+    reporter.acknowledged(1)
+    assert reporter.report(STATUS)["base_seq"] == 0
+
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import random
+
+import pytest
+
+from cabot_dashboard_client import OUTPUT_BATCH_BYTES, OUTPUT_LINE_BYTES, CommandTimeout, OutputBatcher, SystemCommand
+
+
+def sleeping(marker: str) -> int:
+    """Processes running `sleep <marker>`"""
+    count = 0
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                count += f.read().split(b"\0")[:2] == [b"sleep", marker.encode()]
+        except OSError:
+            pass
+    return count
+
+
+@pytest.fixture
+def remote_exec(tmp_path, monkeypatch):
+    """remote-exec.sh whose get-env prints one line"""
+    script = tmp_path / "remote-exec.sh"
+    script.write_text('#!/bin/sh\ncase "$1" in\n    get-env) echo CABOT_NAME=test;;\nesac\n')
+    script.chmod(0o755)
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def hanging_update(tmp_path, monkeypatch):
+    """remote-exec.sh whose software_update starts a child and hangs, like ssh to a powered-off host"""
+    marker = str(random.randint(100000, 999999))
+    script = tmp_path / "remote-exec.sh"
+    script.write_text(f'#!/bin/sh\ncase "$1" in\n    software_update) sleep {marker} & echo pulling; sleep {marker};;\nesac\n')
+    script.chmod(0o755)
+    monkeypatch.chdir(tmp_path)
+    yield marker
+    os.system(f"pkill -f 'sleep {marker}' 2>/dev/null")
+
+
+async def wait_gone(marker: str) -> int:
+    for _ in range(50):
+        if not sleeping(marker):
+            return 0
+        await asyncio.sleep(0.02)
+    return sleeping(marker)
+
+
+def test_command_output(remote_exec):
+    lines = []
+    result = asyncio.run(SystemCommand("test").execute(["get-env"], on_output=lambda stream, line: lines.append((stream, line))))
+    assert result == (True, "CABOT_NAME=test")
+    assert lines == [("stdout", "CABOT_NAME=test")]
+
+
+def test_read_lines_splits_progress_and_cuts_long_lines():
+    async def run():
+        stream = asyncio.StreamReader()
+        stream.feed_data(b"pulling 10%\rpulling 50%\r")
+        stream.feed_data(b"pulling 100%\n\n" + b"x" * (OUTPUT_LINE_BYTES + 10))
+        stream.feed_data(b"\nlast")
+        stream.feed_eof()
+        lines = []
+        output = await SystemCommand._read_lines(stream, "stderr", lambda name, text: lines.append((name, text)))
+        return output, lines
+
+    output, lines = asyncio.run(run())
+    assert output.startswith(b"pulling 10%\rpulling 50%\r") and output.endswith(b"\nlast")
+    assert lines == [("stderr", "pulling 10%"), ("stderr", "pulling 50%"), ("stderr", "pulling 100%"),
+                     ("stderr", "x" * OUTPUT_LINE_BYTES), ("stderr", "last")]
+
+
+def test_output_batcher_sends_on_interval_size_and_close():
+    async def run():
+        sent = []
+
+        async def send(status):
+            sent.append(status["output"])
+
+        batcher = OutputBatcher(send, 0.2)
+        batcher.add("stdout", "one")
+        batcher.add("stderr", "two")
+        await asyncio.sleep(0.3)
+        by_interval = len(sent)
+        batcher.add("stdout", "x" * OUTPUT_BATCH_BYTES)
+        await asyncio.sleep(0.05)
+        by_size = len(sent)
+        batcher.add("stdout", "last")
+        await batcher.close()
+        return sent, by_interval, by_size
+
+    sent, by_interval, by_size = asyncio.run(run())
+    assert (by_interval, by_size) == (1, 2)
+    assert sent == [[["stdout", "one"], ["stderr", "two"]], [["stdout", "x" * OUTPUT_BATCH_BYTES]], [["stdout", "last"]]]
+
+
+def test_timeout_kills_the_process_group(hanging_update):
+    async def run():
+        command = SystemCommand("test", timeouts={"software_update": 0.5})
+        with pytest.raises(CommandTimeout):
+            await command.execute(["software_update"])
+        return await wait_gone(hanging_update)
+
+    left = asyncio.run(run())
+    assert left == 0
+
+
+def test_cancel_kills_the_process_group(hanging_update):
+    async def run():
+        task = asyncio.ensure_future(SystemCommand("test").execute(["software_update"], on_output=lambda stream, line: None))
+        await asyncio.sleep(0.3)
+        assert sleeping(hanging_update) == 2
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await wait_gone(hanging_update)
+
+    left = asyncio.run(run())
+    assert left == 0
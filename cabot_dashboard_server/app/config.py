@@ -45,9 +45,22 @@ class Settings(BaseSettings):
     session_secret_key: str = os.getenv("CABOT_DASHBOARD_SESSION_SECRET", "your-secret-key-here")
     use_secure_cookies: bool = os.getenv("CABOT_DASHBOARD_USE_SECURE_COOKIES", "true").lower() == "true"
     max_robots: int = int(os.getenv("CABOT_DASHBOARD_MAX_ROBOTS", 5))
-    max_messages: int = 100
+    max_messages: int = int(os.getenv("CABOT_DASHBOARD_MAX_MESSAGES", 100))
     polling_timeout: float = float(os.getenv("CABOT_DASHBOARD_POLL_TIMEOUT", 240))
     disconnect_detectioin_second: float = float(os.getenv("CABOT_DASHBOARD_DISCONNECT_DETECTION_SECOND", 10 * 60))
+    presence_timeout: float = float(os.getenv("CABOT_DASHBOARD_PRESENCE_TIMEOUT", 60))
+    broadcast_window_ms: float = float(os.getenv("CABOT_DASHBOARD_BROADCAST_WINDOW_MS", 200))
+    ws_send_timeout: float = float(os.getenv("CABOT_DASHBOARD_WS_SEND_TIMEOUT", 5))
+    ws_queue_size: int = int(os.getenv("CABOT_DASHBOARD_WS_QUEUE_SIZE", 16))
+    ws_collapsible_types: str = os.getenv("CABOT_DASHBOARD_WS_COLLAPSIBLE_TYPES", "robot_patch")
+    command_preemption: bool = os.getenv("CABOT_DASHBOARD_COMMAND_PREEMPTION", "true").lower() == "true"
+    command_ttl: float = float(os.getenv("CABOT_DASHBOARD_COMMAND_TTL", 0))
+    command_queue_depth: int = int(os.getenv("CABOT_DASHBOARD_COMMAND_QUEUE_DEPTH", 100))
+    command_output_max_bytes: int = int(os.getenv("CABOT_DASHBOARD_COMMAND_OUTPUT_MAX_BYTES", 64 * 1024))
+    state_backend: str = os.getenv("CABOT_DASHBOARD_STATE_BACKEND", "memory")
+    state_db: str = os.getenv("CABOT_DASHBOARD_STATE_DB", "")
+    state_flush_ms: float = float(os.getenv("CABOT_DASHBOARD_STATE_FLUSH_MS", 1000))
+    state_history_limit: int = int(os.getenv("CABOT_DASHBOARD_STATE_HISTORY_LIMIT", 10000))
     debug_mode: bool = os.getenv("CABOT_DASHBOARD_DEBUG_MODE", "false").lower() == "true"
     allowed_cabot_id_list: set = extract_cabot_ids('CABOT_DASHBOARD_ALLOWED_CABOT_IDS')
     cabot_name_map: dict = get_cabot_name_map('CABOT_DASHBOARD_ALLOWED_CABOT_IDS')
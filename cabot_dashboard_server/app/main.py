@@ -7,6 +7,8 @@ from app.routers import client, dashboard, auth
 from app.config import settings
 from app.utils.logger import logger
 from app.services.robot_state import RobotStateManager
+from app.services.persistence import StatePersistence
+from app.services.backend import backend as state_backend
 from fastapi.middleware.cors import CORSMiddleware
 from app.auth import microsoft
 from starlette.middleware.sessions import SessionMiddleware
@@ -65,6 +67,7 @@ app.include_router(
     client.router,
     dependencies=[Depends(get_robot_state_manager)]
 )
+app.include_router(client.websocket_router)
 app.include_router(dashboard.router)
 
 @app.get("/health")
@@ -77,10 +80,18 @@ async def startup_event():
     logger.info(f"Environment: API_KEY={'*' * len(settings.api_key)}")
     logger.info(f"Max robots: {settings.max_robots}")
     logger.info("Microsoft authentication enabled")
+    logger.info(f"State backend: {type(state_backend).__name__}")
+    await state_backend.start()
+    if settings.state_db:
+        robot_state_manager.restore(
+            StatePersistence(settings.state_db, settings.state_flush_ms / 1000, settings.state_history_limit)
+        )
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down CaBot Dashboard server")
+    await robot_state_manager.close()
+    await state_backend.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, Request
+from fastapi import APIRouter, Depends, HTTPException, Response, Request, WebSocket, WebSocketDisconnect
 from app.dependencies import get_api_key, get_robot_state_manager, get_command_queue_manager
 from app.services.robot_state import RobotStateManager
-from app.services.command_queue import CommandQueueManager
-from typing import Dict
+from app.services.command_queue import CommandQueueFull, CommandQueueManager
+from app.services.backend import backend as state_backend
 from app.utils.logger import logger
-from typing import Optional
+from app.config import settings
 import asyncio
 import json
 
@@ -14,7 +14,13 @@ router = APIRouter(
     dependencies=[Depends(get_api_key)]
 )
 
-reconnected_clients = {}
+# FastAPI 0.68 does not apply a router prefix to WebSocket routes, so the robot channel gets its own router
+websocket_router = APIRouter(tags=["client"])
+
+# Robots that (re)connected and must be asked for their env; kept in the state backend so every worker sees it
+RECONNECTED = "reconnected_clients"
+# Poll response header acknowledging the robot's status_seq (see RobotStateManager.report_status)
+STATUS_SEQ_HEADER = "X-Status-Seq"
 
 @router.post("/connect/{client_id}")
 async def connect(
@@ -30,7 +36,8 @@ async def connect(
         
         await command_queue_manager.initialize_client(client_id)
         logger.info(f"Client {client_id} connected")
-        reconnected_clients[client_id] = True
+        # Ask for the env on the first poll, unless it was restored from the state database
+        await state_backend.set_flag(RECONNECTED, client_id, not robot_manager.has_restored_env(client_id))
         return {"status": "Connected"}
     except Exception as e:
         logger.error(f"Error connecting client {client_id}: {e}")
@@ -50,6 +57,8 @@ async def send_command(
         await command_queue_manager.add_command(cabot_id, command)
         logger.info(f"Command queued for cabot {cabot_id}: {command}")
         return {"status": "success", "message": f"Command queued for cabot {cabot_id}"}
+    except CommandQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except ValueError as e:
         logger.error(f"Invalid command format for cabot {cabot_id}: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -60,6 +69,7 @@ async def send_command(
 @router.get("/poll/{client_id}")
 async def poll(
     request: Request,
+    response: Response,
     client_id: str,
     robot_manager: RobotStateManager = Depends(get_robot_state_manager),
     command_queue_manager: CommandQueueManager = Depends(get_command_queue_manager)
@@ -67,96 +77,180 @@ async def poll(
     if client_id not in robot_manager.connected_cabots:
         logger.warning(f"Poll attempted for disconnected client {client_id}")
         raise HTTPException(status_code=404, detail="Robot not connected")
-    skip_update_state = False
+    ack_headers = {}
     try:
         body = await request.json()
-        system_status = body.get("cabot_system_status", "unknown")
-        wifi_status = body.get("cabot_wifi_status", "unknown")
-        disk_usage = body.get("cabot_disk_usage", "unknown")
-        logger.debug(f"Received poll request from {client_id} with system_status: {system_status}")
-
-        state = {
-            "status": "connected",
-            "system_status": system_status,
-            "wifi_status": wifi_status,
-            "disk_usage": disk_usage
-        }
-        robot_manager.update_robot_state(client_id, state)
-        if reconnected_clients.get(client_id, True):
-            reconnected_clients[client_id] = False
+        logger.debug(f"Received poll request from {client_id} with status: {body}")
+        status_seq = robot_manager.report_status(client_id, body)
+        if status_seq is not None:
+            ack_headers[STATUS_SEQ_HEADER] = str(status_seq)
+            response.headers.update(ack_headers)
+        # Unknown after a server restart, unless the env was restored from the state database
+        reconnected = await state_backend.get_flag(RECONNECTED, client_id)
+        if reconnected if reconnected is not None else not robot_manager.has_restored_env(client_id):
+            await state_backend.set_flag(RECONNECTED, client_id, False)
             return {"command": "get-env", "commandOption": {}}
 
-        result = await command_queue_manager.wait_for_update(client_id)
-        return result
+        robot_manager.poll_started(client_id)
+        try:
+            return await command_queue_manager.wait_for_update(client_id)
+        finally:
+            # The robot stays connected unless it does not poll again (RobotStateManager.presence)
+            robot_manager.poll_finished(client_id)
     except asyncio.TimeoutError:
-        return Response(status_code=204)
+        return Response(status_code=204, headers=ack_headers)
     except ConnectionResetError:
-        skip_update_state = True
-        return Response(status_code=204)
+        return Response(status_code=204, headers=ack_headers)
     except Exception as e:
         logger.error(f"Error in poll for {client_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@websocket_router.websocket("/api/client/ws/{client_id}")
+async def robot_websocket(
+    websocket: WebSocket,
+    client_id: str,
+    robot_manager: RobotStateManager = Depends(get_robot_state_manager),
+    command_queue_manager: CommandQueueManager = Depends(get_command_queue_manager)
+):
+    """Persistent channel for a robot, an alternative to /poll
+
+    Commands are pushed as {"type": "command", "command": {...}} as soon as they are queued.
+    The robot sends {"type": "heartbeat", <same body as /poll>} periodically and
+    {"type": "send", "status": {<same body as /send>}} for command results. A numbered
+    heartbeat is answered with {"type": "status_ack", "status_seq": n}.
+    """
+    # Router dependencies do not apply to WebSocket routes
+    if websocket.headers.get("X-API-Key") != settings.api_key:
+        logger.warning(f"Invalid API key attempt on WebSocket for {client_id}")
+        await websocket.close(code=4003)
+        return
+    if client_id not in robot_manager.connected_cabots:
+        logger.warning(f"WebSocket attempted for disconnected client {client_id}")
+        await websocket.close(code=4004)
+        return
+    await websocket.accept()
+    await command_queue_manager.initialize_client(client_id)
+    logger.info(f"Client {client_id} WebSocket connected")
+    superseded = False
+
+    async def push_commands():
+        nonlocal superseded
+        while True:
+            try:
+                command = await command_queue_manager.wait_for_update(client_id)
+            except asyncio.TimeoutError:
+                continue
+            except ConnectionResetError:
+                # The robot polled or opened another channel, this one is stale
+                superseded = True
+                await websocket.close()
+                return
+            try:
+                await websocket.send_json({"type": "command", "command": command})
+            except Exception:
+                # Not delivered; keep it for the robot's next channel or poll
+                await command_queue_manager.requeue(client_id, command)
+                raise
+
+    pusher = asyncio.ensure_future(push_commands())
+    try:
+        while True:
+            receive = asyncio.ensure_future(websocket.receive_json())
+            await asyncio.wait([receive, pusher], return_when=asyncio.FIRST_COMPLETED)
+            if not receive.done():
+                receive.cancel()
+                pusher.result()
+                break
+            data = receive.result()
+            if data.get("type") == "heartbeat":
+                status_seq = robot_manager.report_status(client_id, data)
+                if status_seq is not None:
+                    await websocket.send_json({"type": "status_ack", "status_seq": status_seq})
+                reconnected = await state_backend.get_flag(RECONNECTED, client_id)
+                if reconnected if reconnected is not None else not robot_manager.has_restored_env(client_id):
+                    await state_backend.set_flag(RECONNECTED, client_id, False)
+                    await command_queue_manager.add_command(client_id, {"command": "get-env", "commandOption": {}})
+            elif data.get("type") == "send":
+                if data.get("status", {}).get("status") != "progress":
+                    logger.info(f"Received from {client_id} status: {json.dumps(data.get('status'), indent=2)}")
+                handle_status(robot_manager, command_queue_manager, client_id, data.get("status", {}))
+            else:
+                logger.warning(f"Unknown WebSocket message from {client_id}: {data}")
+    except WebSocketDisconnect:
+        logger.info(f"Client {client_id} WebSocket disconnected")
+    except Exception as e:
+        logger.error(f"Error in WebSocket for {client_id}: {e}")
     finally:
-        if skip_update_state:
-            return
-        state = {
-            "status": "disconnected",
-            "system_status": "unknown"
-        }
-        robot_manager.update_robot_state(client_id, state)
+        pusher.cancel()
+        if not superseded:
+            # Same as a robot that stopped polling: the last reported system status is kept
+            robot_manager.presence_expired_handler([client_id])
 
 @router.post("/send/{client_id}")
 async def send_status(
     client_id: str,
     status: dict,
-    robot_manager: RobotStateManager = Depends(get_robot_state_manager)
+    robot_manager: RobotStateManager = Depends(get_robot_state_manager),
+    command_queue_manager: CommandQueueManager = Depends(get_command_queue_manager)
 ):
     if client_id not in robot_manager.connected_cabots:
         logger.warning(f"Send status attempted for disconnected client {client_id}")
         raise HTTPException(status_code=404, detail="Specified cabot is not connected")
     
     try:
-        logger.info(f"Received from {client_id} status: {json.dumps(status, indent=2)}")
-        
-        # Get message type and status directly from the status object
-        msg_type = status.get("type", "plain")
-        msg_status = status.get("status", "info")
-        msg_content = status.get("message", "")
+        if status.get("status") != "progress":
+            logger.info(f"Received from {client_id} status: {json.dumps(status, indent=2)}")
+        handle_status(robot_manager, command_queue_manager, client_id, status)
+        return {"status": "success"}
+    except Exception as e:
+        logger.error(f"Error updating status for {client_id}: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
 
-        # Handle different message types
-        if msg_type == "image_tags":
-            if msg_status == "success":
-                # Update robot images with the tags data
-                tags = status.get("tags", {})
-                logger.info(f"Updating image tags for {client_id}: {json.dumps(tags, indent=2)}")
-                robot_manager.update_robot_images(client_id, tags)
-                robot_manager.update_robot_message(client_id, "Image tags updated successfully", "success")
-            elif msg_status == "error":
-                robot_manager.update_robot_message(client_id, msg_content, "error")
-            else:
-                robot_manager.update_robot_message(client_id, msg_content, msg_status)
-        if msg_type == "env":
-            if msg_status == "success":
-                env = status.get("env", {})
-                logger.info(f"Updating environment variables for {client_id}: {json.dumps(env, indent=2)}")
-                robot_manager.update_robot_env(client_id, env)
-                robot_manager.update_robot_message(client_id, "Environment variables updated successfully", "success")
-            elif msg_status == "error":
-                robot_manager.update_robot_message(client_id, msg_content, "error")
-            else:
-                robot_manager.update_robot_message(client_id, msg_content, msg_status)
-        elif msg_type == "software_update":
+def handle_status(robot_manager: RobotStateManager, command_queue_manager: CommandQueueManager, client_id: str, status: dict):
+    """Apply a status report sent by a robot, over HTTP or its WebSocket"""
+    # Get message type and status directly from the status object
+    msg_type = status.get("type", "plain")
+    msg_status = status.get("status", "info")
+    msg_content = status.get("message", "")
+    if msg_status == "progress":
+        # Output of a running command, kept with the command instead of the robot's messages
+        if status.get("commandId"):
+            command_queue_manager.tracker.output(client_id, status["commandId"], status.get("command"), status.get("output", []))
+        return
+    if status.get("commandId"):
+        command_queue_manager.tracker.reported(client_id, status["commandId"], msg_status)
+    # Timed-out and cancelled are outcomes of their own, robot messages only have the usual levels
+    msg_status = {"timeout": "error", "cancelled": "info"}.get(msg_status, msg_status)
+
+    # Handle different message types
+    if msg_type == "image_tags":
+        if msg_status == "success":
+            # Update robot images with the tags data
+            tags = status.get("tags", {})
+            logger.info(f"Updating image tags for {client_id}: {json.dumps(tags, indent=2)}")
+            robot_manager.update_robot_images(client_id, tags)
+            robot_manager.update_robot_message(client_id, "Image tags updated successfully", "success")
+        elif msg_status == "error":
+            robot_manager.update_robot_message(client_id, msg_content, "error")
+        else:
+            robot_manager.update_robot_message(client_id, msg_content, msg_status)
+    elif msg_type == "env":
+        if msg_status == "success":
+            env = status.get("env", {})
+            logger.info(f"Updating environment variables for {client_id}: {json.dumps(env, indent=2)}")
+            robot_manager.update_robot_env(client_id, env)
+            robot_manager.update_robot_message(client_id, "Environment variables updated successfully", "success")
+        elif msg_status == "error":
+            robot_manager.update_robot_message(client_id, msg_content, "error")
+        else:
             robot_manager.update_robot_message(client_id, msg_content, msg_status)
-        elif msg_type == "command":
+    elif msg_type == "software_update":
+        robot_manager.update_robot_message(client_id, msg_content, msg_status)
+    elif msg_type == "command":
+        robot_manager.update_robot_message(client_id, msg_content, msg_status)
+    else:
+        # If no type is specified, treat the entire message as a plain text message
+        if "message" in status:
             robot_manager.update_robot_message(client_id, msg_content, msg_status)
         else:
-            # If no type is specified, treat the entire message as a plain text message
-            if "message" in status:
-                robot_manager.update_robot_message(client_id, msg_content, msg_status)
-            else:
-                robot_manager.update_robot_message(client_id, str(status), "info")
-
-        return {"status": "success"}
-    except Exception as e:
-        logger.error(f"Error updating status for {client_id}: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+            robot_manager.update_robot_message(client_id, str(status), "info")
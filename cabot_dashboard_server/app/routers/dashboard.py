@@ -1,17 +1,17 @@
 import asyncio
-from fastapi import APIRouter, Depends, Request, Cookie, HTTPException, WebSocket, WebSocketDisconnect, Body
+from fastapi import APIRouter, Depends, Request, Cookie, HTTPException, WebSocket, WebSocketDisconnect, Body, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from app.services.auth import AuthService
 from app.services.robot_state import RobotStateManager
-from app.services.command_queue import CommandQueueManager
-from app.dependencies import get_auth_service, get_api_key, get_command_queue_manager, get_robot_state_manager
+from app.services.command_queue import CommandQueueFull, CommandQueueManager, command_allowed, format_command
+from app.dependencies import get_auth_service, get_command_queue_manager, get_robot_state_manager
 from app.utils.logger import logger
 from app.config import settings
-from typing import Dict, List
+from typing import Dict, List, Optional
 from app.services.websocket import manager as websocket_manager
 from app.services.docker_hub import DockerHubService
-import json
+from app.services.backend import backend as state_backend
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
@@ -74,7 +74,7 @@ async def receive_updates(
     try:
         connected_cabot_list = robot_manager.get_connected_cabots_list()
         return {
-            "messages": robot_manager.messages,
+            "messages": robot_manager.get_messages(limit=robot_manager.MAX_MESSAGES),
             "events": [],
             "cabots": connected_cabot_list
         }
@@ -82,6 +82,107 @@ async def receive_updates(
         logger.error(f"Unexpected error in dashboard_page: {str(e)}")
         return RedirectResponse(url="/login")
 
+@router.get("/stats")
+async def get_stats(
+    session_token: str = Cookie(None),
+    auth_service: AuthService = Depends(get_auth_service),
+    robot_manager: RobotStateManager = Depends(get_robot_state_manager),
+    command_queue_manager: CommandQueueManager = Depends(get_command_queue_manager)
+):
+    if not session_token or not await auth_service.validate_token(session_token):
+        raise HTTPException(status_code=401, detail="Invalid session")
+
+    return {
+        "broadcast": robot_manager.notifier.stats(),
+        "connections": websocket_manager.stats(),
+        "backend": state_backend.stats(),
+        "command_lanes": command_queue_manager.stats(),
+        "persistence": robot_manager.persistence.stats() if robot_manager.persistence is not None else None
+    }
+
+@router.get("/api/robots/{robot_id}/messages")
+async def get_robot_messages(
+    robot_id: str,
+    before: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    level: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    session_token: str = Cookie(None),
+    auth_service: AuthService = Depends(get_auth_service),
+    robot_manager: RobotStateManager = Depends(get_robot_state_manager)
+):
+    """Page through a robot's message history, newest first
+
+    Pass the returned "next" as `before` to get the following page; since and until are epoch seconds.
+    """
+    if not session_token or not await auth_service.validate_token(session_token):
+        raise HTTPException(status_code=401, detail="Invalid session")
+
+    try:
+        return await robot_manager.get_robot_messages(robot_id, limit, before, level, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/api/commands/in_flight")
+async def get_in_flight_commands(
+    robot_id: Optional[str] = None,
+    session_token: str = Cookie(None),
+    auth_service: AuthService = Depends(get_auth_service),
+    command_queue_manager: CommandQueueManager = Depends(get_command_queue_manager)
+):
+    """Commands queued for or running on each robot, with their lifecycle timestamps"""
+    if not session_token or not await auth_service.validate_token(session_token):
+        raise HTTPException(status_code=401, detail="Invalid session")
+
+    return command_queue_manager.tracker.get_in_flight(robot_id)
+
+@router.get("/api/commands/output")
+async def get_command_output(
+    robot_id: Optional[str] = None,
+    session_token: str = Cookie(None),
+    auth_service: AuthService = Depends(get_auth_service),
+    command_queue_manager: CommandQueueManager = Depends(get_command_queue_manager)
+):
+    """Output streamed by each robot for its recent commands, newest lines last"""
+    if not session_token or not await auth_service.validate_token(session_token):
+        raise HTTPException(status_code=401, detail="Invalid session")
+
+    return command_queue_manager.tracker.get_output(robot_id)
+
+@router.post("/api/robots/{robot_id}/commands/{command_id}/cancel")
+async def cancel_command(
+    robot_id: str,
+    command_id: str,
+    session_token: str = Cookie(None),
+    auth_service: AuthService = Depends(get_auth_service),
+    command_queue_manager: CommandQueueManager = Depends(get_command_queue_manager)
+):
+    """Cancel a queued or running command; a running one is killed on the robot with its process group"""
+    if not session_token or not await auth_service.validate_token(session_token):
+        raise HTTPException(status_code=403, detail="Invalid session")
+
+    try:
+        result = await command_queue_manager.cancel_command(robot_id, command_id)
+    except CommandQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    if result == "unknown":
+        raise HTTPException(status_code=404, detail=f"Command {command_id} is not queued or running on {robot_id}")
+    logger.info(f"Cancel of {command_id} on {robot_id}: {result}")
+    return {"status": result}
+
+@router.get("/api/commands/latency")
+async def get_command_latency(
+    session_token: str = Cookie(None),
+    auth_service: AuthService = Depends(get_auth_service),
+    command_queue_manager: CommandQueueManager = Depends(get_command_queue_manager)
+):
+    """Per command type latency histograms (queue, start, run, total) and outcome counts"""
+    if not session_token or not await auth_service.validate_token(session_token):
+        raise HTTPException(status_code=401, detail="Invalid session")
+
+    return command_queue_manager.tracker.get_latency()
+
 @router.post("/send_command/{robot_id}")
 async def send_command(
     robot_id: str,
@@ -101,10 +202,102 @@ async def send_command(
         )
 
     await command_queue_manager.initialize_client(robot_id)
-    await command_queue_manager.add_command(robot_id, command)
+    try:
+        await command_queue_manager.add_command(robot_id, command)
+    except CommandQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
     logger.info(f"Command sent to {robot_id}: {command}")
     return {"status": "success"}
 
+def select_robots(robot_manager: RobotStateManager, selector: Dict) -> List[str]:
+    """IDs of the known robots matching every field of the selector
+
+    Fields: "status" and "system_status" (a value or a list of values) and "prefix" for the robot ID.
+    """
+    def matches(value, expected):
+        return expected is None or (value in expected if isinstance(expected, list) else value == expected)
+
+    return [
+        robot_id for robot_id, robot in robot_manager.connected_cabots.items()
+        if matches(robot.status, selector.get("status"))
+        and matches(robot.system_status, selector.get("system_status"))
+        and robot_id.startswith(selector.get("prefix", ""))
+    ]
+
+async def queue_fleet_command(
+    robot_manager: RobotStateManager,
+    command_queue_manager: CommandQueueManager,
+    command: str,
+    command_option: Optional[Dict],
+    robot_ids: List[str],
+    ttl: Optional[float] = None
+) -> Dict:
+    """Queue one dashboard action for several robots at once
+
+    Returns the formatted command with the robots it was queued for ("accepted",
+    including the ones that already had it queued), the ones that refused it
+    ("rejected", with their system status or "queue full") and the unknown ones
+    ("not_connected").
+    """
+    formatted_command = format_command(command, command_option)
+    accepted, rejected, not_connected = [], {}, []
+    for robot_id in dict.fromkeys(robot_ids):
+        robot = robot_manager.connected_cabots.get(robot_id)
+        if robot is None:
+            not_connected.append(robot_id)
+        elif not command_allowed(command, robot.system_status):
+            rejected[robot_id] = robot.system_status
+        else:
+            accepted.append(robot_id)
+    if not_connected:
+        logger.error(f"Robots {not_connected} are not connected")
+    if rejected:
+        logger.info(f"Command {command} not allowed in status {rejected}")
+    if accepted:
+        results = await command_queue_manager.add_commands(accepted, formatted_command, ttl)
+        for robot_id, result in results.items():
+            if result == "full":
+                accepted.remove(robot_id)
+                rejected[robot_id] = "queue full"
+        logger.info(f"Command added to queue for {accepted}: {formatted_command}")
+    return {
+        "command": formatted_command,
+        "accepted": accepted,
+        "rejected": rejected,
+        "not_connected": not_connected
+    }
+
+@router.post("/api/commands/batch")
+async def send_batch_command(
+    request: Dict = Body(...),
+    session_token: str = Cookie(None),
+    auth_service: AuthService = Depends(get_auth_service),
+    robot_manager: RobotStateManager = Depends(get_robot_state_manager),
+    command_queue_manager: CommandQueueManager = Depends(get_command_queue_manager)
+):
+    """Send one action to many robots
+
+    Body: {"command": ..., "commandOption": {...}, "robot_ids": [...]} or with
+    "selector": {...} (see select_robots) instead of robot_ids, and optionally
+    "ttl": seconds after which the command is dropped if the robot has not taken it.
+    """
+    if not session_token or not await auth_service.validate_token(session_token):
+        raise HTTPException(status_code=403, detail="Invalid session")
+
+    command = request.get("command")
+    if not command:
+        raise HTTPException(status_code=400, detail="command is required")
+    if "robot_ids" in request:
+        robot_ids = request["robot_ids"]
+        if not isinstance(robot_ids, list) or not robot_ids or not all(isinstance(robot_id, str) for robot_id in robot_ids):
+            raise HTTPException(status_code=400, detail="robot_ids must be a non-empty list of robot IDs")
+    elif "selector" in request:
+        robot_ids = select_robots(robot_manager, request["selector"])
+    else:
+        raise HTTPException(status_code=400, detail="robot_ids or selector is required")
+    return await queue_fleet_command(
+        robot_manager, command_queue_manager, command, request.get("commandOption"), robot_ids, request.get("ttl"))
+
 @router.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
@@ -121,66 +314,52 @@ async def websocket_endpoint(
 
         await websocket_manager.connect(websocket)
         
-        # Send initial robot state
-        cabot_list = robot_manager.get_connected_cabots_list()
-        await websocket_manager.broadcast({
-            "type": "robot_state",
-            "cabots": cabot_list,
-            "messages": robot_manager.get_messages(limit=100)
-        })
+        # Send initial robot state to the new connection only; later changes arrive as robot_patch
+        await websocket_manager.send_personal(websocket, robot_manager.get_snapshot())
 
         async def handle_requests(data):
             if data.get("type") == "refresh":
-                # Send updated robot state
-                await websocket_manager.broadcast({
-                    "type": "robot_state",
-                    "cabots": robot_manager.get_connected_cabots_list(),
-                    "messages": robot_manager.get_messages(limit=100)
-                })
+                # Client detected a version gap (or just connected), resend the full state
+                await websocket_manager.send_personal(websocket, robot_manager.get_snapshot())
             elif data.get("type") == "command":
                 cabot_id = data.get("cabotId")
                 command_data = data.get("command")
-                command_option = data.get("commandOption", {})
                 if cabot_id and command_data:
-                    if cabot_id not in robot_manager.connected_cabots:
-                        logger.error(f"Robot {cabot_id} is not connected")
-                        return
-                    system_status = robot_manager.connected_cabots[cabot_id].get("system_status", "unknown")
-                    if command_data not in ["get-image-tags", "get-env", "ros_stop"] and system_status not in ["inactive", "failed", "unknown"]:
-                        logger.info(f"Command {command_data} not allowed in status {system_status}")
-                        return
                     try:
-                        await command_queue_manager.initialize_client(cabot_id)
-                        command_mapping = {
-                            'ros_start': 'ros-start',
-                            'ros_stop': 'ros-stop',
-                            'power_off': 'system-poweroff',
-                            'reboot': 'system-reboot',
-                            'software_update': 'software_update'
-                        }
-                        formatted_command = {
-                            'command': command_mapping.get(command_data, command_data),
-                            'commandOption': command_option
-                        }
-                        logger.info(f"Command added to queue for {cabot_id}: {formatted_command}")
-                        await command_queue_manager.add_command(cabot_id, formatted_command)
-                        await websocket.send_json({
-                            "type": "add_command_response",
-                            "status": "success",
-                            "cabotId": cabot_id,
-                            "command": formatted_command,
-                        })
+                        result = await queue_fleet_command(
+                            robot_manager, command_queue_manager, command_data, data.get("commandOption", {}), [cabot_id])
+                        if result["accepted"]:
+                            await websocket_manager.send_personal(websocket, {
+                                "type": "add_command_response",
+                                "status": "success",
+                                "cabotId": cabot_id,
+                                "command": result["command"],
+                            })
                     except Exception as e:
                         logger.error(f"Error adding command to queue for {cabot_id}: {e}")
+            elif data.get("type") == "batch_command":
+                command_data = data.get("command")
+                if command_data:
+                    robot_ids = data["cabotIds"] if "cabotIds" in data else select_robots(robot_manager, data.get("selector", {}))
+                    try:
+                        result = await queue_fleet_command(
+                            robot_manager, command_queue_manager, command_data, data.get("commandOption", {}), robot_ids, data.get("ttl"))
+                        await websocket_manager.send_personal(websocket, {
+                            "type": "batch_command_response",
+                            "requestId": data.get("requestId"),
+                            **result
+                        })
+                    except Exception as e:
+                        logger.error(f"Error adding batch command {command_data} to queue: {e}")
             elif data.get("type") == "refresh_tags":
                 response = await websocket_manager.handle_refresh_tags(data)
-                await websocket.send_json(response)
+                await websocket_manager.send_personal(websocket, response)
             elif data.get("type") == "update_image_name":
                 response = await websocket_manager.handle_update_image_name(data)
-                await websocket.send_json(response)
+                await websocket_manager.send_personal(websocket, response)
             elif data.get("type") == "refresh_site":
                 response = await websocket_manager.handle_refresh_site(data)
-                await websocket.send_json(response)
+                await websocket_manager.send_personal(websocket, response)
 
         while True:
             asyncio.create_task(handle_requests(await websocket.receive_json()))
@@ -190,7 +369,6 @@ async def websocket_endpoint(
         logger.error(f"WebSocket error: {str(e)}")
     finally:
         try:
-            if websocket in websocket_manager.active_connections:
-                websocket_manager.disconnect(websocket)
+            websocket_manager.disconnect(websocket)
         except Exception as e:
             logger.error(f"Error during websocket cleanup: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,324 @@
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlparse
+from app.config import settings
+from app.services.resp import RespConnection, read_value
+from app.utils.logger import logger
+import asyncio
+import json
+import uuid
+
+KEY_PREFIX = "cabot_dashboard:"
+MAX_OUTBOX = 10000  # Messages kept for publishing while the server is unreachable
+
+
+class StateBackend:
+    """State and pub/sub shared by every server worker
+
+    Holds what must be seen by all workers (command queues and per-robot flags) and
+    relays change notifications between them. A worker applies its own changes
+    directly, so subscribers only receive messages published by other workers.
+    Subscribe before start().
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Callable[[dict], None]]] = {}
+
+    def subscribe(self, channel: str, callback: Callable[[dict], None]) -> None:
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def _dispatch(self, channel: str, message: dict) -> None:
+        for callback in self._subscribers.get(channel, ()):
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"Error handling {channel} message {message}: {e}")
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def publish(self, channel: str, message: dict) -> None:
+        """Send a message to the other workers without waiting"""
+        raise NotImplementedError
+
+    async def push_command(self, robot_id: str, entry: dict, lane: str) -> None:
+        raise NotImplementedError
+
+    async def push_commands(self, entries: Dict[str, dict], lane: str) -> None:
+        """Queue an entry for each robot (robot ID -> entry)"""
+        for robot_id, entry in entries.items():
+            await self.push_command(robot_id, entry, lane)
+
+    async def pop_command(self, robot_id: str, lanes: Sequence[str]) -> Optional[dict]:
+        """Take the oldest entry of the first non-empty lane, None if all are empty"""
+        raise NotImplementedError
+
+    async def list_commands(self, robot_ids: List[str], lanes: Sequence[str]) -> Dict[str, List[dict]]:
+        """Queued entries of each robot, lane by lane in dispatch order"""
+        raise NotImplementedError
+
+    async def remove_commands(self, robot_id: str, lanes: Sequence[str], entry_ids: Set[str]) -> List[dict]:
+        """Drop the queued entries with the given IDs, returning the ones that were still queued"""
+        raise NotImplementedError
+
+    async def clear_commands(self, robot_id: str, lanes: Sequence[str]) -> None:
+        raise NotImplementedError
+
+    async def get_flag(self, name: str, key: str) -> Optional[bool]:
+        """Value of a named per-robot flag, None if it was never set"""
+        raise NotImplementedError
+
+    async def set_flag(self, name: str, key: str, value: bool) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"type": type(self).__name__}
+
+
+class InMemoryBackend(StateBackend):
+    """Process-local backend for a single worker (the default)"""
+
+    def __init__(self):
+        super().__init__()
+        self.command_queues: Dict[str, Dict[str, Deque[dict]]] = {}
+        self.flags: Dict[str, Dict[str, bool]] = {}
+
+    def publish(self, channel: str, message: dict) -> None:
+        # There is no other worker
+        pass
+
+    async def push_command(self, robot_id: str, entry: dict, lane: str) -> None:
+        self.command_queues.setdefault(robot_id, {}).setdefault(lane, deque()).append(entry)
+
+    async def pop_command(self, robot_id: str, lanes: Sequence[str]) -> Optional[dict]:
+        queues = self.command_queues.get(robot_id, {})
+        for lane in lanes:
+            queue = queues.get(lane)
+            if queue:
+                return queue.popleft()
+        return None
+
+    async def list_commands(self, robot_ids: List[str], lanes: Sequence[str]) -> Dict[str, List[dict]]:
+        result = {}
+        for robot_id in robot_ids:
+            queues = self.command_queues.get(robot_id, {})
+            result[robot_id] = [entry for lane in lanes for entry in queues.get(lane, ())]
+        return result
+
+    async def remove_commands(self, robot_id: str, lanes: Sequence[str], entry_ids: Set[str]) -> List[dict]:
+        removed = []
+        for lane, queue in self.command_queues.get(robot_id, {}).items():
+            if lane in lanes and any(entry["id"] in entry_ids for entry in queue):
+                kept = deque()
+                for entry in queue:
+                    (removed if entry["id"] in entry_ids else kept).append(entry)
+                self.command_queues[robot_id][lane] = kept
+        return removed
+
+    async def clear_commands(self, robot_id: str, lanes: Sequence[str]) -> None:
+        self.command_queues.pop(robot_id, None)
+
+    async def get_flag(self, name: str, key: str) -> Optional[bool]:
+        return self.flags.get(name, {}).get(key)
+
+    async def set_flag(self, name: str, key: str, value: bool) -> None:
+        self.flags.setdefault(name, {})[key] = value
+
+
+class RedisBackend(StateBackend):
+    """Backend on a Redis-protocol server, for running several uvicorn workers
+
+    Command queues are lists, flags are hashes and messages go through PUBLISH /
+    SUBSCRIBE on a second connection. Everything is prefixed with "cabot_dashboard:".
+    """
+
+    def __init__(self, url: str):
+        super().__init__()
+        parsed = urlparse(url)
+        self.url = url
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.origin = uuid.uuid4().hex  # Identifies this worker's own messages
+        self._connection: Optional[RespConnection] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._outbox: Deque[Tuple[str, str]] = deque()
+        self._outbox_ready: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self.published = 0
+        self.dropped = 0
+        self.received = 0
+        self.reconnects = 0
+
+    async def start(self) -> None:
+        # Created here so they belong to the server's event loop
+        self._lock = asyncio.Lock()
+        self._outbox_ready = asyncio.Event()
+        await self._command("PING")
+        self._tasks = [asyncio.ensure_future(self._publisher()), asyncio.ensure_future(self._subscriber())]
+        logger.info(f"Connected to state backend {self.host}:{self.port}/{self.db}")
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def _open(self) -> RespConnection:
+        return await RespConnection.open(self.host, self.port, self.db, self.password)
+
+    async def _command(self, *args):
+        """Run a command on the shared connection, reconnecting once if it was lost"""
+        return await self._run(lambda connection: connection.execute(*args))
+
+    async def _pipeline(self, commands: List[tuple]) -> list:
+        """Run several commands in one round-trip"""
+        return await self._run(lambda connection: connection.execute_many(commands))
+
+    async def _run(self, operation):
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._connection is None:
+                        self._connection = await self._open()
+                    return await operation(self._connection)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                    if self._connection is not None:
+                        self._connection.close()
+                        self._connection = None
+                    self.reconnects += 1
+                    if attempt:
+                        raise ConnectionError(f"State backend {self.host}:{self.port} unavailable: {e}")
+
+    def publish(self, channel: str, message: dict) -> None:
+        if self._outbox_ready is None:
+            return
+        if len(self._outbox) >= MAX_OUTBOX:
+            # The server is unreachable; the oldest changes are the first to be superseded
+            self._outbox.popleft()
+            self.dropped += 1
+        self._outbox.append((KEY_PREFIX + channel, json.dumps({"origin": self.origin, "data": message})))
+        self._outbox_ready.set()
+
+    async def _publisher(self) -> None:
+        """Send queued messages in order"""
+        while True:
+            await self._outbox_ready.wait()
+            self._outbox_ready.clear()
+            while self._outbox:
+                channel, data = self._outbox[0]
+                try:
+                    await self._command("PUBLISH", channel, data)
+                except Exception as e:
+                    logger.error(f"Error publishing to {channel}: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                self._outbox.popleft()
+                self.published += 1
+
+    async def _subscriber(self) -> None:
+        """Receive messages from the other workers, resubscribing after a connection loss"""
+        channels = [KEY_PREFIX + channel for channel in self._subscribers]
+        if not channels:
+            return
+        while True:
+            connection = None
+            try:
+                connection = await self._open()
+                connection.send("SUBSCRIBE", *channels)
+                await connection.writer.drain()
+                while True:
+                    reply = await read_value(connection.reader)
+                    if not isinstance(reply, list) or len(reply) != 3 or reply[0] != b"message":
+                        continue
+                    message = json.loads(reply[2])
+                    if message.get("origin") == self.origin:
+                        continue
+                    self.received += 1
+                    self._dispatch(reply[1].decode()[len(KEY_PREFIX):], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"State backend subscription lost: {e}")
+                self.reconnects += 1
+                await asyncio.sleep(1)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _queue_key(self, robot_id: str, lane: str) -> str:
+        return f"{KEY_PREFIX}commands:{robot_id}:{lane}"
+
+    async def push_command(self, robot_id: str, entry: dict, lane: str) -> None:
+        await self._command("RPUSH", self._queue_key(robot_id, lane), json.dumps(entry))
+
+    async def push_commands(self, entries: Dict[str, dict], lane: str) -> None:
+        await self._pipeline([("RPUSH", self._queue_key(robot_id, lane), json.dumps(entry)) for robot_id, entry in entries.items()])
+
+    async def pop_command(self, robot_id: str, lanes: Sequence[str]) -> Optional[dict]:
+        # One LPOP per lane until one returns; the top lanes are empty most of the time
+        for lane in lanes:
+            data = await self._command("LPOP", self._queue_key(robot_id, lane))
+            if data is not None:
+                return json.loads(data)
+        return None
+
+    async def list_commands(self, robot_ids: List[str], lanes: Sequence[str]) -> Dict[str, List[dict]]:
+        if not robot_ids:
+            return {}
+        replies = await self._pipeline([("LRANGE", self._queue_key(robot_id, lane), 0, -1) for robot_id in robot_ids for lane in lanes])
+        return {
+            robot_id: [json.loads(data) for reply in replies[n * len(lanes):(n + 1) * len(lanes)] for data in reply]
+            for n, robot_id in enumerate(robot_ids)
+        }
+
+    async def remove_commands(self, robot_id: str, lanes: Sequence[str], entry_ids: Set[str]) -> List[dict]:
+        removed = []
+        for lane in lanes:
+            key = self._queue_key(robot_id, lane)
+            matching = [data for data in await self._command("LRANGE", key, 0, -1) if json.loads(data)["id"] in entry_ids]
+            if matching:
+                # LREM only removes what is still queued, a worker may have popped some meanwhile
+                counts = await self._pipeline([("LREM", key, 1, data) for data in matching])
+                removed.extend(json.loads(data) for data, count in zip(matching, counts) if count)
+        return removed
+
+    async def clear_commands(self, robot_id: str, lanes: Sequence[str]) -> None:
+        await self._command("DEL", *(self._queue_key(robot_id, lane) for lane in lanes))
+
+    async def get_flag(self, name: str, key: str) -> Optional[bool]:
+        value = await self._command("HGET", f"{KEY_PREFIX}{name}", key)
+        return value == b"1" if value is not None else None
+
+    async def set_flag(self, name: str, key: str, value: bool) -> None:
+        await self._command("HSET", f"{KEY_PREFIX}{name}", key, 1 if value else 0)
+
+    def stats(self) -> dict:
+        return {
+            "type": type(self).__name__,
+            "url": f"{self.host}:{self.port}/{self.db}",
+            "published": self.published,
+            "received": self.received,
+            "pending": len(self._outbox),
+            "dropped": self.dropped,
+            "reconnects": self.reconnects
+        }
+
+
+def create_backend(url: str) -> StateBackend:
+    """"memory" (or empty) for a single worker, redis://[:password@]host[:port][/db] to share state between workers"""
+    if not url or url == "memory":
+        return InMemoryBackend()
+    if url.startswith("redis://"):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported state backend: {url}")
+
+
+backend = create_backend(settings.state_backend)
@@ -1,66 +1,325 @@
-from asyncio import Queue, Event, wait_for, TimeoutError as asyncio_TimeoutError
-from typing import Dict, Optional
-from datetime import datetime
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
 from app.utils.logger import logger
 from app.config import Settings
+from app.services.backend import StateBackend, backend as state_backend
+from app.services.command_tracker import CommandTracker
 import asyncio
+import json
 import time
 import uuid
 
-class CommandQueueManager:
+# Dashboard action names and the client command they are sent as
+COMMAND_MAPPING = {
+    'ros_start': 'ros-start',
+    'ros_stop': 'ros-stop',
+    'power_off': 'system-poweroff',
+    'reboot': 'system-reboot',
+    'software_update': 'software_update'
+}
+# Robot commands accepted whatever the robot is doing; the others need an idle system
+ALWAYS_ALLOWED_COMMANDS = ["get-image-tags", "get-env", "ros-stop", "cancel"]
+IDLE_SYSTEM_STATUSES = ["inactive", "failed", "unknown"]
+
+def format_command(command: str, command_option: Optional[dict] = None) -> dict:
+    return {
+        'command': COMMAND_MAPPING.get(command, command),
+        'commandOption': command_option or {}
+    }
+
+def command_allowed(command: str, system_status: str) -> bool:
+    """Whether a dashboard action (ros_stop) or robot command (ros-stop) may be sent to a robot in the given system status"""
+    return COMMAND_MAPPING.get(command, command) in ALWAYS_ALLOWED_COMMANDS or system_status in IDLE_SYSTEM_STATUSES
+
+# Priority lanes, highest first; a robot is handed the oldest command of its first non-empty lane
+LANES = ("safety", "control", "background")
+COMMAND_LANES = {
+    'ros-stop': "safety",
+    'system-poweroff': "safety",
+    'system-reboot': "safety",
+    'cancel': "safety",
+    'get-image-tags': "background",
+    'get-env': "background"
+}
+DEFAULT_LANE = "control"
+# Queued commands made pointless by a newer one; dropped when it is queued (CABOT_DASHBOARD_COMMAND_PREEMPTION)
+PREEMPTS = {
+    'ros-stop': {'ros-start'},
+    'system-poweroff': {'ros-start', 'get-image-tags', 'get-env'},
+    'system-reboot': {'ros-start', 'get-image-tags', 'get-env'}
+}
+# Commands where running one of several identical queued copies is enough; a copy collapses into the queued one
+IDEMPOTENT_COMMANDS = {
+    'ros-start', 'ros-stop', 'system-poweroff', 'system-reboot', 'software_update', 'site_update', 'env_update',
+    'get-image-tags', 'get-env', 'cancel'
+}
+WAIT_SAMPLES = 1000
+
+def command_lane(command: dict) -> str:
+    return COMMAND_LANES.get(command.get('command'), DEFAULT_LANE)
+
+def command_key(command: dict) -> str:
+    """Identity of a command payload, for collapsing duplicates"""
+    return json.dumps(command, sort_keys=True)
+
+def is_expired(entry: dict, now: float) -> bool:
+    return entry.get("expires_at") is not None and entry["expires_at"] <= now
+
+
+class CommandQueueFull(ValueError):
+    """The robot's queue holds CABOT_DASHBOARD_COMMAND_QUEUE_DEPTH commands of the same or higher priority"""
+
+
+class LaneStats:
+    """Dispatch counts and queue wait times of one lane, on this worker"""
+
     def __init__(self):
-        self.command_queues: Dict[str, asyncio.Queue] = {}
+        self.queued = 0
+        self.dispatched = 0
+        self.preempted = 0
+        self.collapsed = 0
+        self.expired = 0
+        self.evicted = 0
+        self.refused = 0
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        def percentile(fraction):
+            return round(waits[min(len(waits) - 1, int(len(waits) * fraction))] * 1000, 1) if waits else None
+        return {
+            "queued": self.queued,
+            "dispatched": self.dispatched,
+            "preempted": self.preempted,
+            "collapsed": self.collapsed,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "refused": self.refused,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": round(waits[-1] * 1000, 1) if waits else None
+        }
+
+
+class CommandQueueManager:
+    def __init__(self, backend: Optional[StateBackend] = None):
+        # Queues live in the state backend so any worker can queue a command for a robot polling another worker
+        self.backend = backend if backend is not None else state_backend
+        self.clients: Set[str] = set()
         self.command_requests: Dict[str, str] = {}
+        self.waiters: Dict[str, asyncio.Future] = {}
         self.POLL_TIMEOUT = Settings().polling_timeout
+        self.PREEMPTION = Settings().command_preemption
+        self.COMMAND_TTL = Settings().command_ttl
+        self.MAX_DEPTH = Settings().command_queue_depth
+        self.lane_stats = {lane: LaneStats() for lane in LANES}
+        self.tracker = CommandTracker(self.backend)
+        self.backend.subscribe("commands", self._on_backend_message)
         logger.info(f"Initialized CommandQueueManager with poll timeout: {self.POLL_TIMEOUT}s")
 
     async def initialize_client(self, client_id: str) -> None:
-        if client_id not in self.command_queues:
-            self.command_queues[client_id] = asyncio.Queue()
+        if client_id not in self.clients:
+            self.clients.add(client_id)
             logger.info(f"Initialized queue for client {client_id}")
 
-    async def add_command(self, client_id: str, command: dict) -> None:
-        if client_id not in self.command_queues:
-            await self.initialize_client(client_id)
-        await self.command_queues[client_id].put(command)
-        logger.debug(f"[ADD] Added command to queue for {client_id}")
+    async def add_command(self, client_id: str, command: dict, ttl: Optional[float] = None) -> str:
+        result = (await self.add_commands([client_id], command, ttl))[client_id]
+        if result == "full":
+            raise CommandQueueFull(f"Command queue of {client_id} is full")
+        return result
+
+    async def add_commands(self, client_ids: List[str], command: dict, ttl: Optional[float] = None) -> Dict[str, str]:
+        """Queue the same command for several clients in one backend operation
+
+        Returns "queued", "collapsed" (an identical command is already queued) or
+        "full" for each client. ttl is in seconds, CABOT_DASHBOARD_COMMAND_TTL if
+        None and no expiry if 0.
+        """
+        for client_id in client_ids:
+            if client_id not in self.clients:
+                await self.initialize_client(client_id)
+        lane = command_lane(command)
+        now = time.time()
+        ttl = self.COMMAND_TTL if ttl is None else ttl
+        key = command_key(command)
+        results, entries = {}, {}
+        for client_id, queued in (await self.backend.list_commands(client_ids, LANES)).items():
+            drop = self._entries_to_drop(client_id, command, lane, queued, now)
+            live = [entry for entry in queued if entry["id"] not in drop]
+            if command.get('command') in IDEMPOTENT_COMMANDS and any(
+                    entry["lane"] == lane and command_key(entry["command"]) == key for entry in live):
+                self.lane_stats[lane].collapsed += 1
+                results[client_id] = "collapsed"
+            elif len(live) >= self.MAX_DEPTH and not self._evict(client_id, lane, live, drop):
+                self.lane_stats[lane].refused += 1
+                results[client_id] = "full"
+                logger.warning(f"[ADD] Command queue of {client_id} is full, {command} refused")
+            else:
+                results[client_id] = "queued"
+                entries[client_id] = {
+                    "id": uuid.uuid4().hex,
+                    "command": command,
+                    "lane": lane,
+                    "enqueued_at": now,
+                    "expires_at": now + ttl if ttl else None
+                }
+            if drop:
+                await self.backend.remove_commands(client_id, LANES, set(drop))
+        if entries:
+            await self.backend.push_commands(entries, lane)
+            self.lane_stats[lane].queued += len(entries)
+            for client_id, entry in entries.items():
+                self.tracker.enqueued(client_id, entry)
+                self._wake(client_id)
+            self.backend.publish("commands", {"type": "command", "robot_ids": list(entries)})
+        logger.debug(f"[ADD] {command} in {lane} lane: {results}")
+        return results
+
+    def _entries_to_drop(self, client_id: str, command: dict, lane: str, queued: List[dict], now: float) -> Dict[str, dict]:
+        """Expired entries, and with preemption the ones the new command supersedes"""
+        superseded = PREEMPTS.get(command.get('command'), set()) if self.PREEMPTION else set()
+        lanes = LANES[LANES.index(lane):]
+        drop = {}
+        for entry in queued:
+            if is_expired(entry, now):
+                self.lane_stats[entry["lane"]].expired += 1
+                self.tracker.dropped(client_id, entry["id"], "expired")
+                drop[entry["id"]] = entry
+            elif entry["command"].get('command') in superseded and entry["lane"] in lanes:
+                self.lane_stats[entry["lane"]].preempted += 1
+                self.tracker.dropped(client_id, entry["id"], "preempted")
+                logger.info(f"[ADD] {command['command']} for {client_id} cancelled queued {entry['command']}")
+                drop[entry["id"]] = entry
+        return drop
+
+    def _evict(self, client_id: str, lane: str, live: List[dict], drop: Dict[str, dict]) -> bool:
+        """Make room for a command by dropping the oldest one of the lowest lane below its own"""
+        for lower in reversed(LANES[LANES.index(lane) + 1:]):
+            for entry in live:
+                if entry["lane"] == lower:
+                    self.lane_stats[lower].evicted += 1
+                    self.tracker.dropped(client_id, entry["id"], "evicted")
+                    logger.warning(f"[ADD] Command queue of {client_id} is full, dropped {entry['command']}")
+                    drop[entry["id"]] = entry
+                    return True
+        return False
+
+    def _wake(self, client_id: str, error: Optional[Exception] = None) -> None:
+        """Resolve the parked long-poll of the client, if any"""
+        waiter = self.waiters.get(client_id)
+        if waiter is not None and not waiter.done():
+            if error is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(error)
+
+    def _on_backend_message(self, message: dict) -> None:
+        """A command was queued, or the robot polled again, on another worker"""
+        if message["type"] == "command":
+            for client_id in message.get("robot_ids") or [message["robot_id"]]:
+                self._wake(client_id)
+            return
+        client_id = message["robot_id"]
+        if message["type"] == "poll" and client_id in self.command_requests:
+            previous_request_id = self.command_requests[client_id]
+            self.command_requests[client_id] = message["request_id"]
+            self._wake(client_id, ConnectionResetError(f"Client {client_id} request {previous_request_id} closed"))
 
     async def wait_for_update(self, client_id: str) -> Dict:
-        if client_id not in self.command_queues:
+        if client_id not in self.clients:
             await self.initialize_client(client_id)
         request_id = uuid.uuid4().hex
+        previous_request_id = self.command_requests.get(client_id)
         self.command_requests[client_id] = request_id
+        # A new poll supersedes the one still parked for this client, here or on another worker
+        self._wake(client_id, ConnectionResetError(f"Client {client_id} request {previous_request_id} closed"))
+        self.backend.publish("commands", {"type": "poll", "robot_id": client_id, "request_id": request_id})
         logger.debug(f"[WAIT] Starting wait for {client_id}")
-        started = time.time()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.POLL_TIMEOUT
         while True:
-            try:
-                command = await asyncio.wait_for(
-                    self.command_queues[client_id].get(),
-                    timeout=1
-                )
-                logger.debug(f"[WAIT] Retrieved command for {client_id}: {command}")
-                return command
-            except asyncio.TimeoutError:
-                pass
-            except Exception as e:
-                logger.error(f"Error in wait_for_update: {e}")
-                raise ConnectionError(f"Client {client_id} connection error: {e}")
-            if self.command_requests[client_id] != request_id:
+            if self.command_requests.get(client_id) != request_id:
                 raise ConnectionResetError(f"Client {client_id} request {request_id} closed")
-            if time.time() - started > self.POLL_TIMEOUT:
-                logger.debug(f"[WAIT] Timeout for {client_id} after {self.POLL_TIMEOUT}s")
-                raise asyncio.TimeoutError(f"Client {client_id} request {request_id} timeout")
+            # Park before looking at the queue so a wake-up during the lookup is not lost
+            waiter = loop.create_future()
+            self.waiters[client_id] = waiter
+            try:
+                entry = await self.backend.pop_command(client_id, LANES)
+                if entry is not None and is_expired(entry, time.time()):
+                    self.lane_stats[entry["lane"]].expired += 1
+                    self.tracker.dropped(client_id, entry["id"], "expired")
+                    logger.info(f"[WAIT] Dropped expired command for {client_id}: {entry['command']}")
+                    continue
+                if entry is not None:
+                    stats = self.lane_stats[entry["lane"]]
+                    stats.dispatched += 1
+                    stats.waits.append(max(0.0, time.time() - entry["enqueued_at"]))
+                    self.tracker.dequeued(client_id, entry["id"])
+                    logger.debug(f"[WAIT] Retrieved {entry['lane']} command for {client_id}: {entry['command']}")
+                    # The robot echoes commandId in the statuses it sends for the command
+                    return {**entry["command"], "commandId": entry["id"]}
+                if waiter.done():
+                    # Woken during the lookup; raises if superseded or removed
+                    waiter.result()
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    logger.debug(f"[WAIT] Timeout for {client_id} after {self.POLL_TIMEOUT}s")
+                    raise asyncio.TimeoutError(f"Client {client_id} request {request_id} timeout")
+                # Until add_command, a superseding poll or remove_client resolves the waiter
+                try:
+                    await asyncio.wait_for(waiter, timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                if self.waiters.get(client_id) is waiter:
+                    del self.waiters[client_id]
+                if waiter.done() and not waiter.cancelled():
+                    waiter.exception()  # Mark as retrieved
+
+    async def cancel_command(self, client_id: str, command_id: str) -> str:
+        """Cancel a command: drop it if it is still queued, otherwise have the robot stop it
 
-    def remove_client(self, client_id: str) -> None:
-        if client_id in self.command_queues:
-            del self.command_queues[client_id]
+        Returns "dropped", "sent" (a cancel command is queued for the robot) or
+        "unknown" if the command is not queued or in flight.
+        """
+        if await self.backend.remove_commands(client_id, LANES, {command_id}):
+            self.tracker.dropped(client_id, command_id, "cancelled")
+            return "dropped"
+        if command_id not in self.tracker.in_flight.get(client_id, {}):
+            return "unknown"
+        await self.add_command(client_id, {"command": "cancel", "commandOption": {"commandId": command_id}})
+        return "sent"
+
+    async def requeue(self, client_id: str, command: dict) -> None:
+        """Put back a command taken by wait_for_update that could not be delivered"""
+        command = dict(command)
+        command_id = command.pop("commandId", None) or uuid.uuid4().hex
+        lane = command_lane(command)
+        now = time.time()
+        await self.backend.push_commands({client_id: {
+            "id": command_id, "command": command, "lane": lane, "enqueued_at": now, "expires_at": None
+        }}, lane)
+        self.tracker.requeued(client_id, command_id)
+        self._wake(client_id)
+        self.backend.publish("commands", {"type": "command", "robot_ids": [client_id]})
+
+    async def remove_client(self, client_id: str) -> None:
+        self.clients.discard(client_id)
         if client_id in self.command_requests:
             del self.command_requests[client_id]
+        self._wake(client_id, ConnectionError(f"Client {client_id} connection error: client removed"))
+        for entry in (await self.backend.list_commands([client_id], LANES))[client_id]:
+            self.tracker.dropped(client_id, entry["id"], "removed")
+        await self.backend.clear_commands(client_id, LANES)
         logger.info(f"Removed client {client_id}")
 
+    def stats(self) -> dict:
+        return {lane: stats.stats() for lane, stats in self.lane_stats.items()}
+
     def _validate_command(self, command: dict) -> bool:
         required_fields = {'command', 'commandOption'}
         return (
             isinstance(command, dict) and
             all(field in command for field in required_fields)
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,277 @@
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional
+from app.utils.logger import logger
+from app.config import settings
+from app.services.backend import StateBackend, backend as state_backend
+from app.services.notifier import CoalescingNotifier
+from app.services.websocket import manager as websocket_manager
+import bisect
+import time
+
+# Upper bounds of the latency histogram buckets, in milliseconds; the last bucket is open
+LATENCY_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000)
+# queue: enqueue -> taken by a poll, start: taken -> robot reports "start",
+# run: "start" -> result, total: enqueue -> result
+STAGES = ("queue", "start", "run", "total")
+TERMINAL_STATUSES = ("success", "error", "timeout", "cancelled")
+# A command without a result after this long (a reboot, a lost robot) leaves the in-flight table
+IN_FLIGHT_TIMEOUT = 3600
+# Commands per robot whose output is kept, the running one and the last finished ones
+OUTPUT_HISTORY = 4
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds: float) -> None:
+        ms = max(0.0, seconds * 1000)
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def stats(self) -> dict:
+        labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else None,
+            "max_ms": round(self.max_ms, 1),
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+
+class CommandRecord:
+    """Lifecycle timestamps (epoch seconds) of one queued command"""
+    __slots__ = ("id", "robot_id", "command", "lane", "enqueued_at", "dequeued_at", "started_at", "completed_at", "outcome")
+
+    def __init__(self, command_id: str, robot_id: str, command: str, lane: str, enqueued_at: float):
+        self.id = command_id
+        self.robot_id = robot_id
+        self.command = command
+        self.lane = lane
+        self.enqueued_at = enqueued_at
+        self.dequeued_at: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self.completed_at: Optional[float] = None
+        self.outcome: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        if self.outcome is not None:
+            return self.outcome
+        if self.started_at is not None:
+            return "running"
+        return "sent" if self.dequeued_at is not None else "queued"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "command": self.command,
+            "lane": self.lane,
+            "state": self.state,
+            "enqueued_at": self.enqueued_at,
+            "dequeued_at": self.dequeued_at,
+            "started_at": self.started_at,
+            "completed_at": self.completed_at
+        }
+
+
+class CommandOutput:
+    """Output lines a robot streamed for one command, keeping the newest max_bytes"""
+
+    def __init__(self, command_id: str, command: str, max_bytes: int):
+        self.id = command_id
+        self.command = command
+        self.max_bytes = max_bytes
+        self.lines: Deque[List[str]] = deque()
+        self.bytes = 0
+        self.dropped_bytes = 0
+
+    def append(self, lines: List[List[str]]) -> None:
+        """Add [stream, text] lines, dropping the oldest ones over max_bytes"""
+        for stream, text in lines:
+            self.lines.append([stream, text])
+            self.bytes += len(text.encode())
+        while self.bytes > self.max_bytes and self.lines:
+            dropped = len(self.lines.popleft()[1].encode())
+            self.bytes -= dropped
+            self.dropped_bytes += dropped
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "command": self.command, "lines": list(self.lines), "dropped_bytes": self.dropped_bytes}
+
+
+class CommandTracker:
+    """Follows each queued command until the robot reports its result
+
+    Events are replicated to the other server workers through the state backend,
+    since a command is often queued, taken and reported on different workers.
+    Completed commands feed per-command-type latency histograms; the commands still
+    in flight are listed per robot and pushed to dashboards as command_status.
+    Output the robot streams while a command runs is kept per command (up to
+    settings.command_output_max_bytes) and pushed to dashboards as command_output appends.
+    """
+
+    def __init__(self, backend: Optional[StateBackend] = None):
+        self.backend = backend if backend is not None else state_backend
+        self.in_flight: Dict[str, Dict[str, CommandRecord]] = {}
+        self.histograms: Dict[str, Dict[str, LatencyHistogram]] = {}
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+        self.outputs: Dict[str, "OrderedDict[str, CommandOutput]"] = {}
+        self.notifier = CoalescingNotifier(self._broadcast, settings.broadcast_window_ms / 1000)
+        # Lines not yet pushed to dashboards, per robot and command
+        self._pending_output: Dict[str, Dict[str, List[List[str]]]] = {}
+        self.output_notifier = CoalescingNotifier(self._broadcast_output, settings.broadcast_window_ms / 1000)
+        self.backend.subscribe("tracker", self._apply)
+
+    def enqueued(self, robot_id: str, entry: dict) -> None:
+        self._event({
+            "event": "enqueued", "robot_id": robot_id, "id": entry["id"], "command": entry["command"].get("command"),
+            "lane": entry["lane"], "at": entry["enqueued_at"]
+        })
+
+    def dequeued(self, robot_id: str, command_id: str) -> None:
+        self._event({"event": "dequeued", "robot_id": robot_id, "id": command_id, "at": time.time()})
+
+    def requeued(self, robot_id: str, command_id: str) -> None:
+        """The command could not be delivered and is queued again under the same ID"""
+        self._event({"event": "requeued", "robot_id": robot_id, "id": command_id, "at": time.time()})
+
+    def reported(self, robot_id: str, command_id: str, status: str) -> None:
+        """The robot sent a status for the command; "start" or one of TERMINAL_STATUSES count"""
+        self._event({"event": "reported", "robot_id": robot_id, "id": command_id, "status": status, "at": time.time()})
+
+    def output(self, robot_id: str, command_id: str, command: Optional[str], lines: List[List[str]]) -> None:
+        """The robot sent a batch of [stream, text] output lines of a running command
+
+        The command name is taken from the in-flight record; `command`, the name the
+        robot sent (older robots send none), is used only when there is no record.
+        """
+        self._event({"event": "output", "robot_id": robot_id, "id": command_id, "command": command, "lines": lines, "at": time.time()})
+
+    def dropped(self, robot_id: str, command_id: str, reason: str) -> None:
+        """The command left the queue without being sent (preempted, expired, evicted)"""
+        self._event({"event": "dropped", "robot_id": robot_id, "id": command_id, "status": reason, "at": time.time()})
+
+    def _event(self, event: dict) -> None:
+        self._apply(event)
+        self.backend.publish("tracker", event)
+
+    def _apply(self, event: dict) -> None:
+        robot_id, at = event["robot_id"], event["at"]
+        records = self.in_flight.setdefault(robot_id, {})
+        if event["event"] == "enqueued":
+            records[event["id"]] = CommandRecord(event["id"], robot_id, event["command"], event["lane"], at)
+            self._expire(records, at)
+            self.notifier.mark([robot_id])
+            return
+        if event["event"] == "output":
+            self._append_output(event)
+            return
+        record = records.get(event["id"])
+        if record is None:
+            return
+        if event["event"] == "dequeued":
+            record.dequeued_at = at
+        elif event["event"] == "requeued":
+            record.dequeued_at = None
+        elif event["event"] == "reported" and event["status"] == "start":
+            record.started_at = at
+        elif event["event"] == "reported" and event["status"] in TERMINAL_STATUSES:
+            record.completed_at = at
+            record.outcome = event["status"]
+            self._observe(record)
+            del records[event["id"]]
+        elif event["event"] == "dropped":
+            record.outcome = event["status"]
+            self._count(record)
+            del records[event["id"]]
+        else:
+            return
+        self.notifier.mark([robot_id])
+
+    def _append_output(self, event: dict) -> None:
+        robot_id, command_id = event["robot_id"], event["id"]
+        outputs = self.outputs.setdefault(robot_id, OrderedDict())
+        output = outputs.get(command_id)
+        if output is None:
+            record = self.in_flight.get(robot_id, {}).get(command_id)
+            output = CommandOutput(command_id, record.command if record else event["command"], settings.command_output_max_bytes)
+            outputs[command_id] = output
+            while len(outputs) > OUTPUT_HISTORY:
+                outputs.popitem(last=False)
+        output.append(event["lines"])
+        self._pending_output.setdefault(robot_id, {}).setdefault(command_id, []).extend(event["lines"])
+        self.output_notifier.mark([robot_id])
+
+    def _observe(self, record: CommandRecord) -> None:
+        histograms = self.histograms.setdefault(record.command, {stage: LatencyHistogram() for stage in STAGES})
+        if record.dequeued_at is not None:
+            histograms["queue"].observe(record.dequeued_at - record.enqueued_at)
+            if record.started_at is not None:
+                histograms["start"].observe(record.started_at - record.dequeued_at)
+        if record.started_at is not None:
+            histograms["run"].observe(record.completed_at - record.started_at)
+        histograms["total"].observe(record.completed_at - record.enqueued_at)
+        self._count(record)
+
+    def _count(self, record: CommandRecord) -> None:
+        outcomes = self.outcomes.setdefault(record.command, {})
+        outcomes[record.outcome] = outcomes.get(record.outcome, 0) + 1
+
+    def _expire(self, records: Dict[str, CommandRecord], now: float) -> None:
+        for record in [record for record in records.values() if now - record.enqueued_at > IN_FLIGHT_TIMEOUT]:
+            logger.info(f"No result for {record.command} {record.id} on {record.robot_id} after {IN_FLIGHT_TIMEOUT}s")
+            record.outcome = "unknown"
+            self._count(record)
+            del records[record.id]
+
+    def get_in_flight(self, robot_id: Optional[str] = None) -> Dict[str, List[dict]]:
+        robot_ids = [robot_id] if robot_id is not None else list(self.in_flight)
+        return {
+            robot_id: [record.to_dict() for record in self.in_flight.get(robot_id, {}).values()]
+            for robot_id in robot_ids
+        }
+
+    def get_output(self, robot_id: Optional[str] = None) -> Dict[str, List[dict]]:
+        """Kept output of each robot's recent commands, oldest command first"""
+        robot_ids = [robot_id] if robot_id is not None else list(self.outputs)
+        return {
+            robot_id: [output.to_dict() for output in self.outputs.get(robot_id, {}).values()]
+            for robot_id in robot_ids
+        }
+
+    def get_latency(self) -> dict:
+        return {
+            command: {
+                "stages": {stage: histogram.stats() for stage, histogram in self.histograms.get(command, {}).items()},
+                "outcomes": self.outcomes.get(command, {})
+            }
+            for command in sorted(set(self.histograms) | set(self.outcomes))
+        }
+
+    async def _broadcast(self, robot_ids, messages: bool):
+        try:
+            await websocket_manager.broadcast({
+                "type": "command_status",
+                "in_flight": {robot_id: self.get_in_flight(robot_id)[robot_id] for robot_id in sorted(robot_ids)}
+            })
+        except Exception as e:
+            logger.error(f"Error broadcasting command status: {e}")
+
+    async def _broadcast_output(self, robot_ids, messages: bool):
+        appended = {}
+        for robot_id in sorted(robot_ids):
+            outputs = self.outputs.get(robot_id, {})
+            appended[robot_id] = [
+                {"id": command_id, "command": outputs[command_id].command if command_id in outputs else None, "lines": lines}
+                for command_id, lines in self._pending_output.pop(robot_id, {}).items()
+            ]
+        try:
+            await websocket_manager.broadcast({"type": "command_output", "output": appended})
+        except Exception as e:
+            logger.error(f"Error broadcasting command output: {e}")
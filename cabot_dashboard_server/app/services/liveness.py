@@ -0,0 +1,74 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+
+
+class LivenessTracker:
+    """Expires robots that stopped polling, using a deadline heap on the event loop
+
+    Every touch pushes the robot's new deadline onto a heap in O(log n); older entries
+    for the same robot become stale and are discarded lazily. A single timer is kept
+    armed for the earliest live deadline, so expiry fires at the deadline itself
+    without scanning all robots or running a separate thread.
+    """
+
+    def __init__(self, timeout: float, on_expire: Callable[[List[str]], None]):
+        self.timeout = timeout
+        self._on_expire = on_expire
+        self._deadlines: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = float("inf")
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def touch(self, robot_id: str, timeout: Optional[float] = None) -> None:
+        """Reset the robot's deadline to now + timeout"""
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Only reachable from scripts that drive the manager without a loop
+            return
+        deadline = self._loop.time() + (self.timeout if timeout is None else timeout)
+        self._deadlines[robot_id] = deadline
+        heapq.heappush(self._heap, (deadline, robot_id))
+        self._schedule()
+
+    def discard(self, robot_id: str) -> None:
+        """Stop tracking a robot; its heap entries are dropped lazily"""
+        self._deadlines.pop(robot_id, None)
+
+    def _pop_stale(self) -> None:
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _schedule(self) -> None:
+        self._pop_stale()
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(deadline, robot_id) for robot_id, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
+        at = self._heap[0][0] if self._heap else float("inf")
+        if at == self._timer_at:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._timer_at = at
+        if self._heap:
+            self._timer = self._loop.call_at(at, self._expire)
+
+    def _expire(self) -> None:
+        self._timer = None
+        self._timer_at = float("inf")
+        now = self._loop.time()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, robot_id = heapq.heappop(self._heap)
+            if self._deadlines.get(robot_id) == deadline:
+                del self._deadlines[robot_id]
+                expired.append(robot_id)
+        self._schedule()
+        if expired:
+            self._on_expire(expired)
@@ -0,0 +1,73 @@
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+import time
+
+
+class MessageBuffer:
+    """Fixed-capacity message history, oldest entries are overwritten first
+
+    Entries are kept in insertion (time) order together with their epoch timestamp,
+    so newest-first views are a reverse walk and never need sorting or parsing.
+    """
+    __slots__ = ("_entries",)
+
+    def __init__(self, capacity: int):
+        self._entries: Deque[Tuple[float, dict]] = deque(maxlen=capacity)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def append(self, message: dict, epoch: Optional[float] = None) -> None:
+        self._entries.append((time.time() if epoch is None else epoch, message))
+
+    def latest(self, limit: int, within: Optional[float] = None, now: Optional[float] = None) -> List[dict]:
+        """Get up to limit messages, newest first
+        Args:
+            limit (int): Maximum number of messages
+            within (float): Only messages newer than this many seconds
+            now (float): Reference epoch for within (default: current time)
+        """
+        return [message for _, message in self.latest_entries(limit, within, now)]
+
+    def latest_entries(self, limit: int, within: Optional[float] = None, now: Optional[float] = None) -> List[Tuple[float, dict]]:
+        """Same as latest, but returns (epoch, message) pairs"""
+        oldest = None if within is None else (time.time() if now is None else now) - within
+        result = []
+        for epoch, message in reversed(self._entries):
+            if len(result) >= limit or (oldest is not None and epoch < oldest):
+                break
+            result.append((epoch, message))
+        return result
+
+    def history(self) -> List[dict]:
+        """Get all messages, newest first"""
+        return [message for _, message in reversed(self._entries)]
+
+    def oldest_seq(self) -> Optional[int]:
+        """Sequence number of the oldest retained message, None if empty"""
+        return self._entries[0][1].get("seq") if self._entries else None
+
+    def latest_seq(self) -> Optional[int]:
+        """Sequence number of the newest message, None if empty"""
+        return self._entries[-1][1].get("seq") if self._entries else None
+
+    def page(self, limit: int, before: Optional[int] = None, level: Optional[str] = None,
+             since: Optional[float] = None, until: Optional[float] = None) -> List[dict]:
+        """Get up to limit messages older than the cursor, newest first
+        Args:
+            limit (int): Maximum number of messages
+            before (int): Only messages whose seq is lower than this
+            level (str): Only messages of this level
+            since (float): Only messages at or after this epoch
+            until (float): Only messages before this epoch
+        """
+        result = []
+        for epoch, message in reversed(self._entries):
+            if len(result) >= limit or (since is not None and epoch < since):
+                break
+            if before is not None and message.get("seq", before) >= before:
+                continue
+            if (until is not None and epoch >= until) or (level is not None and message.get("level") != level):
+                continue
+            result.append(message)
+        return result
@@ -0,0 +1,75 @@
+from typing import Awaitable, Callable, Iterable, Optional, Set
+from app.utils.logger import logger
+import asyncio
+
+
+class CoalescingNotifier:
+    """Collects changed robots and flushes them together, at most once per window
+
+    The first change after a quiet period is flushed immediately (or as soon as the
+    previous flush is one window old), and every change that arrives while a flush is
+    pending is merged into it. A change therefore waits at most one window, and the
+    broadcast rate is bounded by 1 / window regardless of how often robots poll.
+    """
+
+    def __init__(self, flush: Callable[[Set[str], bool], Awaitable[None]], window: float):
+        self._flush = flush
+        self.window = window
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._dirty: Set[str] = set()
+        self._messages_dirty = False
+        self._first_mark = 0.0
+        self._last_flush = float("-inf")
+        self.sent = 0
+        self.suppressed = 0
+        self.max_latency = 0.0
+
+    def mark(self, robot_ids: Iterable[str] = (), messages: bool = False) -> None:
+        """Mark robots (and optionally the global messages) as changed
+
+        Safe to call from any thread; calls from outside the event loop are handed over to it.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is None:
+                # No dashboard can be connected before the loop runs
+                return
+            self._loop.call_soon_threadsafe(self.mark, tuple(robot_ids), messages)
+            return
+        self._loop = loop
+        self._dirty.update(robot_ids)
+        self._messages_dirty = self._messages_dirty or messages
+        if self._handle is not None:
+            self.suppressed += 1
+            return
+        now = loop.time()
+        self._first_mark = now
+        delay = max(0.0, self._last_flush + self.window - now)
+        self._handle = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._handle = None
+        robot_ids, messages = self._dirty, self._messages_dirty
+        self._dirty, self._messages_dirty = set(), False
+        now = self._loop.time()
+        self._last_flush = now
+        self.max_latency = max(self.max_latency, now - self._first_mark)
+        self.sent += 1
+        self._loop.create_task(self._run_flush(robot_ids, messages))
+
+    async def _run_flush(self, robot_ids: Set[str], messages: bool) -> None:
+        try:
+            await self._flush(robot_ids, messages)
+        except Exception as e:
+            logger.error(f"Error flushing state change: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "window": self.window,
+            "sent": self.sent,
+            "suppressed": self.suppressed,
+            "pending": len(self._dirty),
+            "max_latency": self.max_latency
+        }
@@ -0,0 +1,190 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from app.utils.logger import logger
+import asyncio
+import json
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS robots (
+    id TEXT PRIMARY KEY,
+    images TEXT NOT NULL,
+    env TEXT NOT NULL,
+    last_poll TEXT,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY,
+    robot_id TEXT,
+    epoch REAL NOT NULL,
+    level TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_robot_seq ON messages (robot_id, seq);
+"""
+
+# robot_id is NULL for global messages; `IS` matches NULL as well
+RECENT_MESSAGES = "SELECT epoch, data FROM messages WHERE robot_id IS ? ORDER BY seq DESC LIMIT ?"
+PRUNE_MESSAGES = """
+DELETE FROM messages WHERE robot_id IS ? AND seq <= (
+    SELECT seq FROM messages WHERE robot_id IS ? ORDER BY seq DESC LIMIT 1 OFFSET ?
+)
+"""
+
+
+class StatePersistence:
+    """Write-behind SQLite store for robot state and message history
+
+    Changes are collected on the event loop and written in one transaction per flush
+    interval by a single worker thread, so request handlers never wait for the disk.
+    Robot rows are coalesced (last write wins); messages are appended and pruned to
+    `history_limit` per robot, far more than the in-memory buffers keep.
+    """
+
+    def __init__(self, path: str, flush_interval: float, history_limit: int, max_pending: int = 10000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.history_limit = history_limit
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-db")
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._robots: Dict[str, Tuple[Dict[str, str], Dict[str, str], Optional[str], float]] = {}
+        self._messages: List[Tuple[Optional[str], float, dict]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._writing: Optional[asyncio.Future] = None
+        self.flushes = 0
+        self.written = 0
+        self.dropped = 0
+        logger.info(f"State persistence enabled: {path} (flush every {flush_interval}s, {history_limit} messages per robot)")
+
+    def load(self, max_messages: int) -> dict:
+        """Read the last saved state; called once at startup before any write
+        Args:
+            max_messages (int): Number of most recent messages to return per robot
+        Returns:
+            dict: {"robots": [(id, images, env, last_poll, updated)],
+                   "messages": {robot_id: [(epoch, message)] oldest first}, robot_id None for global messages,
+                   "max_seq": highest message sequence number}
+        """
+        started = time.perf_counter()
+        robots = [
+            (robot_id, json.loads(images), json.loads(env), last_poll, updated)
+            for robot_id, images, env, last_poll, updated in self._conn.execute(
+                "SELECT id, images, env, last_poll, updated FROM robots")
+        ]
+        messages: Dict[Optional[str], List[Tuple[float, dict]]] = {}
+        count = 0
+        # One index range scan per robot, independent of how much history is on disk
+        for robot_id in [row[0] for row in robots] + [None]:
+            rows = self._conn.execute(RECENT_MESSAGES, (robot_id, max_messages)).fetchall()
+            if rows:
+                messages[robot_id] = [(epoch, json.loads(data)) for epoch, data in reversed(rows)]
+                count += len(rows)
+        max_seq = self._conn.execute("SELECT MAX(seq) FROM messages").fetchone()[0] or 0
+        logger.info(f"Loaded {len(robots)} robots and {count} messages in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return {"robots": robots, "messages": messages, "max_seq": max_seq}
+
+    def save_robot(self, robot_id: str, images: Dict[str, str], env: Dict[str, str], last_poll: Optional[str]) -> None:
+        """Queue the robot's row; only the latest value per flush is written"""
+        self._robots[robot_id] = (images, env, last_poll, time.time())
+        self._schedule()
+
+    def save_message(self, robot_id: Optional[str], message: dict, epoch: float) -> None:
+        """Queue a message for the history table (robot_id None for global messages)
+
+        The message must carry its "seq", which becomes the row's primary key.
+        """
+        if len(self._messages) >= self.max_pending:
+            # The disk is not keeping up; keep memory bounded
+            del self._messages[0]
+            self.dropped += 1
+        self._messages.append((robot_id, epoch, message))
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self._handle is not None:
+            return
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Flushed by the next change made on the loop, or by close()
+            return
+        self._handle = self._loop.call_later(self.flush_interval, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._handle = None
+        self._writing = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> None:
+        """Write everything queued so far in one transaction"""
+        if not self._robots and not self._messages:
+            return
+        # Serialize on the loop so the worker never sees dicts that are being mutated
+        robots = [
+            (robot_id, json.dumps(images), json.dumps(env), last_poll, updated)
+            for robot_id, (images, env, last_poll, updated) in self._robots.items()
+        ]
+        messages = [
+            (message["seq"], robot_id, epoch, message.get("level"), json.dumps(message))
+            for robot_id, epoch, message in self._messages
+        ]
+        self._robots, self._messages = {}, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write, robots, messages)
+            self.flushes += 1
+            self.written += len(robots) + len(messages)
+        except Exception as e:
+            logger.error(f"Error writing state to {self.path}: {e}")
+
+    def _write(self, robots: list, messages: list) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO robots (id, images, env, last_poll, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET images=excluded.images, env=excluded.env, "
+                "last_poll=excluded.last_poll, updated=excluded.updated",
+                robots
+            )
+            self._conn.executemany("INSERT OR REPLACE INTO messages (seq, robot_id, epoch, level, data) VALUES (?, ?, ?, ?, ?)", messages)
+            for robot_id in {row[1] for row in messages}:
+                self._conn.execute(PRUNE_MESSAGES, (robot_id, robot_id, self.history_limit))
+
+    async def read_messages(self, robot_id: str, limit: int, before: Optional[int] = None, level: Optional[str] = None,
+                            since: Optional[float] = None, until: Optional[float] = None) -> List[dict]:
+        """Read a page of a robot's history from disk, newest first (same filters as MessageBuffer.page)"""
+        query = "SELECT data FROM messages WHERE robot_id = ?"
+        params: list = [robot_id]
+        for condition, value in (("seq < ?", before), ("level = ?", level), ("epoch >= ?", since), ("epoch < ?", until)):
+            if value is not None:
+                query += f" AND {condition}"
+                params.append(value)
+        query += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit)
+
+        def read():
+            return [json.loads(data) for data, in self._conn.execute(query, params)]
+        return await asyncio.get_running_loop().run_in_executor(self._executor, read)
+
+    def stats(self) -> dict:
+        return {
+            "flushes": self.flushes,
+            "written": self.written,
+            "dropped": self.dropped,
+            "pending": len(self._robots) + len(self._messages)
+        }
+
+    async def close(self) -> None:
+        """Write what is still queued and close the database"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._writing is not None:
+            await self._writing
+        await self.flush()
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+        logger.info(f"State persistence closed: {self.path}")
@@ -0,0 +1,107 @@
+from typing import List, Optional, Union
+import asyncio
+
+# Minimal RESP2 (Redis serialization protocol) support, enough for the shared state backend
+
+RespValue = Union[None, int, bytes, str, List["RespValue"], "RespError"]
+
+
+class RespError(Exception):
+    """Error reply (-ERR ...) from the server"""
+
+
+def encode_command(*args) -> bytes:
+    """Encode a command as an array of bulk strings"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        else:
+            data = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+def encode_reply(value: RespValue) -> bytes:
+    """Encode a reply; str is sent as a simple string, bytes as a bulk string"""
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, RespError):
+        return b"-%s\r\n" % str(value).encode()
+    if isinstance(value, bool) or isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    return b"*%d\r\n" % len(value) + b"".join(encode_reply(item) for item in value)
+
+
+async def read_value(reader: asyncio.StreamReader) -> RespValue:
+    """Read one value; error replies are returned (not raised) as RespError"""
+    line = await reader.readuntil(b"\r\n")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode()
+    if kind == b"-":
+        return RespError(payload.decode())
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [await read_value(reader) for _ in range(length)]
+    raise ConnectionError(f"Invalid RESP data: {line!r}")
+
+
+class RespConnection:
+    """One connection to a Redis-protocol server; callers serialize commands"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int, db: int = 0, password: Optional[str] = None, timeout: float = 5) -> "RespConnection":
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        connection = cls(reader, writer)
+        try:
+            if password:
+                await connection.execute("AUTH", password)
+            if db:
+                await connection.execute("SELECT", db)
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    def send(self, *args) -> None:
+        self.writer.write(encode_command(*args))
+
+    async def execute(self, *args) -> RespValue:
+        self.send(*args)
+        await self.writer.drain()
+        reply = await read_value(self.reader)
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    async def execute_many(self, commands: List[tuple]) -> List[RespValue]:
+        """Send several commands in one write and read their replies in order"""
+        self.writer.write(b"".join(encode_command(*args) for args in commands))
+        await self.writer.drain()
+        replies = [await read_value(self.reader) for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def close(self) -> None:
+        self.writer.close()
@@ -0,0 +1,206 @@
+from typing import Any, Dict, Optional, Tuple
+from app.services.message_buffer import MessageBuffer
+
+PANEL_MESSAGE_SECOND = 300  # Messages shown on the robot panel are at most 5 minutes old
+
+# Dirty-field bits
+STATUS = 1 << 0
+SYSTEM_STATUS = 1 << 1
+WIFI_STATUS = 1 << 2
+DISK_USAGE = 1 << 3
+LAST_POLL = 1 << 4
+CONNECTED = 1 << 5
+IMAGES = 1 << 6
+ENV = 1 << 7
+MESSAGES = 1 << 8
+LAST_COMMAND = 1 << 9
+METRICS = 1 << 10
+
+FIELD_BITS = {
+    "status": STATUS,
+    "system_status": SYSTEM_STATUS,
+    "wifi_status": WIFI_STATUS,
+    "wifi": WIFI_STATUS,
+    "disk_usage": DISK_USAGE,
+    "disk_usage_value": DISK_USAGE,
+    "last_poll": LAST_POLL,
+    "connected": CONNECTED,
+    "images": IMAGES,
+    "env": ENV,
+    "last_command": LAST_COMMAND,
+    "last_command_type": LAST_COMMAND,
+    "metrics": METRICS,
+}
+
+# Fields that appear in the dashboard representation
+WIRE_FIELDS = SYSTEM_STATUS | WIFI_STATUS | DISK_USAGE | LAST_POLL | CONNECTED | IMAGES | ENV | MESSAGES | METRICS
+
+
+def parse_wifi_status(wifi_status_text: str) -> Optional[str]:
+    """Reduce `rfkill list wifi` output to "on", "off" or None"""
+    if "Soft blocked: no" in wifi_status_text:
+        return "on"
+    elif "Soft blocked: yes" in wifi_status_text:
+        return "off"
+    return None
+
+
+def parse_disk_usage(disk_usage_text: str) -> int:
+    """Extract the percentage from `df` output ("42%"), -1 if unknown"""
+    # Same as re.match(r"(\d+)%") without allocating a regex match on every poll
+    digits = disk_usage_text[:disk_usage_text.find("%")]
+    return int(digits) if digits.isascii() and digits.isdigit() else -1
+
+
+class RobotRecord:
+    """State of one robot, updated in place
+
+    Every change sets the corresponding bit in `dirty`; the dashboard representation
+    built by to_wire() is cached until a displayed field changes or a panel message
+    ages out.
+    """
+    __slots__ = (
+        "id", "name", "status", "system_status", "wifi_status", "wifi", "disk_usage", "disk_usage_value",
+        "last_poll", "connected", "images", "env", "all_messages", "last_command", "last_command_type",
+        "metrics", "status_seq", "dirty", "_wire", "_wire_expires",
+    )
+
+    def __init__(self, robot_id: str, name: str, max_messages: int):
+        self.id = robot_id
+        self.name = name
+        self.status = "unknown"
+        self.system_status = "unknown"
+        self.wifi_status = "unknown"
+        self.wifi: Optional[str] = None
+        self.disk_usage = "unknown"
+        self.disk_usage_value = -1
+        self.last_poll: Optional[str] = None
+        self.connected = False
+        self.images: Dict[str, str] = {}
+        self.env: Dict[str, str] = {}
+        self.all_messages = MessageBuffer(max_messages)
+        self.last_command: Optional[str] = None
+        self.last_command_type: Optional[str] = None
+        self.metrics: Optional[Dict[str, Any]] = None  # Set only for robots that report host metrics
+        self.status_seq = 0  # status_seq of the last report merged in order, 0 if none
+        self.dirty = ~0
+        self._wire: Optional[dict] = None
+        self._wire_expires = 0.0
+
+    def update(self, **fields) -> int:
+        """Set fields in place
+        Returns:
+            int: Bits of the fields whose value actually changed
+        """
+        changed = 0
+        for field, value in fields.items():
+            if getattr(self, field) != value:
+                setattr(self, field, value)
+                changed |= FIELD_BITS[field]
+        self.dirty |= changed
+        return changed
+
+    def set_poll_state(self, status: str, system_status: str, connected: bool, last_poll: str) -> int:
+        """Hot path for every poll, same as update() without the keyword dict"""
+        changed = LAST_POLL
+        if status != self.status:
+            self.status = status
+            changed |= STATUS
+        if system_status != self.system_status:
+            self.system_status = system_status
+            changed |= SYSTEM_STATUS
+        if connected != self.connected:
+            self.connected = connected
+            changed |= CONNECTED
+        self.last_poll = last_poll
+        self.dirty |= changed
+        return changed
+
+    def set_wifi_status(self, wifi_status: str) -> int:
+        if wifi_status == self.wifi_status:
+            return 0
+        self.wifi_status = wifi_status
+        self.wifi = parse_wifi_status(wifi_status)
+        self.dirty |= WIFI_STATUS
+        return WIFI_STATUS
+
+    def set_disk_usage(self, disk_usage: str) -> int:
+        if disk_usage == self.disk_usage:
+            return 0
+        self.disk_usage = disk_usage
+        self.disk_usage_value = parse_disk_usage(disk_usage)
+        self.dirty |= DISK_USAGE
+        return DISK_USAGE
+
+    def set_metrics(self, metrics: Dict[str, Any]) -> int:
+        """Typed metrics reported by the robot; disk usage and Wi-Fi are taken from them without parsing"""
+        changed = 0
+        if metrics != self.metrics:
+            self.metrics = metrics
+            changed |= METRICS
+        disk_used_percent = metrics.get("disk_used_percent")
+        if disk_used_percent is not None and disk_used_percent != self.disk_usage_value:
+            self.disk_usage_value = disk_used_percent
+            self.disk_usage = f"{disk_used_percent}%"
+            changed |= DISK_USAGE
+        wifi = {True: "on", False: "off"}.get(metrics.get("wifi_enabled"))
+        if wifi != self.wifi:
+            self.wifi = wifi
+            self.wifi_status = wifi or "unknown"
+            changed |= WIFI_STATUS
+        self.dirty |= changed
+        return changed
+
+    def add_message(self, message: dict, epoch: float) -> None:
+        self.all_messages.append(message, epoch)
+        self.dirty |= MESSAGES
+
+    def to_wire(self, now: float, display_messages: int) -> dict:
+        """Dashboard representation, re-rendered only when needed
+        Args:
+            now (float): Current epoch, used for the 5 minute panel window
+            display_messages (int): Number of panel messages
+        """
+        if self._wire is not None and not (self.dirty & WIRE_FIELDS) and now < self._wire_expires:
+            return self._wire
+        self._wire, self._wire_expires = self._render(now, display_messages)
+        self.dirty = 0
+        return self._wire
+
+    def wire_expires(self) -> float:
+        return self._wire_expires if self._wire is not None else 0.0
+
+    def _render(self, now: float, display_messages: int) -> Tuple[dict, float]:
+        # For AIS panel display: Get only the latest messages within 5 minutes
+        panel_entries = self.all_messages.latest_entries(display_messages, within=PANEL_MESSAGE_SECOND, now=now)
+        expires = panel_entries[-1][0] + PANEL_MESSAGE_SECOND if panel_entries else float("inf")
+        return {
+            'id': self.id,
+            'name': self.name,
+            'connected': self.connected,
+            'last_poll': self.last_poll,
+            'messages': [msg for _, msg in panel_entries],  # Latest 5 messages within 5 minutes for panel display
+            'history_cursor': self.all_messages.latest_seq(),  # Newest message seq; the history itself is paged from /api/robots/{id}/messages
+            'images': self.images,
+            'env': self.env,
+            'system_status': self.system_status,
+            'wifi_status': self.wifi,
+            'disk_usage': {"text": self.disk_usage, "value": self.disk_usage_value},
+            'metrics': self.metrics
+        }, expires
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "system_status": self.system_status,
+            "wifi_status": self.wifi_status,
+            "disk_usage": self.disk_usage,
+            "metrics": self.metrics,
+            "last_poll": self.last_poll,
+            "connected": self.connected,
+            "images": self.images,
+            "env": self.env,
+            "last_command": self.last_command,
+            "last_command_type": self.last_command_type,
+        }
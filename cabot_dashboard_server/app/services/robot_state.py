@@ -1,12 +1,28 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime, timezone
 from app.utils.logger import logger
 from app.config import settings
 from app.services.websocket import manager as websocket_manager
-from apscheduler.schedulers.background import BackgroundScheduler
-import asyncio
+from app.services.notifier import CoalescingNotifier
+from app.services.message_buffer import MessageBuffer
+from app.services.robot_record import LAST_POLL, RobotRecord
+from app.services.liveness import LivenessTracker
+from app.services.persistence import StatePersistence
+from app.services.backend import backend as state_backend
+import bisect
 import json
-import re
+import time
+
+# Changes that are replayed on the other workers when a shared state backend is used
+REPLICATED_METHODS = {
+    "update_robot_state", "update_robot_polling", "update_robot_status", "update_robot_images",
+    "update_robot_env", "_add_robot_message", "_add_global_message", "_set_last_command", "report_status",
+    "poll_started", "poll_finished",
+}
+
+# Status fields a robot sends with every poll and heartbeat, or only when they changed
+STATUS_REPORT_FIELDS = ("cabot_system_status", "cabot_wifi_status", "cabot_disk_usage", "cabot_metrics")
+
 
 class RobotStateManager:
     _instance = None
@@ -15,102 +31,240 @@ class RobotStateManager:
         if cls._instance is None:
             cls._instance = super(RobotStateManager, cls).__new__(cls)
             cls._instance.connected_cabots = {}
-            cls._instance.messages = []  # Initialize messages list
+            cls._instance._sorted_robots = []  # (name, id) of connected_cabots, kept sorted
+            cls._instance._fleet_cache = None  # (rendered list, epoch when it must be re-rendered)
             cls._instance.POLLING_TIMEOUT = settings.polling_timeout
-            cls._instance.MAX_MESSAGES = 100  # Maximum number of messages to retain per robot
+            cls._instance.MAX_MESSAGES = settings.max_messages  # Maximum number of messages to retain per robot
+            cls._instance.messages = MessageBuffer(cls._instance.MAX_MESSAGES)  # Initialize messages buffer
+            cls._instance.message_seq = 0  # Last sequence number given to a message, used as the history cursor
+            cls._instance.version = 0  # Incremented for every patch sent to dashboards
             cls._instance.DISPLAY_MESSAGES = 5  # Number of messages to display
             cls._instance.DISCONNECT_DETECTION_SECOND = settings.disconnect_detectioin_second
-            cls._instance.scheduler = BackgroundScheduler()
-            cls._instance.scheduler.add_job(cls._instance.disconnect_detection_handler, 'interval', seconds=5)
-            cls._instance.scheduler.start()
+            cls._instance.notifier = CoalescingNotifier(cls._instance._broadcast_changes, settings.broadcast_window_ms / 1000)
+            cls._instance.liveness = LivenessTracker(cls._instance.DISCONNECT_DETECTION_SECOND, cls._instance.disconnect_detection_handler)
+            cls._instance.PRESENCE_TIMEOUT = settings.presence_timeout
+            cls._instance.presence = LivenessTracker(cls._instance.PRESENCE_TIMEOUT, cls._instance.presence_expired_handler)
+            cls._instance.persistence = None  # StatePersistence, set by restore() when CABOT_DASHBOARD_STATE_DB is configured
+            cls._instance.backend = state_backend
+            cls._instance._applying_remote = False
+            state_backend.subscribe("robots", cls._instance._on_remote_change)
+            websocket_manager.snapshot = cls._instance.get_snapshot
         for cabot_id in settings.allowed_cabot_id_list:
-            cls._instance.connected_cabots[cabot_id] = {
-                "id": cabot_id,
-                "status": "unknown",
-                "system_status": "unknown",
-                "wifi_status": "unknown",
-                "disk_usage": "unknown",
-                "last_poll": None,
-                "connected": False,
-                "images": {},
-                "env": {},
-                "all_messages": []  # Only store messages in all_messages
-            }
+            if cabot_id not in cls._instance.connected_cabots:
+                cls._instance._set_robot(cabot_id, cls._instance._new_record(cabot_id))
         return cls._instance
 
     def __init__(self):
         # Empty since initialization is done in __new__
         pass
 
-    async def _notify_state_change(self):
-        """Notify all connected dashboard clients about state changes"""
+    def _new_record(self, robot_id: str) -> RobotRecord:
+        return RobotRecord(robot_id, settings.cabot_name_map.get(robot_id, robot_id), self.MAX_MESSAGES)
+
+    def _set_robot(self, robot_id: str, record: RobotRecord):
+        """Insert or replace a robot, keeping the sorted fleet view in order"""
+        if robot_id not in self.connected_cabots:
+            bisect.insort(self._sorted_robots, (record.name, robot_id))
+        self.connected_cabots[robot_id] = record
+        self._invalidate()
+
+    def _remove_robot(self, robot_id: str):
+        record = self.connected_cabots.pop(robot_id, None)
+        self.liveness.discard(robot_id)
+        self.presence.discard(robot_id)
+        if record is not None:
+            key = (record.name, robot_id)
+            index = bisect.bisect_left(self._sorted_robots, key)
+            if index < len(self._sorted_robots) and self._sorted_robots[index] == key:
+                del self._sorted_robots[index]
+            self._invalidate()
+        return record
+
+    def _invalidate(self):
+        self._fleet_cache = None
+
+    def get_snapshot(self) -> dict:
+        """Full fleet state, sent on dashboard connect and when a client detects a version gap"""
+        return {
+            "type": "robot_state",
+            "version": self.version,
+            "cabots": self.get_connected_cabots_list(),
+            "messages": self.get_messages(limit=self.MAX_MESSAGES)
+        }
+
+    def _build_patch(self, robot_ids=(), messages: bool = False) -> dict:
+        """Build a versioned patch for the given robots
+        Args:
+            robot_ids: Robots that changed. Robots no longer in connected_cabots are reported as removed
+            messages (bool): Include the global message list
+        Returns:
+            dict: robot_patch message; clients apply it only if version == their version + 1
+        """
+        now = datetime.now(timezone.utc).timestamp()
+        cabots = []
+        removed = []
+        for robot_id in robot_ids:
+            if robot_id in self.connected_cabots:
+                cabots.append(self.connected_cabots[robot_id].to_wire(now, self.DISPLAY_MESSAGES))
+            else:
+                removed.append(robot_id)
+        self.version += 1
+        patch = {
+            "type": "robot_patch",
+            "version": self.version,
+            "cabots": cabots,
+            "removed": removed
+        }
+        if messages:
+            patch["messages"] = self.get_messages(limit=self.MAX_MESSAGES)
+        return patch
+
+    def _notify_state_change(self, *robot_ids: str):
+        """Schedule a dashboard update for the given robots
+        Args:
+            robot_ids (str): Robots that changed. Without any, only the global messages are sent
+        """
+        if robot_ids:
+            self._invalidate()
+            if self.persistence is not None:
+                for robot_id in robot_ids:
+                    record = self.connected_cabots.get(robot_id)
+                    if record is not None:
+                        self.persistence.save_robot(robot_id, record.images, record.env, record.last_poll)
+        self.notifier.mark(robot_ids, messages=not robot_ids)
+
+    async def _broadcast_changes(self, robot_ids, messages: bool):
+        """Broadcast one patch for everything that changed since the last flush"""
         try:
-            message = {
-                "type": "robot_state",
-                "cabots": self.get_connected_cabots_list(),
-                "messages": self.messages
-            }
+            message = self._build_patch(sorted(robot_ids), messages=messages)
             logger.debug(f"Broadcasting state change: {json.dumps(message, indent=2)}")
             await websocket_manager.broadcast(message)
         except Exception as e:
             logger.error(f"Error broadcasting state change: {e}")
 
+    def _replicate(self, method: str, *args):
+        """Apply the same change on the other server workers"""
+        if not self._applying_remote:
+            self.backend.publish("robots", {"method": method, "args": args})
+
+    def _on_remote_change(self, message: dict):
+        """A change made on another worker; dashboards connected here are notified as usual"""
+        method = message["method"]
+        if method not in REPLICATED_METHODS:
+            logger.warning(f"Ignoring unknown replicated change: {method}")
+            return
+        self._applying_remote = True
+        try:
+            getattr(self, method)(*message["args"])
+        finally:
+            self._applying_remote = False
+
+    def _get_or_create(self, client_id: str) -> RobotRecord:
+        record = self.connected_cabots.get(client_id)
+        if record is None:
+            record = self._new_record(client_id)
+            self._set_robot(client_id, record)
+        return record
+
     def update_robot_state(self, client_id: str, state: dict):
         logger.debug(f"Updating state for {client_id}: {state}")
-        # Get current state to preserve existing fields
-        current_state = self.connected_cabots.get(client_id, {})
-
-        # Update state while preserving messages and other fields
-        updated_state = {
-            "id": client_id,
-            "status": state.get("status", "unknown"),
-            "system_status": state.get("system_status", "unknown"),
-            "wifi_status": state.get("wifi_status", "unknown"),
-            "disk_usage": state.get("disk_usage", "unknown"),
-            "last_poll": datetime.now(timezone.utc).isoformat(),
-            "connected": True if state.get("status") == "connected" else False,
-            "images": current_state.get("images", {}),
-            "env": current_state.get("env", {}),
-            "all_messages": current_state.get("all_messages", [])  # Preserve message history
-        }
+        self._replicate("update_robot_state", client_id, state)
+        record = self._get_or_create(client_id)
+        # The fields were not reported by the robot, so its next partial report must not be merged onto them
+        record.status_seq = 0
+        self._apply_state(client_id, record, state)
 
-        self.connected_cabots[client_id] = updated_state
-        logger.debug(f"Updated connected_cabots: {self.connected_cabots}")
-        asyncio.create_task(self._notify_state_change())
+    def poll_started(self, client_id: str):
+        """The robot is waiting in a poll, so it is present until the poll can time out"""
+        self._replicate("poll_started", client_id)
+        self.presence.touch(client_id, timeout=self.POLLING_TIMEOUT + self.PRESENCE_TIMEOUT)
 
-    def update_robot_polling(self, client_id: str):
+    def poll_finished(self, client_id: str):
+        """The robot has PRESENCE_TIMEOUT to poll again before it is shown disconnected"""
+        self._replicate("poll_finished", client_id)
         if client_id in self.connected_cabots:
-            current_state = self.connected_cabots[client_id]
+            self.presence.touch(client_id)
 
-            # Create new state with all current values
-            updated_state = current_state.copy()
+    def _apply_state(self, client_id: str, record: RobotRecord, state: dict):
+        # Update fields in place, preserving messages, images and env; derived display fields are parsed here once
+        changed = record.set_poll_state(
+            state.get("status", "unknown"),
+            state.get("system_status", "unknown"),
+            True if state.get("status") == "connected" else False,
+            datetime.now(timezone.utc).isoformat()
+        )
+        metrics = state.get("metrics")
+        if isinstance(metrics, dict) and metrics:
+            changed |= record.set_metrics(metrics)
+        else:
+            # Clients without host metrics send the command output as text
+            changed |= record.set_wifi_status(state.get("wifi_status", "unknown"))
+            changed |= record.set_disk_usage(state.get("disk_usage", "unknown"))
+        self._touch(client_id)
+        # The new last_poll goes out with the next real change
+        if changed & ~LAST_POLL:
+            self._notify_state_change(client_id)
+        elif self.persistence is not None:
+            self.persistence.save_robot(client_id, record.images, record.env, record.last_poll)
+
+    def report_status(self, client_id: str, report: dict) -> Optional[int]:
+        """Apply the status a robot sends with a poll or heartbeat
+
+        Robots that number their reports (status_seq) send only the fields that changed
+        since base_seq, their last acknowledged report, and a full report with base_seq 0.
+        If base_seq is not the last report merged here (a restarted server, a report
+        that went to another worker), the fields are still applied but 0 is returned
+        so the robot sends a full report next.
+        Returns:
+            Optional[int]: Acknowledged status_seq, None for an unnumbered report
+        """
+        self._replicate("report_status", client_id, report)
+        record = self._get_or_create(client_id)
+        seq, base_seq = report.get("status_seq"), report.get("base_seq") or 0
+        if seq is None or base_seq == 0:
+            reported = report
+        else:
+            # A partial report leaves the fields it does not carry as they are on the record
+            reported = {
+                "cabot_system_status": record.system_status,
+                "cabot_wifi_status": record.wifi_status,
+                "cabot_disk_usage": record.disk_usage,
+                "cabot_metrics": record.metrics,
+            }
+            reported.update((field, report[field]) for field in STATUS_REPORT_FIELDS if field in report)
+        if seq is not None:
+            record.status_seq = seq if base_seq in (0, record.status_seq) else 0
+        self._apply_state(client_id, record, {
+            "status": "connected",
+            "system_status": reported.get("cabot_system_status", "unknown"),
+            "wifi_status": reported.get("cabot_wifi_status", "unknown"),
+            "disk_usage": reported.get("cabot_disk_usage", "unknown"),
+            "metrics": reported.get("cabot_metrics")
+        })
+        return record.status_seq if seq is not None else None
+
+    def update_robot_polling(self, client_id: str):
+        if client_id in self.connected_cabots:
+            self._replicate("update_robot_polling", client_id)
             # Update only the polling-related fields
-            updated_state.update({
-                "status": "connected",
-                'last_poll': datetime.now(timezone.utc).isoformat()
-            })
-            
-            # Update the state atomically
-            self.connected_cabots[client_id] = updated_state
+            self.connected_cabots[client_id].update(
+                status="connected",
+                last_poll=datetime.now(timezone.utc).isoformat()
+            )
+            self._touch(client_id)
 
-            asyncio.create_task(self._notify_state_change())
+            self._notify_state_change(client_id)
         else:
             logger.warning(f"Attempted to update status for unknown client: {client_id}")
             raise ValueError(f"Client {client_id} not found")
 
     def update_robot_status(self, client_id: str, status: str):
         if client_id in self.connected_cabots:
-            current_state = self.connected_cabots[client_id]
-
-            # Create new state with all current values
-            updated_state = current_state.copy()
+            self._replicate("update_robot_status", client_id, status)
             # Update only the status
-            updated_state['status'] = status
-
-            # Update the state atomically
-            self.connected_cabots[client_id] = updated_state
+            self.connected_cabots[client_id].update(status=status)
             
-            asyncio.create_task(self._notify_state_change())
+            self._notify_state_change(client_id)
         else:
             logger.warning(f"Attempted to update status for unknown client: {client_id}")
             raise ValueError(f"Client {client_id} not found")
@@ -119,23 +273,27 @@ class RobotStateManager:
         if robot_id not in self.connected_cabots:
             return
         
-        timestamp = datetime.now(timezone.utc).isoformat()
+        now = datetime.now(timezone.utc)
         new_message = {
-            'timestamp': timestamp,
+            'seq': self._next_seq(),
+            'timestamp': now.isoformat(),
             'message': message,
             'level': level
         }
-        
-        # Initialize all_messages list if it doesn't exist
-        if 'all_messages' not in self.connected_cabots[robot_id]:
-            self.connected_cabots[robot_id]['all_messages'] = []
-        
-        # Add new message to all_messages
-        self.connected_cabots[robot_id]['all_messages'].append(new_message)
-        
-        # Keep only the latest MAX_MESSAGES messages
-        if len(self.connected_cabots[robot_id]['all_messages']) > self.MAX_MESSAGES:
-            self.connected_cabots[robot_id]['all_messages'] = self.connected_cabots[robot_id]['all_messages'][-self.MAX_MESSAGES:]
+        self._add_robot_message(robot_id, new_message, now.timestamp())
+
+    def _add_robot_message(self, robot_id: str, message: dict, epoch: float):
+        if robot_id not in self.connected_cabots:
+            return
+        self._replicate("_add_robot_message", robot_id, message, epoch)
+        self.message_seq = max(self.message_seq, message["seq"])
+
+        # Add new message to all_messages, the buffer keeps only the latest MAX_MESSAGES messages
+        self.connected_cabots[robot_id].add_message(message, epoch)
+        if self.persistence is not None:
+            self.persistence.save_message(robot_id, message, epoch)
+
+        self._notify_state_change(robot_id)
 
     def update_robot_images(self, client_id: str, images: Dict[str, str]):
         """Update image tags for a robot
@@ -145,19 +303,12 @@ class RobotStateManager:
         """
         if client_id in self.connected_cabots:
             logger.info(f"Updating images for {client_id}: {images}")
-            # Get current state to preserve all fields
-            current_state = self.connected_cabots[client_id]
-
-            # Create new state with all current values
-            updated_state = current_state.copy()
+            self._replicate("update_robot_images", client_id, images)
             # Update only the images
-            updated_state['images'] = images
-
-            # Update the state atomically
-            self.connected_cabots[client_id] = updated_state
+            self.connected_cabots[client_id].update(images=images)
 
             # Ensure the state change is broadcast
-            asyncio.create_task(self._notify_state_change())
+            self._notify_state_change(client_id)
         else:
             logger.warning(f"Attempted to update images for unknown client: {client_id}")
             raise ValueError(f"Client {client_id} not found")
@@ -170,22 +321,15 @@ class RobotStateManager:
         """
         if client_id in self.connected_cabots:
             logger.info(f"Updating env for {client_id}: {env}")
-            # Get current state to preserve all fields
-            current_state = self.connected_cabots[client_id]
-
-            # Create new state with all current values
-            updated_state = current_state.copy()
+            self._replicate("update_robot_env", client_id, env)
             # for key, value in env.items():
             #     if len(value) > 25:
             #         env[key] = value[:10] + "..." + value[-10:]
             # Update only the env
-            updated_state['env'] = env
-
-            # Update the state atomically
-            self.connected_cabots[client_id] = updated_state
+            self.connected_cabots[client_id].update(env=env)
 
             # Ensure the state change is broadcast
-            asyncio.create_task(self._notify_state_change())
+            self._notify_state_change(client_id)
         else:
             logger.warning(f"Attempted to update images for unknown client: {client_id}")
             raise ValueError(f"Client {client_id} not found")
@@ -198,79 +342,94 @@ class RobotStateManager:
             Dict[str, str]: Dictionary of image name to tag mapping
         """
         if client_id in self.connected_cabots:
-            return self.connected_cabots[client_id].get('images', {})
+            return self.connected_cabots[client_id].images
         else:
             logger.warning(f"Attempted to get images for unknown client: {client_id}")
             raise ValueError(f"Client {client_id} not found")
 
     def get_connected_cabots_list(self):
-        cabot_list = []
-        current_time = datetime.now(timezone.utc)
-        
-        for robot_id, robot in self.connected_cabots.items():
-            # Get all messages and sort by timestamp in descending order
-            all_messages = sorted(robot.get('all_messages', []), key=lambda x: x['timestamp'], reverse=True)
-            
-            # For AIS panel display: Get only the latest messages within 5 minutes
-            panel_messages = []
-            for msg in all_messages:
-                try:
-                    msg_time = datetime.fromisoformat(msg['timestamp'])
-                    if (current_time - msg_time).total_seconds() <= 300:  # 5 minutes = 300 seconds
-                        panel_messages.append(msg)
-                        if len(panel_messages) >= self.DISPLAY_MESSAGES:
-                            break
-                except Exception as e:
-                    logger.error(f"Error processing message timestamp: {e}")
-            
-            wifi_status_text = robot.get('wifi_status', 'unknown')
-            if "Soft blocked: no" in wifi_status_text:
-                wifi_status = "on"
-            elif "Soft blocked: yes" in wifi_status_text:
-                wifi_status = "off"
-            else:
-                wifi_status = None
-            disk_usage_text = robot.get('disk_usage', 'unknown')
-            m = re.match(r"(\d+)%", disk_usage_text)
-            disk_usage_value = int(m.group(1)) if m else -1
-            cabot_list.append({
-                'id': robot_id,
-                'name': settings.cabot_name_map.get(robot_id, robot_id),
-                'connected': robot.get('connected', False),
-                'last_poll': robot.get('last_poll', None),
-                'messages': panel_messages,  # Latest 5 messages within 5 minutes for panel display
-                'all_messages': all_messages,  # All messages for history view
-                'images': robot.get('images', {}),
-                'env': robot.get('env', {}),
-                'system_status': robot.get('system_status', 'unknown'),  # Add system_status
-                'wifi_status': wifi_status,
-                'disk_usage': {"text": disk_usage_text, "value": disk_usage_value}
-            })
-        cabot_list.sort(key=lambda x: x['name'])
+        """Dashboard view of every robot, sorted by name
+
+        Entries are rendered once per change and cached; the list itself is rebuilt only
+        when a robot changed or a panel message aged out.
+        """
+        now = datetime.now(timezone.utc).timestamp()
+        if self._fleet_cache is not None and now < self._fleet_cache[1]:
+            return self._fleet_cache[0]
+        cabot_list = [self.connected_cabots[robot_id].to_wire(now, self.DISPLAY_MESSAGES) for _, robot_id in self._sorted_robots]
+        expires = min((self.connected_cabots[robot_id].wire_expires() for _, robot_id in self._sorted_robots), default=float("inf"))
+        self._fleet_cache = (cabot_list, expires)
         return cabot_list
 
     async def send_command(self, robot_id: str, command: Dict) -> None:
         if robot_id not in self.connected_cabots:
             raise ValueError(f"Robot {robot_id} not connected")
-        self.connected_cabots[robot_id].update({
-            'last_command': datetime.now(timezone.utc).isoformat(),
-            'last_command_type': command.get('type')
-        })
-        asyncio.create_task(self._notify_state_change())
+        self._set_last_command(robot_id, datetime.now(timezone.utc).isoformat(), command.get('type'))
+
+    def _set_last_command(self, robot_id: str, last_command: str, command_type: Optional[str]):
+        if robot_id not in self.connected_cabots:
+            return
+        self._replicate("_set_last_command", robot_id, last_command, command_type)
+        self.connected_cabots[robot_id].update(
+            last_command=last_command,
+            last_command_type=command_type
+        )
+        self._notify_state_change(robot_id)
 
     def add_message(self, client_id: str, message: str, level: str = "info"):
-        timestamp = datetime.now(timezone.utc).isoformat()
+        now = datetime.now(timezone.utc)
         
         new_message = {
-            "timestamp": timestamp,
+            "seq": self._next_seq(),
+            "timestamp": now.isoformat(),
             "client_id": client_id,
             "message": message,
             "level": level
         }
-        self.messages.append(new_message)
-        if len(self.messages) > self.MAX_MESSAGES:
-            self.messages = self.messages[-self.MAX_MESSAGES:]
-        asyncio.create_task(self._notify_state_change())
+        self._add_global_message(new_message, now.timestamp())
+
+    def _add_global_message(self, message: dict, epoch: float):
+        self._replicate("_add_global_message", message, epoch)
+        self.message_seq = max(self.message_seq, message["seq"])
+        self.messages.append(message, epoch)
+        if self.persistence is not None:
+            self.persistence.save_message(None, message, epoch)
+        self._notify_state_change()
+
+    def _next_seq(self) -> int:
+        # Microseconds since the epoch, so that workers sharing a backend do not hand out the same number
+        self.message_seq = max(self.message_seq + 1, time.time_ns() // 1000)
+        return self.message_seq
+
+    async def get_robot_messages(self, robot_id: str, limit: int, before: Optional[int] = None, level: Optional[str] = None,
+                                 since: Optional[float] = None, until: Optional[float] = None) -> dict:
+        """Get a page of a robot's message history, newest first
+        Args:
+            robot_id (str): Robot ID
+            limit (int): Maximum number of messages
+            before (int): Cursor, only messages whose seq is lower than this
+            level (str): Only messages of this level
+            since (float): Only messages at or after this epoch
+            until (float): Only messages before this epoch
+        Returns:
+            dict: {"messages": [...], "next": cursor for the following page, None at the end}
+        """
+        record = self.connected_cabots.get(robot_id)
+        messages = []
+        if record is not None:
+            messages = record.all_messages.page(limit, before, level, since, until)
+        if len(messages) < limit and self.persistence is not None:
+            # Older history only lives on disk
+            oldest = record.all_messages.oldest_seq() if record is not None else None
+            if oldest is not None:
+                before = oldest if before is None else min(before, oldest)
+            messages += await self.persistence.read_messages(robot_id, limit - len(messages), before, level, since, until)
+        elif record is None:
+            raise ValueError(f"Client {robot_id} not found")
+        return {
+            "messages": messages,
+            "next": messages[-1].get("seq") if len(messages) >= limit else None
+        }
 
     def get_messages(self, limit: int = 5) -> list:
         """Get latest messages
@@ -279,7 +438,7 @@ class RobotStateManager:
         Returns:
             list: List of messages, newest first
         """
-        return sorted(self.messages[-limit:], key=lambda x: x['timestamp'], reverse=True)
+        return self.messages.latest(limit)
 
     @classmethod
     def get_robot_state(cls, cabot_id: str) -> dict:
@@ -287,24 +446,82 @@ class RobotStateManager:
         if not cls._instance or cabot_id not in cls._instance.connected_cabots:
             return None
 
-        robot_state = cls._instance.connected_cabots[cabot_id].copy()
-        # Sort messages by timestamp in descending order
-        robot_state["messages"] = sorted(
-            robot_state["messages"],
-            key=lambda x: x["timestamp"],
-            reverse=True
-        )
+        record = cls._instance.connected_cabots[cabot_id]
+        robot_state = record.to_dict()
+        # Messages newest first
+        robot_state["messages"] = record.all_messages.history()
         return robot_state
 
-    def disconnect_detection_handler(self):
-        changed = False
-        for robot_id, robot in self.connected_cabots.copy().items():
-            if robot_id in settings.allowed_cabot_id_list:
+    def restore(self, store: StatePersistence):
+        """Load the last saved fleet and persist every change from now on
+
+        Robots come back disconnected with their images, env and recent messages. Robots
+        that are not in the allowed list are only restored if they were seen within
+        DISCONNECT_DETECTION_SECOND, and are removed when that time runs out without a poll.
+        """
+        snapshot = store.load(self.MAX_MESSAGES)
+        now = time.time()
+        restored = []
+        for robot_id, images, env, last_poll, updated in snapshot["robots"]:
+            allowed = robot_id in settings.allowed_cabot_id_list
+            remaining = updated + self.DISCONNECT_DETECTION_SECOND - now
+            if not allowed and remaining <= 0:
                 continue
-            last_poll = robot.get("last_poll")
-            if last_poll and (datetime.now(timezone.utc) - datetime.fromisoformat(last_poll)).total_seconds() > self.DISCONNECT_DETECTION_SECOND:
-                self.connected_cabots.pop(robot_id)
-                changed = True
-                logger.info(f"Robot {robot_id} disconnected")
+            record = self.connected_cabots.get(robot_id)
+            if record is None:
+                record = self._new_record(robot_id)
+                self._set_robot(robot_id, record)
+            record.update(status="disconnected", images=images, env=env, last_poll=last_poll)
+            for epoch, message in snapshot["messages"].get(robot_id, ()):
+                record.add_message(message, epoch)
+            if not allowed:
+                self.liveness.touch(robot_id, timeout=remaining)
+            restored.append(robot_id)
+        for epoch, message in snapshot["messages"].get(None, ()):
+            self.messages.append(message, epoch)
+        self.message_seq = max(self.message_seq, snapshot["max_seq"])
+        logger.info(f"Restored {len(restored)} robots from {store.path}")
+        if restored:
+            self._notify_state_change(*restored)
+        # Attached last so restoring does not count as the robots being seen
+        self.persistence = store
+
+    def has_restored_env(self, robot_id: str) -> bool:
+        """True if the robot's env is known without asking it (restored from the state database)"""
+        record = self.connected_cabots.get(robot_id)
+        return self.persistence is not None and record is not None and bool(record.env)
+
+    async def close(self):
+        if self.persistence is not None:
+            await self.persistence.close()
+            self.persistence = None
+
+    def _touch(self, robot_id: str):
+        """Push back the robot's disconnect deadlines; allowed robots are never removed"""
+        self.presence.touch(robot_id)
+        if robot_id not in settings.allowed_cabot_id_list:
+            self.liveness.touch(robot_id)
+
+    def presence_expired_handler(self, robot_ids: List[str]):
+        """Called by the presence tracker for robots that neither reported nor waited in a poll within PRESENCE_TIMEOUT,
+        and when a robot's WebSocket channel closes
+
+        Only the connection is changed; the last reported system status stays as it was.
+        """
+        changed = [
+            robot_id for robot_id in robot_ids
+            if robot_id in self.connected_cabots and self.connected_cabots[robot_id].update(status="disconnected", connected=False)
+        ]
         if changed:
-            asyncio.run(self._notify_state_change())
\ No newline at end of file
+            logger.info(f"Robots {changed} stopped reporting")
+            self._notify_state_change(*changed)
+
+    def disconnect_detection_handler(self, robot_ids: List[str]):
+        """Called by the liveness tracker for robots that did not poll within DISCONNECT_DETECTION_SECOND"""
+        removed = []
+        for robot_id in robot_ids:
+            if self._remove_robot(robot_id) is not None:
+                removed.append(robot_id)
+                logger.info(f"Robot {robot_id} disconnected")
+        if removed:
+            self._notify_state_change(*removed)
@@ -1,8 +1,12 @@
 from fastapi import WebSocket
-from typing import List
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Set, Tuple
+from app.config import settings
 from app.services.docker_hub import DockerHubService
 from app.utils.logger import logger
 from app.services.github import fetchSiteReleases
+import asyncio
+import json
 
 
 def fix_version_order(versions):
@@ -16,16 +20,110 @@ def fix_version_order(versions):
     return result
 
 
+class DashboardConnection:
+    """Bounded outbound queue and writer task for one dashboard WebSocket
+
+    Broadcasts of a collapsible type (robot_patch) are limited to max_queue
+    entries. When the limit is reached they are all replaced by one snapshot
+    marker, and the fleet snapshot is built only when the marker is sent. Patches
+    broadcast while the marker waits are dropped, since that snapshot will include
+    them. A dashboard on a slow link therefore gets the current state without any
+    version gap. Command broadcasts (command_status, command_output) are limited
+    the same way, but replaced by a command_resync message on which the dashboard
+    fetches /api/commands/in_flight and /api/commands/output again. Other messages,
+    including snapshots sent to this dashboard (send_personal), are always
+    delivered in order.
+    """
+
+    SNAPSHOT = None  # Queue entry standing for a snapshot built at send time
+    RESYNC = json.dumps({"type": "command_resync"})
+
+    def __init__(self, manager: "ConnectionManager", websocket: WebSocket):
+        self.manager = manager
+        self.websocket = websocket
+        # (group, text): group is "snapshot" or "resync" for messages that can be replaced by that group's marker
+        self.queue: Deque[Tuple[Optional[str], Optional[str]]] = deque()
+        self.queued = {"snapshot": 0, "resync": 0}
+        self.pending: Set[str] = set()
+        self.sent = 0
+        self.collapsed = 0
+        self._ready = asyncio.Event()
+        self.task = asyncio.create_task(self._writer())
+
+    def _group(self, message_type: str, collapsible: bool) -> Optional[str]:
+        if not collapsible:
+            return None
+        if message_type in self.manager.COLLAPSIBLE_TYPES and self.manager.snapshot is not None:
+            return "snapshot"
+        if message_type in self.manager.RESYNC_TYPES:
+            return "resync"
+        return None
+
+    def enqueue(self, message_type: str, text: str, collapsible: bool = True):
+        group = self._group(message_type, collapsible)
+        if group is not None:
+            if group in self.pending:
+                self.collapsed += 1
+                return
+            if self.queued[group] >= self.manager.MAX_QUEUE:
+                kept = deque(entry for entry in self.queue if entry[0] != group)
+                self.collapsed += len(self.queue) - len(kept) + 1
+                kept.append((None, self.SNAPSHOT if group == "snapshot" else self.RESYNC))
+                self.queue = kept
+                self.queued[group] = 0
+                self.pending.add(group)
+                self._ready.set()
+                return
+            self.queued[group] += 1
+        self.queue.append((group, text))
+        self._ready.set()
+
+    async def _writer(self):
+        while True:
+            await self._ready.wait()
+            while self.queue:
+                group, text = self.queue.popleft()
+                if group is not None:
+                    self.queued[group] -= 1
+                if text is self.SNAPSHOT:
+                    self.pending.discard("snapshot")
+                    text = json.dumps(self.manager.snapshot())
+                elif text is self.RESYNC:
+                    self.pending.discard("resync")
+                if not await self.manager._send_text(self.websocket, text):
+                    self.manager.disconnect(self.websocket)
+                    return
+                self.sent += 1
+            self._ready.clear()
+
+    def stats(self) -> dict:
+        client = self.websocket.client
+        return {
+            "client": f"{client.host}:{client.port}" if client else None,
+            "queue_depth": len(self.queue),
+            "sent": self.sent,
+            "collapsed": self.collapsed
+        }
+
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        # Keyed by id(): starlette WebSockets compare by their scope and are not hashable
+        self.active_connections: Dict[int, DashboardConnection] = {}
         self.docker_hub_service = DockerHubService()
+        self.SEND_TIMEOUT = settings.ws_send_timeout
+        self.MAX_QUEUE = settings.ws_queue_size
+        self.COLLAPSIBLE_TYPES = {t.strip() for t in settings.ws_collapsible_types.split(",") if t.strip()}
+        # Command updates a dashboard can fetch again over HTTP when too many are waiting
+        self.RESYNC_TYPES = {"command_status", "command_output"}
+        # Builds the full fleet state that replaces collapsed patches (set by RobotStateManager)
+        self.snapshot: Optional[Callable[[], dict]] = None
 
     async def connect(self, websocket: WebSocket):
         try:
             await websocket.accept()
-            if websocket not in self.active_connections:
-                self.active_connections.append(websocket)
+            if id(websocket) not in self.active_connections:
+                self.active_connections[id(websocket)] = DashboardConnection(self, websocket)
                 logger.info("New WebSocket connection established")
         except Exception as e:
             logger.error(f"Error during WebSocket connection: {str(e)}")
@@ -36,24 +134,47 @@ class ConnectionManager:
 
     def disconnect(self, websocket: WebSocket):
         try:
-            if websocket in self.active_connections:
-                self.active_connections.remove(websocket)
+            connection = self.active_connections.pop(id(websocket), None)
+            if connection:
+                if connection.task is not asyncio.current_task():
+                    connection.task.cancel()
                 logger.info("WebSocket connection removed")
         except Exception as e:
             logger.error(f"Error during WebSocket disconnection: {str(e)}")
 
     async def broadcast(self, message: dict):
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting message: {str(e)}")
-                disconnected.append(connection)
-
-        # Clean up disconnected connections
-        for connection in disconnected:
-            self.disconnect(connection)
+        if not self.active_connections:
+            return
+        # Serialize once and hand the text to each dashboard's own queue, so a slow browser only delays itself
+        text = json.dumps(message)
+        for connection in self.active_connections.values():
+            connection.enqueue(message.get("type"), text)
+
+    async def send_personal(self, websocket: WebSocket, message: dict):
+        connection = self.active_connections.get(id(websocket))
+        if connection:
+            # Replies, snapshots included, are never collapsed: a dashboard waiting for a snapshot would wait forever
+            connection.enqueue(message.get("type"), json.dumps(message), collapsible=False)
+
+    async def _send_text(self, websocket: WebSocket, text: str) -> bool:
+        try:
+            await asyncio.wait_for(websocket.send_text(text), timeout=self.SEND_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"WebSocket send timed out after {self.SEND_TIMEOUT}s, closing slow connection")
+            asyncio.create_task(self._close(websocket))
+        except Exception as e:
+            logger.error(f"Error sending message: {str(e)}")
+        return False
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    def stats(self) -> list:
+        return [connection.stats() for connection in self.active_connections.values()]
 
     async def handle_refresh_tags(self, data: dict) -> dict:
         try:
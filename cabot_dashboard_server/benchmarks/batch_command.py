@@ -0,0 +1,85 @@
+"""Time queueing one action for a fleet, robot by robot vs as one batch
+
+Usage (from cabot_dashboard_server):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/batch_command.py --robots 40
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/batch_command.py --url redis://localhost:6379/15
+
+"per robot" is what the dashboard did before: one queue_fleet_command (one
+backend round-trip and one published message) per selected robot. "batch" is one
+queue_fleet_command for all of them. Runs on the in-memory backend and on
+RedisBackend (an in-process FakeRedisServer unless --url is given), and checks
+that every robot got the command exactly once.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.routers.dashboard import queue_fleet_command  # noqa: E402
+from app.services.backend import InMemoryBackend, RedisBackend  # noqa: E402
+from app.services.command_queue import LANES, CommandQueueManager  # noqa: E402
+from fake_redis import FakeRedisServer  # noqa: E402
+from app.services.robot_state import RobotStateManager  # noqa: E402
+
+
+async def drain(commands: CommandQueueManager, robot_ids):
+    for robot_id in robot_ids:
+        assert await commands.backend.pop_command(robot_id, LANES) is not None, robot_id
+        assert await commands.backend.pop_command(robot_id, LANES) is None, robot_id
+
+
+async def measure(backend, robots: RobotStateManager, robot_ids, rounds: int):
+    commands = CommandQueueManager(backend)
+    await backend.start()
+    per_robot, batch = [], []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for robot_id in robot_ids:
+            await queue_fleet_command(robots, commands, "ros_start", {}, [robot_id])
+        per_robot.append(time.perf_counter() - started)
+        await drain(commands, robot_ids)
+
+        started = time.perf_counter()
+        result = await queue_fleet_command(robots, commands, "ros_start", {}, robot_ids)
+        batch.append(time.perf_counter() - started)
+        assert result["accepted"] == robot_ids
+        await drain(commands, robot_ids)
+    await backend.close()
+    return sorted(per_robot)[len(per_robot) // 2] * 1000, sorted(batch)[len(batch) // 2] * 1000
+
+
+async def run(url: str, robot_count: int, rounds: int):
+    robots = RobotStateManager()
+    robot_ids = [f"cabot_{n}" for n in range(robot_count)]
+    for robot_id in robot_ids:
+        robots.update_robot_state(robot_id, {"status": "connected", "system_status": "inactive"})
+
+    server = None
+    if not url:
+        server = FakeRedisServer()
+        await server.start()
+        url = server.url
+
+    print(f"ros_start for {robot_count} robots, median of {rounds} rounds")
+    print(f"{'backend':28} {'per robot ms':>13} {'batch ms':>9}")
+    for name, backend in (("memory", InMemoryBackend()), (f"redis {url}", RedisBackend(url))):
+        per_robot, batch = await measure(backend, robots, robot_ids, rounds)
+        print(f"{name:28} {per_robot:13.3f} {batch:9.3f}")
+    if server is not None:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="", help="redis:// URL of a real server (default: in-process fake)")
+    parser.add_argument("--robots", type=int, default=40)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.robots, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
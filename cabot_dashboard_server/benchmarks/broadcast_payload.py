@@ -0,0 +1,77 @@
+"""Compare full-snapshot and delta broadcasts per robot poll
+
+Usage (from cabot_dashboard_server):
+    python benchmarks/broadcast_payload.py --robots 60 --polls 500
+
+For every simulated poll, one robot's state changes and the payload that would be
+sent to each dashboard is serialized. "full" is the fleet snapshot that used to be
+broadcast on every change, "delta" is the robot_patch used now.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.robot_state import RobotStateManager  # noqa: E402
+from app.services.message_buffer import MessageBuffer  # noqa: E402
+
+
+def populate(manager: RobotStateManager, robots: int, messages: int):
+    now = datetime.now(timezone.utc)
+    for i in range(robots):
+        robot_id = f"cabot_{i + 1}"
+        manager.update_robot_state(robot_id, {
+            "status": "connected",
+            "system_status": "active",
+            "wifi_status": "0: phy0: Wireless LAN\n\tSoft blocked: no\n\tHard blocked: no",
+            "disk_usage": "42%"
+        })
+        robot = manager.connected_cabots[robot_id]
+        robot.images = {f"cabot-image-{n}": "v3.0.1" for n in range(12)}
+        robot.env = {f"CABOT_ENV_{n}": f"value-{n}" for n in range(30)}
+        robot.all_messages = MessageBuffer(messages)
+        for n in range(messages):
+            robot.add_message({"timestamp": now.isoformat(), "message": f"message {n} from {robot_id}", "level": "info"}, now.timestamp())
+
+
+def run(manager: RobotStateManager, polls: int, build):
+    robot_ids = list(manager.connected_cabots.keys())
+    total_bytes = 0
+    started = time.process_time()
+    for _ in range(polls):
+        robot_id = random.choice(robot_ids)
+        manager.connected_cabots[robot_id].update(last_poll=datetime.now(timezone.utc).isoformat())
+        manager._invalidate()
+        total_bytes += len(json.dumps(build(robot_id)).encode())
+    elapsed = time.process_time() - started
+    return total_bytes / polls, elapsed / polls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--robots", type=int, default=60)
+    parser.add_argument("--polls", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=100, help="history entries per robot")
+    args = parser.parse_args()
+
+    manager = RobotStateManager()
+    manager.connected_cabots.clear()
+    populate(manager, args.robots, args.messages)
+
+    full_bytes, full_cpu = run(manager, args.polls, lambda robot_id: manager.get_snapshot())
+    delta_bytes, delta_cpu = run(manager, args.polls, lambda robot_id: manager._build_patch([robot_id]))
+
+    print(f"robots={args.robots} polls={args.polls} messages/robot={args.messages}")
+    print(f"{'path':<8}{'bytes/poll':>14}{'cpu us/poll':>14}")
+    print(f"{'full':<8}{full_bytes:>14.0f}{full_cpu * 1e6:>14.1f}")
+    print(f"{'delta':<8}{delta_bytes:>14.0f}{delta_cpu * 1e6:>14.1f}")
+    print(f"reduction: {full_bytes / delta_bytes:.1f}x bytes, {full_cpu / delta_cpu:.1f}x cpu")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Show when a ros-stop reaches a robot that has a command backlog
+
+Usage (from cabot_dashboard_server):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/command_lanes.py --backlog 20
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/command_lanes.py --url redis://localhost:6379/15
+
+A robot has a backlog of software_update / get-image-tags / ros-start commands
+when a ros-stop is queued. The robot takes one command per poll and spends
+--exec-ms on each. "fifo" puts every command in one lane (the old behavior),
+"lanes" uses the priority lanes, and "lanes+preempt" also lets the stop drop the
+queued ros-start. Reports after how many polls the stop was dispatched and the
+per-lane queue wait recorded by CommandQueueManager.
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services import command_queue  # noqa: E402
+from app.services.backend import InMemoryBackend, RedisBackend  # noqa: E402
+from app.services.command_queue import CommandQueueManager  # noqa: E402
+from fake_redis import FakeRedisServer  # noqa: E402
+
+BACKLOG = ["software_update", "get-image-tags", "ros-start"]
+
+
+async def measure(backend, backlog: int, exec_ms: float, lanes: bool, preempt: bool):
+    saved = dict(command_queue.COMMAND_LANES)
+    if not lanes:
+        command_queue.COMMAND_LANES.clear()
+    try:
+        commands = CommandQueueManager(backend)
+        commands.PREEMPTION = preempt
+        await backend.start()
+        for n in range(backlog):
+            # Distinct options so the backlog does not collapse into one command per type
+            await commands.add_command("cabot_1", {"command": BACKLOG[n % len(BACKLOG)], "commandOption": {"n": n}})
+        await commands.add_command("cabot_1", {"command": "ros-stop", "commandOption": {}})
+
+        polls, stop_poll = 0, None
+        while True:
+            try:
+                command = await asyncio.wait_for(commands.wait_for_update("cabot_1"), 0.2)
+            except asyncio.TimeoutError:
+                break
+            polls += 1
+            if command["command"] == "ros-stop":
+                stop_poll = polls
+            await asyncio.sleep(exec_ms / 1000)
+        await backend.close()
+        return stop_poll, polls, commands.stats()
+    finally:
+        command_queue.COMMAND_LANES.update(saved)
+
+
+async def run(url: str, backlog: int, exec_ms: float):
+    server = None
+    if not url:
+        server = FakeRedisServer()
+        await server.start()
+        url = server.url
+
+    print(f"ros-stop queued behind {backlog} commands, {exec_ms:g} ms per command")
+    print(f"{'backend':8} {'mode':14} {'stop at poll':>12} {'polls':>6} {'stop wait ms':>13} {'preempted':>10}")
+    for name, make_backend in (("memory", InMemoryBackend), ("redis", lambda: RedisBackend(url))):
+        for mode, lanes, preempt in (("fifo", False, False), ("lanes", True, False), ("lanes+preempt", True, True)):
+            stop_poll, polls, stats = await measure(make_backend(), backlog, exec_ms, lanes, preempt)
+            # Without lanes the stop is the last command out of the single lane, so its wait is that lane's max
+            wait = (stats["safety"] if lanes else stats["control"])["wait_ms_max"]
+            preempted = sum(lane_stats["preempted"] for lane_stats in stats.values())
+            print(f"{name:8} {mode:14} {stop_poll:12d} {polls:6d} {wait:13.1f} {preempted:10d}")
+    if server is not None:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="", help="redis:// URL of a real server (default: in-process fake)")
+    parser.add_argument("--backlog", type=int, default=20)
+    parser.add_argument("--exec-ms", type=float, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.backlog, args.exec_ms))
+
+
+if __name__ == "__main__":
+    main()
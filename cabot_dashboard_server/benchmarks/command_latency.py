@@ -0,0 +1,70 @@
+"""Measure command round-trips as recorded by the server's CommandTracker
+
+Usage (from cabot_dashboard_server):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/command_latency.py --commands 10
+
+Runs the server with uvicorn on a local port and the real CabotDashboardClient
+against it, with system commands replaced by a sleep of --exec-ms, so the
+client's handle_command echoes the commandId in its statuses as in production.
+Queues ros-start / ros-stop commands and prints the per-stage means and the
+outcome counts from /api/commands/latency, for long-polling and the WebSocket.
+"""
+import argparse
+import asyncio
+import time
+
+import harness
+from app.dependencies import command_queue_manager
+
+
+async def measure(url: str, use_websocket: bool, commands: int, exec_ms: float):
+    robot_id = f"bench_{'ws' if use_websocket else 'poll'}"
+    client = harness.robot_client(robot_id, url, use_websocket=use_websocket, polling_interval=0.1)
+
+    async def execute(command, on_output=None):
+        await asyncio.sleep(exec_ms / 1000)
+        return True, "ok"
+
+    async def collect_status():
+        return {"cabot_system_status": "inactive", "cabot_disk_usage": "42%", "cabot_wifi_status": "unknown"}
+
+    client.system_command.execute = execute
+    client.collect_status = collect_status
+    tracker = command_queue_manager.tracker
+    task = asyncio.ensure_future(client.run())
+    await asyncio.sleep(1.5)  # connect and the get-env for a new robot
+    tracker.histograms.clear()
+    tracker.outcomes.clear()
+
+    for n in range(commands):
+        await command_queue_manager.add_command(robot_id, {"command": "ros-start" if n % 2 == 0 else "ros-stop", "commandOption": {"n": n}})
+        await asyncio.sleep(0.3)
+    deadline = time.perf_counter() + 10
+    while tracker.in_flight.get(robot_id) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    await harness.stop(task)
+    return tracker.get_latency()
+
+
+async def run(commands: int, exec_ms: float):
+    async with harness.serve() as url:
+        print(f"{commands} commands 0.3 s apart, {exec_ms:g} ms each on the robot")
+        print(f"{'channel':10} {'command':10} {'queue ms':>9} {'start ms':>9} {'run ms':>8} {'total ms':>9}  outcomes")
+        for name, use_websocket in (("long-poll", False), ("websocket", True)):
+            latency = await measure(url, use_websocket, commands, exec_ms)
+            for command, result in latency.items():
+                means = [result["stages"][stage]["mean_ms"] for stage in ("queue", "start", "run", "total")]
+                print(f"{name:10} {command:10} " + " ".join(f"{mean:9.1f}" if mean is not None else f"{'-':>9}" for mean in means)
+                      + f"  {result['outcomes']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commands", type=int, default=10)
+    parser.add_argument("--exec-ms", type=float, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.commands, args.exec_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Compare the idle cost of parked robot long-polls
+
+Usage (from cabot_dashboard_server):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/command_wait_idle.py --polls 500 --seconds 5
+
+Every robot keeps one /api/client/poll request parked in wait_for_update. "legacy"
+is the previous implementation that woke up every second to check for supersession
+and timeout, "event" is the current CommandQueueManager that sleeps on a future
+until a command, a superseding poll, removal or the timeout resolves it.
+Reports process CPU time and event-loop callbacks while nothing is happening, then
+the delay between add_command and the parked poll returning.
+"""
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.command_queue import CommandQueueManager  # noqa: E402
+
+
+class LegacyCommandQueueManager:
+    """wait_for_update as it was before the queue became event-driven"""
+
+    def __init__(self, poll_timeout: float):
+        self.command_queues = {}
+        self.command_requests = {}
+        self.POLL_TIMEOUT = poll_timeout
+
+    async def initialize_client(self, client_id: str) -> None:
+        if client_id not in self.command_queues:
+            self.command_queues[client_id] = asyncio.Queue()
+
+    async def add_command(self, client_id: str, command: dict) -> None:
+        if client_id not in self.command_queues:
+            await self.initialize_client(client_id)
+        await self.command_queues[client_id].put(command)
+
+    async def wait_for_update(self, client_id: str) -> dict:
+        if client_id not in self.command_queues:
+            await self.initialize_client(client_id)
+        request_id = uuid.uuid4().hex
+        self.command_requests[client_id] = request_id
+        started = time.time()
+        while True:
+            try:
+                return await asyncio.wait_for(self.command_queues[client_id].get(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+            if self.command_requests[client_id] != request_id:
+                raise ConnectionResetError(f"Client {client_id} request {request_id} closed")
+            if time.time() - started > self.POLL_TIMEOUT:
+                raise asyncio.TimeoutError(f"Client {client_id} request {request_id} timeout")
+
+
+class CountingPolicy(asyncio.DefaultEventLoopPolicy):
+    """Event loop whose scheduled callbacks can be counted"""
+
+    def new_event_loop(self):
+        loop = super().new_event_loop()
+        loop.callbacks = 0
+        call_soon = loop.call_soon
+        call_at = loop.call_at
+
+        def counting_call_soon(*args, **kwargs):
+            loop.callbacks += 1
+            return call_soon(*args, **kwargs)
+
+        def counting_call_at(*args, **kwargs):
+            loop.callbacks += 1
+            return call_at(*args, **kwargs)
+
+        loop.call_soon = counting_call_soon
+        loop.call_at = counting_call_at
+        return loop
+
+
+async def measure(manager, polls: int, seconds: float):
+    loop = asyncio.get_running_loop()
+    clients = [f"cabot_{i + 1}" for i in range(polls)]
+    tasks = [asyncio.ensure_future(manager.wait_for_update(client_id)) for client_id in clients]
+    await asyncio.sleep(0.1)
+
+    callbacks = loop.callbacks
+    cpu = time.process_time()
+    await asyncio.sleep(seconds)
+    idle_cpu = time.process_time() - cpu
+    idle_callbacks = loop.callbacks - callbacks
+
+    delays = []
+    for client_id, task in zip(clients[:50], tasks):
+        started = time.perf_counter()
+        await manager.add_command(client_id, {"command": "ros_stop", "commandOption": {}})
+        await task
+        delays.append(time.perf_counter() - started)
+    for task in tasks[50:]:
+        task.cancel()
+    await asyncio.gather(*tasks[50:], return_exceptions=True)
+    delays.sort()
+    return idle_cpu, idle_callbacks, delays[len(delays) // 2], delays[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--polls", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    asyncio.set_event_loop_policy(CountingPolicy())
+    print(f"{args.polls} parked polls, {args.seconds:.0f}s idle")
+    print(f"{'':8} {'cpu ms':>10} {'callbacks/s':>12} {'wake p50 ms':>12} {'wake max ms':>12}")
+    for name, factory in (("legacy", lambda: LegacyCommandQueueManager(3600)), ("event", CommandQueueManager)):
+        manager = factory()
+        manager.POLL_TIMEOUT = 3600
+        idle_cpu, idle_callbacks, p50, worst = asyncio.run(measure(manager, args.polls, args.seconds))
+        print(f"{name:8} {idle_cpu * 1000:10.1f} {idle_callbacks / args.seconds:12.0f} {p50 * 1000:12.3f} {worst * 1000:12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+from collections import deque
+from typing import Deque, Dict, Optional, Set
+from app.services.resp import RespError, encode_reply, read_value
+from app.utils.logger import logger
+import asyncio
+
+
+class FakeRedisServer:
+    """In-process Redis-protocol server for trying RedisBackend without Redis
+
+    Supports the commands the backend uses (lists, hashes, PUBLISH/SUBSCRIBE) on a
+    single database. Start it on the running loop and point several backends at
+    f"redis://127.0.0.1:{server.port}" to simulate workers:
+
+        server = FakeRedisServer()
+        await server.start()
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.lists: Dict[bytes, Deque[bytes]] = {}
+        self.hashes: Dict[bytes, Dict[bytes, bytes]] = {}
+        self.channels: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Closing the sockets ends the handlers
+            for writer in self._handlers.values():
+                writer.close()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        handler = asyncio.current_task()
+        self._handlers[handler] = writer
+        try:
+            while True:
+                request = await read_value(reader)
+                if not isinstance(request, list) or not request:
+                    writer.write(encode_reply(RespError("ERR invalid request")))
+                    continue
+                writer.write(self._execute(request[0].decode().upper(), request[1:], writer))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        except Exception as e:
+            logger.error(f"Fake Redis server error: {e}")
+        finally:
+            self._handlers.pop(handler, None)
+            for subscribers in self.channels.values():
+                subscribers.discard(writer)
+            writer.close()
+
+    def _execute(self, command: str, args: list, writer: asyncio.StreamWriter) -> bytes:
+        if command in ("PING", "SELECT", "AUTH"):
+            return encode_reply("PONG" if command == "PING" else "OK")
+        if command == "RPUSH":
+            queue = self.lists.setdefault(args[0], deque())
+            queue.extend(args[1:])
+            return encode_reply(len(queue))
+        if command == "LPOP":
+            queue = self.lists.get(args[0])
+            value = queue.popleft() if queue else None
+            if queue is not None and not queue:
+                del self.lists[args[0]]
+            return encode_reply(value)
+        if command == "LRANGE":
+            items = list(self.lists.get(args[0], ()))
+            start, stop = int(args[1]), int(args[2])
+            return encode_reply(items[start:stop + 1 if stop != -1 else None])
+        if command == "LREM":
+            queue = self.lists.get(args[0])
+            count, removed = int(args[1]), 0
+            if queue is not None:
+                kept = deque()
+                for item in queue:
+                    if item == args[2] and (count <= 0 or removed < count):
+                        removed += 1
+                    else:
+                        kept.append(item)
+                if kept:
+                    self.lists[args[0]] = kept
+                else:
+                    del self.lists[args[0]]
+            return encode_reply(removed)
+        if command == "LLEN":
+            return encode_reply(len(self.lists.get(args[0], ())))
+        if command == "DEL":
+            removed = 0
+            for key in args:
+                removed += (self.lists.pop(key, None) is not None) + (self.hashes.pop(key, None) is not None)
+            return encode_reply(removed)
+        if command == "HSET":
+            fields = self.hashes.setdefault(args[0], {})
+            added = 0
+            for field, value in zip(args[1::2], args[2::2]):
+                added += field not in fields
+                fields[field] = value
+            return encode_reply(added)
+        if command == "HGET":
+            return encode_reply(self.hashes.get(args[0], {}).get(args[1]))
+        if command == "HDEL":
+            fields = self.hashes.get(args[0], {})
+            return encode_reply(sum(fields.pop(field, None) is not None for field in args[1:]))
+        if command == "PUBLISH":
+            subscribers = self.channels.get(args[0], ())
+            for subscriber in subscribers:
+                subscriber.write(encode_reply([b"message", args[0], args[1]]))
+            return encode_reply(len(subscribers))
+        if command == "SUBSCRIBE":
+            replies = []
+            for channel in args:
+                self.channels.setdefault(channel, set()).add(writer)
+                replies.append(encode_reply([b"subscribe", channel, len(replies) + 1]))
+            return b"".join(replies)
+        return encode_reply(RespError(f"ERR unknown command '{command}'"))
@@ -0,0 +1,99 @@
+"""Shared setup for the benchmarks that run the server with uvicorn and real robot clients
+
+Benchmarks put this directory on sys.path and `import harness`, which makes both
+`app` (cabot_dashboard_server) and `cabot_dashboard_client` importable:
+
+    async with harness.serve() as url:
+        client = harness.robot_client("bench", url, polling_interval=0.1)
+        task = asyncio.ensure_future(client.run())
+        ...
+        await harness.stop(task)
+"""
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+CLIENT_DIR = SERVER_DIR.parent / "cabot_dashboard_client"
+for path in (CLIENT_DIR, SERVER_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+# The server reads users.json and its templates relative to where it is started
+os.chdir(SERVER_DIR)
+
+import uvicorn  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.dependencies import command_queue_manager  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def serve(asgi_app=None):
+    """Run the server, or an ASGI wrapper around app, on a free port and yield its URL
+
+    On exit the shared client transport is closed and the long-polls still parked
+    on the server are answered, so uvicorn stops without being forced and without
+    cancelling requests in the middle.
+    """
+    import cabot_dashboard_client
+
+    server = uvicorn.Server(uvicorn.Config(asgi_app or app, host="127.0.0.1", port=free_port(), log_level="warning"))
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+    try:
+        yield f"http://127.0.0.1:{server.config.port}"
+    finally:
+        await cabot_dashboard_client.close_transport()
+        release_polls()
+        server.should_exit = True
+        await serving
+
+
+def release_polls() -> None:
+    """Answer every parked long-poll as if the robot had polled again elsewhere"""
+    for client_id in list(command_queue_manager.waiters):
+        command_queue_manager._wake(client_id, ConnectionResetError("benchmark finished"))
+
+
+def robot_client(robot_id: str, url: str, **config):
+    """A CabotDashboardClient for the server at url, with Config fields overridden by config"""
+    from cabot_dashboard_client import CabotDashboardClient
+
+    client = CabotDashboardClient(robot_id)
+    client.config.server_url = url
+    client.config.api_key = settings.api_key
+    client.config.token = "unused"  # Client routes only check the API key
+    for field, value in config.items():
+        setattr(client.config, field, value)
+    return client
+
+
+async def stop(*tasks: asyncio.Future) -> None:
+    """Cancel robot client tasks and wait until they have finished"""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def remote_exec_dir(script: str) -> str:
+    """Change to a new directory whose ./remote-exec.sh is script, as the client runs it"""
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, "remote-exec.sh"), "w") as f:
+        f.write(script)
+    os.chmod(os.path.join(workdir, "remote-exec.sh"), 0o755)
+    os.chdir(workdir)
+    return workdir
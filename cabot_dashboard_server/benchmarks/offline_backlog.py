@@ -0,0 +1,91 @@
+"""Replay the backlog an offline robot builds up, with and without queue hygiene
+
+Usage (from cabot_dashboard_server):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/offline_backlog.py --hours 2
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/offline_backlog.py --url redis://localhost:6379/15
+
+While the robot is offline a dashboard asks for get-env and get-image-tags every
+few minutes and someone retries ros-start now and then; each of those commands is
+queued with a 10 min TTL. The robot then reconnects and takes one command per
+poll, --exec-s each. "plain" is the old queue (no collapsing, no TTL, no depth
+limit); "hygiene" is the current one. The offline period is compressed into
+--replay-s seconds of real time, and the TTL with it.
+"""
+import argparse
+import asyncio
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services import command_queue  # noqa: E402
+from app.services.backend import InMemoryBackend, RedisBackend  # noqa: E402
+from app.services.command_queue import CommandQueueManager  # noqa: E402
+from fake_redis import FakeRedisServer  # noqa: E402
+
+TTL = 600
+
+
+async def replay(backend, hours: float, exec_s: float, replay_s: float, hygiene: bool, seed: int):
+    saved = set(command_queue.IDEMPOTENT_COMMANDS)
+    if not hygiene:
+        command_queue.IDEMPOTENT_COMMANDS.clear()
+    try:
+        commands = CommandQueueManager(backend)
+        if not hygiene:
+            commands.MAX_DEPTH = 10 ** 9
+        await backend.start()
+        rng = random.Random(seed)
+        scale = replay_s / (hours * 3600)
+        elapsed = 0.0
+        while elapsed < hours * 3600:
+            step = rng.uniform(60, 300)
+            elapsed += step
+            await asyncio.sleep(step * scale)
+            name = rng.choice(["get-env", "get-image-tags", "get-env", "get-image-tags", "ros-start"])
+            await commands.add_command("cabot_1", {"command": name, "commandOption": {}}, TTL * scale if hygiene else 0)
+
+        polls = 0
+        while True:
+            try:
+                await asyncio.wait_for(commands.wait_for_update("cabot_1"), 0.05)
+            except asyncio.TimeoutError:
+                break
+            polls += 1
+        await backend.close()
+        stats = commands.stats()
+        return polls, polls * exec_s, sum(s["collapsed"] for s in stats.values()), sum(s["expired"] for s in stats.values())
+    finally:
+        command_queue.IDEMPOTENT_COMMANDS.update(saved)
+
+
+async def run(url: str, hours: float, exec_s: float, replay_s: float):
+    server = None
+    if not url:
+        server = FakeRedisServer()
+        await server.start()
+        url = server.url
+
+    print(f"{hours:g} h offline, {exec_s:g} s per command after reconnecting")
+    print(f"{'backend':8} {'queue':8} {'replayed':>9} {'replay s':>9} {'collapsed':>10} {'expired':>8}")
+    for name, make_backend in (("memory", InMemoryBackend), ("redis", lambda: RedisBackend(url))):
+        for mode, hygiene in (("plain", False), ("hygiene", True)):
+            polls, seconds, collapsed, expired = await replay(make_backend(), hours, exec_s, replay_s, hygiene, seed=1)
+            print(f"{name:8} {mode:8} {polls:9d} {seconds:9.0f} {collapsed:10d} {expired:8d}")
+    if server is not None:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="", help="redis:// URL of a real server (default: in-process fake)")
+    parser.add_argument("--hours", type=float, default=2)
+    parser.add_argument("--exec-s", type=float, default=5)
+    parser.add_argument("--replay-s", type=float, default=2)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.hours, args.exec_s, args.replay_s))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Compare command dispatch over long-polling and the robot WebSocket channel
+
+Usage (from cabot_dashboard_server):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/robot_channel.py --commands 30
+
+Runs the server with uvicorn on a local port and the real CabotDashboardClient
+against it, once with long-polling and once with CABOT_DASHBOARD_USE_WEBSOCKET.
+Status collection and command execution are replaced by stubs, so only the channel
+is measured: the time from add_command on the server to handle_command on the
+robot, and the number of HTTP requests / WebSocket handshakes the robot made.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import harness
+from app.dependencies import command_queue_manager
+from app.main import app
+
+
+class CountingApp:
+    """ASGI wrapper counting robot requests by kind"""
+
+    def __init__(self, app):
+        self.app = app
+        self.counts = {"http": 0, "websocket": 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in self.counts and scope["path"].startswith("/api/client/"):
+            self.counts[scope["type"]] += 1
+        await self.app(scope, receive, send)
+
+
+async def measure(url: str, counter: CountingApp, use_websocket: bool, commands: int):
+    robot_id = f"bench_{'ws' if use_websocket else 'poll'}"
+    client = harness.robot_client(robot_id, url, token_type="bearer", use_websocket=use_websocket, polling_interval=1)
+    received = {}
+
+    async def collect_status():
+        return {"cabot_system_status": "inactive", "cabot_disk_usage": "42%", "cabot_wifi_status": "unknown"}
+
+    async def handle_command(session, command, websocket=None):
+        if "n" in command.get("commandOption", {}):
+            received[command["commandOption"]["n"]] = time.perf_counter()
+
+    client.collect_status = collect_status
+    client.handle_command = handle_command
+    task = asyncio.ensure_future(client.run())
+    await asyncio.sleep(1.5)  # connect, first poll / channel setup and the get-env for a new robot
+    received.clear()
+    counts = dict(counter.counts)
+
+    sent = {}
+    for n in range(commands):
+        await asyncio.sleep(random.uniform(0.1, 1.5))
+        sent[n] = time.perf_counter()
+        await command_queue_manager.add_command(robot_id, {"command": "ros-stop", "commandOption": {"n": n}})
+    deadline = time.perf_counter() + 10
+    while len(received) < commands and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    await harness.stop(task)
+
+    latency = sorted((received[n] - sent[n]) * 1000 for n in received)
+    return {
+        "delivered": len(latency),
+        "p50": latency[len(latency) // 2],
+        "p95": latency[int(len(latency) * 0.95)],
+        "max": latency[-1],
+        "http": counter.counts["http"] - counts["http"],
+        "websocket": counter.counts["websocket"] - counts["websocket"],
+    }
+
+
+async def run(commands: int):
+    counter = CountingApp(app)
+    async with harness.serve(counter) as url:
+        print(f"{commands} commands at random 0.1-1.5s intervals, polling_interval 1s")
+        print(f"{'':10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'http req':>9} {'ws open':>8}")
+        for name, use_websocket in (("long-poll", False), ("websocket", True)):
+            result = await measure(url, counter, use_websocket, commands)
+            print(f"{name:10} {result['p50']:8.1f} {result['p95']:8.1f} {result['max']:8.1f} {result['http']:9d} {result['websocket']:8d}"
+                  + ("" if result["delivered"] == commands else f"  ({result['delivered']} delivered)"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commands", type=int, default=30)
+    args = parser.parse_args()
+    os.environ.setdefault("CABOT_DASHBOARD_LOG_LEVEL", "WARNING")
+    asyncio.run(run(args.commands))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Compare the dict-per-robot state model with RobotRecord
+
+Usage (from cabot_dashboard_server):
+    python benchmarks/robot_state_memory.py --polls 2000
+
+"dict" replays the previous model, where every poll built a new dict for the robot
+(or copied the old one) and reassigned it. "record" updates a RobotRecord in place.
+For 100 and 1,000 robots it reports the memory retained by the fleet state and the
+bytes allocated and time spent per poll (one poll = the update at the start of the
+request and the one in its finally block).
+"""
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.message_buffer import MessageBuffer  # noqa: E402
+from app.services.robot_record import RobotRecord, parse_disk_usage, parse_wifi_status  # noqa: E402
+
+WIFI = "0: phy0: Wireless LAN\n\tSoft blocked: no\n\tHard blocked: no"
+
+
+def dict_update(cabots: dict, client_id: str, state: dict):
+    current_state = cabots.get(client_id, {})
+    all_messages = current_state.get("all_messages")
+    cabots[client_id] = {
+        "id": client_id,
+        "status": state.get("status", "unknown"),
+        "system_status": state.get("system_status", "unknown"),
+        "wifi_status": state.get("wifi_status", "unknown"),
+        "disk_usage": state.get("disk_usage", "unknown"),
+        "last_poll": datetime.now(timezone.utc).isoformat(),
+        "connected": True if state.get("status") == "connected" else False,
+        "images": current_state.get("images", {}),
+        "env": current_state.get("env", {}),
+        "all_messages": MessageBuffer(100) if all_messages is None else all_messages
+    }
+
+
+def record_update(cabots: dict, client_id: str, state: dict):
+    record = cabots.get(client_id)
+    if record is None:
+        record = cabots[client_id] = RobotRecord(client_id, client_id, 100)
+    record.set_poll_state(
+        state.get("status", "unknown"),
+        state.get("system_status", "unknown"),
+        True if state.get("status") == "connected" else False,
+        datetime.now(timezone.utc).isoformat()
+    )
+    record.set_wifi_status(state.get("wifi_status", "unknown"))
+    record.set_disk_usage(state.get("disk_usage", "unknown"))
+
+
+def poll(update, cabots: dict, client_id: str):
+    update(cabots, client_id, {"status": "connected", "system_status": "active", "wifi_status": WIFI, "disk_usage": "42%"})
+    update(cabots, client_id, {"status": "disconnected", "system_status": "unknown"})
+
+
+def measure(update, robots: int, polls: int):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    cabots = {}
+    robot_ids = [f"cabot_{i + 1}" for i in range(robots)]
+    for robot_id in robot_ids:
+        poll(update, cabots, robot_id)
+    retained = tracemalloc.get_traced_memory()[0] - before
+
+    allocated = 0
+    for _ in range(polls):
+        robot_id = random.choice(robot_ids)
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        poll(update, cabots, robot_id)
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    # Timing without tracemalloc overhead
+    started = time.perf_counter()
+    for _ in range(polls):
+        poll(update, cabots, random.choice(robot_ids))
+    untraced = time.perf_counter() - started
+    return retained, allocated / polls, untraced / polls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--polls", type=int, default=2000)
+    args = parser.parse_args()
+
+    # Parsing is part of the record path, make sure both helpers are warmed up
+    parse_wifi_status(WIFI), parse_disk_usage("42%")
+
+    print(f"{'robots':>7} {'model':<7}{'retained KiB':>14}{'bytes/poll':>12}{'us/poll':>10}")
+    for robots in (100, 1000):
+        for name, update in (("dict", dict_update), ("record", record_update)):
+            retained, per_poll, seconds = measure(update, robots, args.polls)
+            print(f"{robots:>7} {name:<7}{retained / 1024:>14.1f}{per_poll:>12.0f}{seconds * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Check and time two server workers sharing state through RedisBackend
+
+Usage (from cabot_dashboard_server):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/shared_backend.py --rounds 200
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/shared_backend.py --url redis://localhost:6379/15
+
+Without --url an in-process FakeRedisServer is started. Worker A parks a robot's
+long-poll and worker B queues a command for it; then a robot update and a message
+made on A have to show up in B's state. Reports the latency of both paths.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.backend import RedisBackend  # noqa: E402
+from app.services.command_queue import CommandQueueManager  # noqa: E402
+from fake_redis import FakeRedisServer  # noqa: E402
+from app.services.robot_state import RobotStateManager  # noqa: E402
+
+
+class Worker:
+    """The per-process singletons of one uvicorn worker"""
+
+    def __init__(self, url: str):
+        self.backend = RedisBackend(url)
+        self.commands = CommandQueueManager(self.backend)
+        RobotStateManager._instance = None
+        self.robots = RobotStateManager()
+        self.robots.backend = self.backend
+        self.backend.subscribe("robots", self.robots._on_remote_change)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+def latest_message(worker: Worker, robot_id: str):
+    record = worker.robots.connected_cabots.get(robot_id)
+    latest = record.all_messages.latest(1) if record is not None else []
+    return latest[0]["message"] if latest else None
+
+
+async def wait_until(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("change did not reach the other worker")
+        await asyncio.sleep(0.0002)
+
+
+async def run(url: str, rounds: int):
+    server = None
+    if not url:
+        server = FakeRedisServer()
+        await server.start()
+        url = server.url
+    a, b = Worker(url), Worker(url)
+    await a.backend.start()
+    await b.backend.start()
+    await asyncio.sleep(0.1)  # Let both subscriptions settle
+
+    wake = []
+    for n in range(rounds):
+        poll = asyncio.ensure_future(a.commands.wait_for_update("cabot_1"))
+        await asyncio.sleep(0.001)
+        started = time.perf_counter()
+        await b.commands.add_command("cabot_1", {"command": "ros_stop", "commandOption": {"n": n}})
+        command = await asyncio.wait_for(poll, 5)
+        wake.append(time.perf_counter() - started)
+        assert command["commandOption"]["n"] == n
+
+    replicate = []
+    for n in range(rounds):
+        started = time.perf_counter()
+        a.robots.update_robot_state("cabot_1", {"status": "connected", "system_status": "active", "disk_usage": f"{n % 100}%"})
+        a.robots.update_robot_message("cabot_1", f"message {n}")
+        await wait_until(lambda: latest_message(b, "cabot_1") == f"message {n}")
+        replicate.append(time.perf_counter() - started)
+    assert b.robots.connected_cabots["cabot_1"].disk_usage == f"{(rounds - 1) % 100}%"
+
+    print(f"{rounds} rounds against {url}")
+    print(f"command queued on B -> poll on A returns: p50 {percentile(wake, 0.5):.3f}ms p99 {percentile(wake, 0.99):.3f}ms")
+    print(f"update on A -> visible on B:              p50 {percentile(replicate, 0.5):.3f}ms p99 {percentile(replicate, 0.99):.3f}ms")
+    print(f"A {a.backend.stats()}")
+    print(f"B {b.backend.stats()}")
+    await a.backend.close()
+    await b.backend.close()
+    if server is not None:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="", help="redis:// URL of a real server (default: in-process fake)")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
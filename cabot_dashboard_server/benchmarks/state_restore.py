@@ -0,0 +1,74 @@
+"""Measure write-behind throughput and warm-restart time of the state database
+
+Usage (from cabot_dashboard_server):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/state_restore.py --robots 100 --history 2000
+
+Fills a throwaway database through RobotStateManager as polls and messages would,
+then restores it into a fresh manager the way the server does at startup.
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.robot_state import RobotStateManager  # noqa: E402
+from app.services.persistence import StatePersistence  # noqa: E402
+
+
+def new_manager() -> RobotStateManager:
+    RobotStateManager._instance = None
+    return RobotStateManager()
+
+
+async def fill(path: str, robots: int, history: int) -> float:
+    manager = new_manager()
+    manager.restore(StatePersistence(path, 0.1, history))
+    started = time.perf_counter()
+    for i in range(robots):
+        robot_id = f"cabot_{i + 1}"
+        manager.update_robot_state(robot_id, {"status": "connected", "system_status": "active"})
+        manager.update_robot_images(robot_id, {f"cabot-image-{n}": "v3.0.1" for n in range(12)})
+        manager.update_robot_env(robot_id, {f"CABOT_ENV_{n}": f"value-{n}" for n in range(30)})
+    for n in range(history):
+        for i in range(robots):
+            manager.update_robot_message(f"cabot_{i + 1}", f"message {n}")
+        if n % 50 == 0:
+            # Stands in for the flush timer, which a burst this size would never let run
+            await manager.persistence.flush()
+    elapsed = time.perf_counter() - started
+    store = manager.persistence
+    await manager.close()
+    print(f"flushes {store.flushes}, rows written {store.written}, dropped {store.dropped}")
+    return elapsed
+
+
+async def restore(path: str, history: int) -> float:
+    manager = new_manager()
+    started = time.perf_counter()
+    manager.restore(StatePersistence(path, 0.1, history))
+    elapsed = time.perf_counter() - started
+    await manager.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--robots", type=int, default=100)
+    parser.add_argument("--history", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "state.db")
+        elapsed = asyncio.run(fill(path, args.robots, args.history))
+        messages = args.robots * args.history
+        print(f"persisted {messages} messages in {elapsed * 1000:.0f}ms ({elapsed / messages * 1e6:.1f}us each)")
+        elapsed = asyncio.run(restore(path, args.history))
+        print(f"restored {args.robots} robots in {elapsed * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Measure status report traffic from a stable fleet, full vs change-only reports
+
+Usage (from cabot_dashboard_server):
+    CABOT_DASHBOARD_LOG_LEVEL=WARNING python benchmarks/status_reports.py --robots 10 --seconds 5
+
+Runs the server with uvicorn and --robots CabotDashboardClients over the
+WebSocket channel (heartbeat every 0.1 s) and over long-polling (a command
+queued for each robot every 0.2 s, so polls keep coming). The robots report a
+fixed status, except that one of them toggles its system status every second.
+"full" sends every field with every report (the old client), "changes" is the
+current StatusReporter. Reports the status bytes the robots sent, the
+robot_patch broadcasts dashboards received, and checks the final state.
+"""
+import argparse
+import asyncio
+import time
+
+import harness
+from app.dependencies import command_queue_manager
+from app.main import app
+from app.services.robot_state import RobotStateManager  # noqa: E402
+from app.services.websocket import manager as websocket_manager  # noqa: E402
+
+METRICS = {"disk_used_percent": 42, "wifi_enabled": True, "load_1m": 0.5, "load_5m": 0.4, "load_15m": 0.3, "cpu_count": 8,
+           "mem_total_bytes": 16 * 2 ** 30, "mem_available_bytes": 9 * 2 ** 30, "mem_used_percent": 43.8, "temperature_c": 51.0}
+
+
+class CountingApp:
+    """ASGI wrapper counting the bytes robots send on polls and WebSocket heartbeats"""
+
+    def __init__(self, app):
+        self.app = app
+        self.bytes = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["path"].startswith("/api/client/poll") or scope["path"].startswith("/api/client/ws"):
+            async def counting_receive():
+                message = await receive()
+                self.bytes += len(message.get("body", b"") or message.get("bytes", b"") or (message.get("text") or "").encode())
+                return message
+            return await self.app(scope, counting_receive, send)
+        await self.app(scope, receive, send)
+
+
+class FullReporter:
+    """The old behavior: every field, unnumbered"""
+
+    def report(self, status):
+        return dict(status)
+
+    def acknowledged(self, seq):
+        pass
+
+
+async def measure(url: str, counter: CountingApp, use_websocket: bool, full: bool, robots: int, seconds: float):
+    patches = []
+    broadcast = websocket_manager.broadcast
+
+    async def counting_broadcast(message):
+        if message.get("type") == "robot_patch":
+            patches.append(len(message["cabots"]))
+        await broadcast(message)
+
+    clients = []
+    for n in range(robots):
+        client = harness.robot_client(f"bench_{'ws' if use_websocket else 'poll'}_{'full' if full else 'changes'}_{n}", url,
+                                      use_websocket=use_websocket, heartbeat_interval=0.1, polling_interval=0)
+        client.status = {"cabot_system_status": "inactive", "cabot_metrics": METRICS}
+
+        async def collect_status(client=client):
+            return dict(client.status)
+
+        async def handle_command(transport, command, websocket=None):
+            pass
+
+        client.collect_status = collect_status
+        client.handle_command = handle_command
+        if full:
+            client.status_reporter = FullReporter()
+        clients.append(client)
+
+    tasks = [asyncio.ensure_future(client.run()) for client in clients]
+    await asyncio.sleep(1.5)  # connect and the get-env for a new robot
+    websocket_manager.broadcast = counting_broadcast
+    counter.bytes = 0
+    started = time.perf_counter()
+    next_toggle = started + 1
+    while time.perf_counter() - started < seconds:
+        if not use_websocket:
+            for n, client in enumerate(clients):
+                await command_queue_manager.add_command(client.cabot_id, {"command": "ros-stop", "commandOption": {"n": n, "at": time.time()}})
+        if time.perf_counter() >= next_toggle:
+            status = clients[0].status
+            status["cabot_system_status"] = "active" if status["cabot_system_status"] == "inactive" else "inactive"
+            next_toggle += 1
+        await asyncio.sleep(0.2)
+    await asyncio.sleep(0.5)
+    sent, robot_updates = counter.bytes, sum(patches)
+    websocket_manager.broadcast = broadcast
+
+    for client in clients:
+        state = RobotStateManager.get_robot_state(client.cabot_id)
+        assert state["metrics"] == METRICS, state
+    assert RobotStateManager.get_robot_state(clients[0].cabot_id)["system_status"] in ("active", "inactive")
+    await harness.stop(*tasks)
+    return sent, robot_updates
+
+
+async def run(robots: int, seconds: float):
+    counter = CountingApp(app)
+    async with harness.serve(counter) as url:
+        print(f"{robots} robots for {seconds:g} s, one toggling its system status every second")
+        print(f"{'channel':10} {'reports':8} {'status bytes':>13} {'robot updates':>14}")
+        for channel, use_websocket in (("websocket", True), ("long-poll", False)):
+            for name, full in (("full", True), ("changes", False)):
+                sent, robot_updates = await measure(url, counter, use_websocket, full, robots, seconds)
+                print(f"{channel:10} {name:8} {sent:13d} {robot_updates:14d}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--robots", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.robots, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
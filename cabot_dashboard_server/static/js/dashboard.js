@@ -9,8 +9,20 @@ let totalRobots = 0;
 let reconnectAttempts = 0;
 let connectionTimeout = null;
 let lastData = null;
+// Local copy of the fleet, kept in sync by robot_state snapshots and robot_patch deltas
+let robotModel = new Map();
+let globalMessages = [];
+let stateVersion = null;
+let awaitingSnapshot = false;
+let snapshotRetryTimer = null;
+// Queued and running commands per robot, from /api/commands/in_flight and command_status messages
+let inFlightCommands = {};
+// Output of each robot's latest streamed command, from /api/commands/output and command_output messages
+let commandOutput = {};
+const OUTPUT_TAIL_LINES = 200;
 const MAX_RECONNECT_ATTEMPTS = 3;
 const CONNECTION_TIMEOUT_MS = 10000; // 10 seconds
+const SNAPSHOT_RETRY_MS = 5000; // Ask again if a requested snapshot has not arrived
 
 // Dialog related variables
 let currentAction = null;
@@ -62,9 +74,7 @@ function initializeUI() {
     document.addEventListener('click', (e) => {
         if (e.target.closest('.view-history-btn')) {
             const button = e.target.closest('.view-history-btn');
-            const robotId = button.dataset.robotId;
-            const messages = JSON.parse(button.dataset.messages);
-            showLogDialog(robotId, messages);
+            showLogDialog(button.dataset.robotId);
         }
     });
 
@@ -159,18 +169,22 @@ function initWebSocket() {
             isConnected = true;
             reconnectAttempts = 0;
             updateConnectionStatus();
-            // Request initial state
-            console.log('Requesting initial state...');
-            ws.send(JSON.stringify({ type: 'refresh' }));
+            // The server sends the initial snapshot on connect; ignore patches until it arrives
+            stateVersion = null;
+            awaitingSnapshot = false;
+            clearTimeout(snapshotRetryTimer);
             setTimeout(() => {
                 refreshTags('Dockerhub1');
             }, 1000);
             onSiteUpdate();
+            loadInFlightCommands();
+            loadCommandOutput();
         };
         
         ws.onclose = (event) => {
             console.log(`WebSocket connection closed with code: ${event.code}`);
             isConnected = false;
+            clearTimeout(snapshotRetryTimer);
             updateConnectionStatus();
             
             if (event.code === 4001) {
@@ -195,16 +209,10 @@ function initWebSocket() {
 
                 switch (data.type) {
                     case 'robot_state':
-                        if (data.cabots) {
-                            if (document.getElementById("pause").checked) {
-                                lastData = data;
-                            } else {
-                                updateDashboard(data);
-                            }
-                        }
-                        if (data.messages) {
-                            updateMessageList(data.messages);
-                        }
+                        applyRobotState(data);
+                        break;
+                    case 'robot_patch':
+                        applyRobotPatch(data);
                         break;
                     case 'refresh_tags_response':
                         handleTagsResponse(data);
@@ -218,6 +226,21 @@ function initWebSocket() {
                     case 'refresh_site_response':
                         handleSiteResponse(data);
                         break;
+                    case 'batch_command_response':
+                        handleBatchCommandResponse(data);
+                        break;
+                    case 'command_status':
+                        Object.assign(inFlightCommands, data.in_flight);
+                        Object.keys(data.in_flight).forEach(updateInFlight);
+                        break;
+                    case 'command_output':
+                        Object.entries(data.output).forEach(([robotId, outputs]) => outputs.forEach(output => appendCommandOutput(robotId, output)));
+                        break;
+                    case 'command_resync':
+                        // Command updates were dropped while this dashboard fell behind
+                        loadInFlightCommands();
+                        loadCommandOutput();
+                        break;
                     default:
                         console.log(data);
                         break;
@@ -234,6 +257,68 @@ function initWebSocket() {
     }
 }
 
+// Replace the local fleet model with a full snapshot
+function applyRobotState(data) {
+    robotModel = new Map((data.cabots || []).map(robot => [robot.id, robot]));
+    globalMessages = data.messages || [];
+    stateVersion = data.version;
+    awaitingSnapshot = false;
+    clearTimeout(snapshotRetryTimer);
+    renderRobotModel();
+}
+
+// Ask the server for a snapshot, and again every SNAPSHOT_RETRY_MS until one arrives
+function requestSnapshot() {
+    awaitingSnapshot = true;
+    clearTimeout(snapshotRetryTimer);
+    if (ws && ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ type: 'refresh' }));
+    }
+    snapshotRetryTimer = setTimeout(() => {
+        if (awaitingSnapshot) {
+            console.log('Snapshot not received, requesting again');
+            requestSnapshot();
+        }
+    }, SNAPSHOT_RETRY_MS);
+}
+
+// Apply a delta for the robots that changed, or request a snapshot on a version gap
+function applyRobotPatch(data) {
+    if (awaitingSnapshot) {
+        return;
+    }
+    if (stateVersion !== null && data.version <= stateVersion) {
+        return;
+    }
+    // Snapshots and patches arrive in order, so a patch before any snapshot means the snapshot was dropped
+    if (stateVersion === null || data.version !== stateVersion + 1) {
+        console.log(`Version gap (local ${stateVersion}, received ${data.version}), requesting snapshot`);
+        requestSnapshot();
+        return;
+    }
+    (data.cabots || []).forEach(robot => robotModel.set(robot.id, robot));
+    (data.removed || []).forEach(robotId => robotModel.delete(robotId));
+    if (data.messages) {
+        globalMessages = data.messages;
+    }
+    stateVersion = data.version;
+    renderRobotModel();
+}
+
+// Render the local fleet model, honoring the pause checkbox
+function renderRobotModel() {
+    const data = {
+        cabots: Array.from(robotModel.values()).sort((a, b) => a.name < b.name ? -1 : a.name > b.name ? 1 : 0),
+        messages: globalMessages
+    };
+    if (document.getElementById("pause").checked) {
+        lastData = data;
+    } else {
+        updateDashboard(data);
+    }
+    updateMessageList(data.messages);
+}
+
 // Handle connection failure
 function handleConnectionFailure() {
     if (reconnectAttempts < MAX_RECONNECT_ATTEMPTS) {
@@ -406,72 +491,65 @@ async function executeAction() {
             throw new Error('No enabled robots selected');
         }
 
-        const promises = enabledRobots.map(robotId => {
-            return new Promise((resolve, reject) => {
-                let commandData = currentAction;
-                let commandOption = null;
+        let commandData = currentAction;
+        let commandOption = null;
 
-                if (currentAction === 'software_update') {
-                    const selectedImages = [];
-                    const versionItems = document.querySelectorAll('.version-item');
-                    
-                    versionItems.forEach(item => {
-                        const checkbox = item.querySelector('input[type="checkbox"].version-checkbox');
-                        
-                        if (checkbox && checkbox.checked && !checkbox.disabled) {
-                            const imageId = checkbox.id.replace('-checkbox', '');
-                            const select = document.getElementById(`${imageId}-version`);
-                            const nameText = item.querySelector('.version-name-text');
-                            
-                            if (select && nameText && nameText.textContent && 
-                                nameText.textContent !== '+ Click here to set Docker image name') {
-                                const imageInfo = {
-                                    name: nameText.textContent.trim(),
-                                    version: select.value
-                                };
-                                selectedImages.push(imageInfo);
-                            }
-                        }
-                    });
+        if (currentAction === 'software_update') {
+            const selectedImages = [];
+            const versionItems = document.querySelectorAll('.version-item');
+            
+            versionItems.forEach(item => {
+                const checkbox = item.querySelector('input[type="checkbox"].version-checkbox');
+                
+                if (checkbox && checkbox.checked && !checkbox.disabled) {
+                    const imageId = checkbox.id.replace('-checkbox', '');
+                    const select = document.getElementById(`${imageId}-version`);
+                    const nameText = item.querySelector('.version-name-text');
                     
-                    if (selectedImages.length > 0) {
-                        commandOption = {
-                            images: selectedImages
+                    if (select && nameText && nameText.textContent && 
+                        nameText.textContent !== '+ Click here to set Docker image name') {
+                        const imageInfo = {
+                            name: nameText.textContent.trim(),
+                            version: select.value
                         };
-                    }
-                } else if(currentAction === 'site_update') {
-                    commandOption = {
-                        'CABOT_SITE_REPO': document.getElementById('CABOT_SITE_REPO').value.trim(),
-                        'CABOT_SITE_VERSION': document.getElementById('CABOT_SITE_VERSION').value.trim(),
-                        'CABOT_SITE': document.getElementById('CABOT_SITE').value.trim()
-                    };
-                } else if(currentAction === 'env_update') {
-                    commandOption = {};
-                    for (const row of document.querySelectorAll('#envTable tbody tr')) {
-                        const input = row.querySelectorAll('input[type=text]');
-                        let value = input[1].value.trim();
-                        const v_c = value.split('#');
-                        let v = v_c.shift().trim();
-                        if (v.match(/ /) && !v.match(/^['"].*['"]$/)) {
-                            value = v_c.length == 0 ? `"${v}"` : `"${v}" #${v_c.join('#')}`;
-                        }
-                        commandOption[input[0].value.trim()] = value;
+                        selectedImages.push(imageInfo);
                     }
                 }
-
-                const message = {
-                    type: 'command',
-                    cabotId: robotId,
-                    command: commandData,
-                    commandOption: commandOption || {}
-                };
-
-                ws.send(JSON.stringify(message));
-                resolve();
             });
-        });
+            
+            if (selectedImages.length > 0) {
+                commandOption = {
+                    images: selectedImages
+                };
+            }
+        } else if(currentAction === 'site_update') {
+            commandOption = {
+                'CABOT_SITE_REPO': document.getElementById('CABOT_SITE_REPO').value.trim(),
+                'CABOT_SITE_VERSION': document.getElementById('CABOT_SITE_VERSION').value.trim(),
+                'CABOT_SITE': document.getElementById('CABOT_SITE').value.trim()
+            };
+        } else if(currentAction === 'env_update') {
+            commandOption = {};
+            for (const row of document.querySelectorAll('#envTable tbody tr')) {
+                const input = row.querySelectorAll('input[type=text]');
+                let value = input[1].value.trim();
+                const v_c = value.split('#');
+                let v = v_c.shift().trim();
+                if (v.match(/ /) && !v.match(/^['"].*['"]$/)) {
+                    value = v_c.length == 0 ? `"${v}"` : `"${v}" #${v_c.join('#')}`;
+                }
+                commandOption[input[0].value.trim()] = value;
+            }
+        }
 
-        await Promise.all(promises);
+        // One message for every selected robot; the server answers with a batch_command_response
+        ws.send(JSON.stringify({
+            type: 'batch_command',
+            requestId: `${Date.now()}`,
+            cabotIds: enabledRobots,
+            command: commandData,
+            commandOption: commandOption || {}
+        }));
         if (document.getElementById("pause").checked) {
             document.getElementById("pause").checked = false;
             updateDashboard();
@@ -488,6 +566,148 @@ async function executeAction() {
     }
 }
 
+async function loadInFlightCommands() {
+    try {
+        const response = await fetch('/api/commands/in_flight', { credentials: 'same-origin' });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        inFlightCommands = await response.json();
+        Object.keys(inFlightCommands).forEach(updateInFlight);
+    } catch (error) {
+        console.error('Error loading in-flight commands:', error);
+    }
+}
+
+async function loadCommandOutput() {
+    try {
+        const response = await fetch('/api/commands/output', { credentials: 'same-origin' });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const outputs = await response.json();
+        commandOutput = {};
+        Object.entries(outputs).forEach(([robotId, commands]) => {
+            if (commands.length > 0) {
+                appendCommandOutput(robotId, commands[commands.length - 1]);
+            }
+        });
+    } catch (error) {
+        console.error('Error loading command output:', error);
+    }
+}
+
+// A newer command replaces the shown output, lines of the same command are appended
+function appendCommandOutput(robotId, output) {
+    let shown = commandOutput[robotId];
+    if (!shown || shown.id !== output.id) {
+        shown = commandOutput[robotId] = { id: output.id, command: output.command, lines: [] };
+    }
+    shown.lines.push(...output.lines);
+    if (shown.lines.length > OUTPUT_TAIL_LINES) {
+        shown.lines.splice(0, shown.lines.length - OUTPUT_TAIL_LINES);
+    }
+    updateCommandOutput(robotId);
+}
+
+function escapeHtml(text) {
+    return text.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+}
+
+// Last lines of the robot's latest streamed command, stderr highlighted
+function renderCommandOutput(robotId) {
+    const shown = commandOutput[robotId];
+    if (!shown) {
+        return '';
+    }
+    return shown.lines.map(([stream, text]) =>
+        stream === 'stderr' ? `<span class="text-danger">${escapeHtml(text)}</span>` : escapeHtml(text)
+    ).join('\n');
+}
+
+function updateCommandOutput(robotId) {
+    const element = document.getElementById(`output-${robotId}`);
+    if (element) {
+        element.innerHTML = renderCommandOutput(robotId);
+        element.title = commandOutput[robotId].command;
+        element.style.display = '';
+        element.scrollTop = element.scrollHeight;
+    }
+}
+
+// Badges for the commands a robot has queued or running, with their age
+function renderInFlight(robotId) {
+    const now = Date.now() / 1000;
+    return (inFlightCommands[robotId] || []).map(command => {
+        const since = command.started_at || command.dequeued_at || command.enqueued_at;
+        const badge = command.state === 'running' ? 'bg-warning text-dark' : command.state === 'sent' ? 'bg-info text-dark' : 'bg-light text-dark';
+        const cancel = command.command === 'cancel' ? '' :
+            `<i class="bi bi-x-circle ms-1" role="button" title="Cancel" onclick="cancelCommand('${robotId}', '${command.id}')"></i>`;
+        return `<span class="badge ${badge}" title="${command.id}">${command.command} ${command.state} ${Math.max(0, Math.round(now - since))}s${cancel}</span>`;
+    }).join(' ');
+}
+
+// Drop a queued command, or have the robot kill a running one
+async function cancelCommand(robotId, commandId) {
+    try {
+        const response = await fetch(`/api/robots/${encodeURIComponent(robotId)}/commands/${encodeURIComponent(commandId)}/cancel`, {
+            method: 'POST',
+            credentials: 'same-origin'
+        });
+        if (!response.ok) {
+            const error = await response.json().catch(() => ({}));
+            throw new Error(error.detail || `HTTP ${response.status}`);
+        }
+    } catch (error) {
+        console.error('Error cancelling command:', error);
+        const actionError = document.getElementById('actionError');
+        if (actionError) {
+            actionError.textContent = `Could not cancel the command on ${robotId}: ${error.message}`;
+            actionError.style.display = 'block';
+        }
+    }
+}
+
+// Host metrics reported by robots with CABOT_DASHBOARD_HOST_ROOT
+function renderMetrics(metrics) {
+    if (!metrics) {
+        return '';
+    }
+    const badges = [];
+    if (metrics.load_1m !== undefined) {
+        const load = metrics.cpu_count ? metrics.load_1m / metrics.cpu_count : metrics.load_1m;
+        badges.push(`<span class="badge ${load > 1 ? 'bg-danger' : load > 0.7 ? 'bg-warning' : 'bg-success'}" title="load average (1m/5m/15m): ${metrics.load_1m} ${metrics.load_5m} ${metrics.load_15m}">load ${metrics.load_1m.toFixed(1)}</span>`);
+    }
+    if (metrics.mem_used_percent !== undefined) {
+        badges.push(`<span class="badge ${metrics.mem_used_percent > 90 ? 'bg-danger' : metrics.mem_used_percent > 70 ? 'bg-warning' : 'bg-success'}" title="memory available: ${(metrics.mem_available_bytes / 2 ** 30).toFixed(1)} GiB">mem ${Math.round(metrics.mem_used_percent)}%</span>`);
+    }
+    if (metrics.temperature_c !== undefined) {
+        badges.push(`<span class="badge ${metrics.temperature_c > 85 ? 'bg-danger' : metrics.temperature_c > 70 ? 'bg-warning' : 'bg-success'}" title="hottest thermal zone">${Math.round(metrics.temperature_c)}&deg;C</span>`);
+    }
+    return badges.join(' ');
+}
+
+function updateInFlight(robotId) {
+    const element = document.getElementById(`inflight-${robotId}`);
+    if (element) {
+        element.innerHTML = renderInFlight(robotId);
+    }
+}
+
+// Report robots a batch command was not queued for
+function handleBatchCommandResponse(data) {
+    const problems = [
+        ...Object.entries(data.rejected || {}).map(([robotId, status]) => `${robotId} (${status})`),
+        ...(data.not_connected || []).map(robotId => `${robotId} (not connected)`)
+    ];
+    console.log(`Command ${data.command.command} queued for ${data.accepted.length} robot(s)`);
+    const actionError = document.getElementById('actionError');
+    if (actionError && problems.length > 0) {
+        actionError.textContent = `Command ${data.command.command} was not sent to: ${problems.join(', ')}`;
+        actionError.style.display = 'block';
+    }
+}
+
 // Send command to robot
 function sendCommand(command, actionErrorDiv) {
     const actionError = document.getElementById(actionErrorDiv || 'actionError');
@@ -580,6 +800,7 @@ function updateDashboard(data) {
                                 'bg-secondary'}">
                                 ${robot.disk_usage.text}
                             </span>
+                            ${renderMetrics(robot.metrics)}
                             <span class="badge bg-dark">
                                 ${formatDateTime(robot.last_poll, true)}
                             </span>
@@ -594,6 +815,8 @@ function updateDashboard(data) {
                     <span class="badge bg-primary">${robot.env['CABOT_SITE']}@${robot.env['CABOT_SITE_VERSION']}</span>
                     ` : ''}
                 </div>
+                <div class="in-flight mb-1" id="inflight-${robot.id}">${renderInFlight(robot.id)}</div>
+                <pre class="command-output mb-1" id="output-${robot.id}" title="${commandOutput[robot.id] ? commandOutput[robot.id].command : ''}" style="${commandOutput[robot.id] ? '' : 'display: none;'}">${renderCommandOutput(robot.id)}</pre>
                 <div class="accordion" id="parentAccordion-${robot.id}">
                     <div class="accordion-item">
                         <h2 class="accordion-header">
@@ -663,11 +886,10 @@ function updateDashboard(data) {
                                         `).join('')}
                                     </div>
                                     ` : ''}
-                                    ${robot.all_messages && robot.all_messages.length > 0 ? `
+                                    ${robot.history_cursor != null ? `
                                     <div class="text-end mt-2">
                                         <button class="btn btn-sm btn-outline-secondary view-history-btn"
-                                                data-robot-id="${robot.id}"
-                                                data-messages='${JSON.stringify(robot.all_messages).replace(/'/g, "&#39;")}'>
+                                                data-robot-id="${robot.id}">
                                             <i class="bi bi-clock-history"></i> View History
                                         </button>
                                     </div>
@@ -697,6 +919,8 @@ function updateDashboard(data) {
             });
 
             robotList.appendChild(robotCard);
+            const output = robotCard.querySelector('.command-output');
+            output.scrollTop = output.scrollHeight;
         }
     });
 
@@ -1110,33 +1334,21 @@ function searchRobots(text) {
 }
 
 // Show log dialog
-function showLogDialog(robotId, allMessages) {
+let logDialogState = null;
+
+function showLogDialog(robotId) {
     const dialog = document.getElementById('logDialog');
     const content = document.getElementById('logContent');
     if (!dialog || !content) return;
 
     // Clear previous content
     content.innerHTML = '';
-
-    // Sort messages by timestamp in descending order
-    const sortedMessages = allMessages.sort((a, b) => {
-        return new Date(b.timestamp) - new Date(a.timestamp);
-    });
-
-    // Add all messages to dialog
-    sortedMessages.forEach(msg => {
-        const entry = document.createElement('div');
-        entry.className = 'log-entry mb-2';
-        entry.innerHTML = `
-            <div class="d-flex">
-                <span class="log-timestamp me-3">${formatDateTime(msg.timestamp)}</span>
-                <div class="log-message ${msg.level === 'error' ? 'text-danger' : 
-                                       msg.level === 'success' ? 'text-success' : 
-                                       'text-dark'}">${msg.message}</div>
-            </div>
-        `;
-        content.appendChild(entry);
-    });
+    logDialogState = { robotId: robotId, next: null, loading: false };
+    const levelFilter = document.getElementById('logLevelFilter');
+    if (levelFilter) {
+        levelFilter.value = '';
+    }
+    loadLogPage();
 
     // Show dialog
     dialog.style.display = 'flex';
@@ -1145,12 +1357,75 @@ function showLogDialog(robotId, allMessages) {
     document.addEventListener('keydown', handleLogDialogEscape);
 }
 
+// Reload the history from the newest message with the current filter
+function filterLogDialog() {
+    if (!logDialogState) return;
+    document.getElementById('logContent').innerHTML = '';
+    logDialogState = { robotId: logDialogState.robotId, next: null, loading: false };
+    loadLogPage();
+}
+
+// Fetch the next page of the history, newest first, and append it to the dialog
+async function loadLogPage() {
+    const state = logDialogState;
+    const content = document.getElementById('logContent');
+    const moreButton = document.getElementById('logLoadMore');
+    if (!state || state.loading) return;
+    state.loading = true;
+    if (moreButton) moreButton.disabled = true;
+
+    const params = new URLSearchParams({ limit: 50 });
+    if (state.next != null) params.set('before', state.next);
+    const level = document.getElementById('logLevelFilter')?.value;
+    if (level) params.set('level', level);
+
+    try {
+        const response = await fetch(`/api/robots/${encodeURIComponent(state.robotId)}/messages?${params}`, { credentials: 'same-origin' });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const page = await response.json();
+        if (state !== logDialogState) return;  // Dialog was closed or refiltered meanwhile
+
+        page.messages.forEach(msg => {
+            const entry = document.createElement('div');
+            entry.className = 'log-entry mb-2';
+            entry.innerHTML = `
+                <div class="d-flex">
+                    <span class="log-timestamp me-3">${formatDateTime(msg.timestamp)}</span>
+                    <div class="log-message ${msg.level === 'error' ? 'text-danger' : 
+                                           msg.level === 'success' ? 'text-success' : 
+                                           'text-dark'}">${msg.message}</div>
+                </div>
+            `;
+            content.appendChild(entry);
+        });
+        if (content.children.length === 0) {
+            content.innerHTML = '<div class="text-center text-muted p-3">No messages</div>';
+        }
+        state.next = page.next;
+        if (moreButton) moreButton.style.display = page.next != null ? '' : 'none';
+    } catch (error) {
+        console.error('Error loading message history:', error);
+        if (state === logDialogState) {
+            const errorEntry = document.createElement('div');
+            errorEntry.className = 'text-center text-danger p-3';
+            errorEntry.textContent = 'Failed to load message history';
+            content.appendChild(errorEntry);
+        }
+    } finally {
+        state.loading = false;
+        if (moreButton) moreButton.disabled = false;
+    }
+}
+
 // Close log dialog
 function closeLogDialog() {
     const dialog = document.getElementById('logDialog');
     if (dialog) {
         dialog.style.display = 'none';
     }
+    logDialogState = null;
     document.removeEventListener('keydown', handleLogDialogEscape);
 }
 
@@ -1168,8 +1443,7 @@ function findRobotById(robotId) {
 
     const robotData = {
         id: robotId,
-        messages: [],
-        all_messages: []
+        messages: []
     };
 
     // Get messages from the robot card
@@ -1187,11 +1461,6 @@ function findRobotById(robotId) {
             message: message,
             level: level
         });
-        robotData.all_messages.push({
-            timestamp: timestamp,
-            message: message,
-            level: level
-        });
     });
 
     return robotData;
@@ -1199,9 +1468,7 @@ function findRobotById(robotId) {
 
 // Show log dialog from button
 function showLogDialogFromButton(button) {
-    const robotId = button.dataset.robotId;
-    const messages = JSON.parse(button.dataset.messages);
-    showLogDialog(robotId, messages);
+    showLogDialog(button.dataset.robotId);
 }
 
 // Initialize Docker Hub version items
@@ -0,0 +1,17 @@
+import sys
+from pathlib import Path
+
+# Tests import the app package the way uvicorn does, from cabot_dashboard_server
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def robot_manager():
+    """A RobotStateManager of its own, since the notifiers keep the loop of the test that used them"""
+    from app.services.robot_state import RobotStateManager
+
+    RobotStateManager._instance = None
+    yield RobotStateManager()
+    RobotStateManager._instance = None
@@ -0,0 +1,84 @@
+import asyncio
+import sys
+from pathlib import Path
+
+from app.services.backend import RedisBackend
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+from fake_redis import FakeRedisServer  # noqa: E402
+
+
+async def workers(count: int):
+    """Backends sharing one fake Redis server, each recording the robots messages it receives"""
+    server = FakeRedisServer()
+    await server.start()
+    backends, received = [], []
+    for _ in range(count):
+        backend = RedisBackend(server.url)
+        messages = []
+        backend.subscribe("robots", messages.append)
+        await backend.start()
+        backends.append(backend)
+        received.append(messages)
+    await asyncio.sleep(0.05)  # Subscribed
+    return server, backends, received
+
+
+async def close(server, backends):
+    for backend in backends:
+        await backend.close()
+    await server.close()
+
+
+def test_changes_reach_the_other_workers_only():
+    async def run():
+        server, (first, second), (first_received, second_received) = await workers(2)
+        first.publish("robots", {"method": "update_robot_status", "args": ["r1", "connected"]})
+        second.publish("robots", {"method": "update_robot_status", "args": ["r2", "connected"]})
+        await asyncio.sleep(0.1)
+        stats = first.stats()
+        await close(server, [first, second])
+        return first_received, second_received, stats
+
+    first_received, second_received, stats = asyncio.run(run())
+    assert first_received == [{"method": "update_robot_status", "args": ["r2", "connected"]}]
+    assert second_received == [{"method": "update_robot_status", "args": ["r1", "connected"]}]
+    assert (stats["published"], stats["received"]) == (1, 1)
+
+
+def test_queues_and_flags_are_shared():
+    async def run():
+        server, (first, second), _ = await workers(2)
+        lanes = ("safety", "control")
+        await first.push_commands({"r1": {"id": "a", "command": {"command": "ros-start"}}}, "control")
+        await first.push_command("r1", {"id": "b", "command": {"command": "ros-stop"}}, "safety")
+        await first.push_command("r1", {"id": "c", "command": {"command": "ros-start"}}, "control")
+        listed = await second.list_commands(["r1", "r2"], lanes)
+        removed = await second.remove_commands("r1", lanes, {"c", "unknown"})
+        popped = [await second.pop_command("r1", lanes) for _ in range(3)]
+        await first.set_flag("reconnected_clients", "r1", True)
+        flags = (await second.get_flag("reconnected_clients", "r1"), await second.get_flag("reconnected_clients", "r2"))
+        await close(server, [first, second])
+        return listed, removed, popped, flags
+
+    listed, removed, popped, flags = asyncio.run(run())
+    assert [entry["id"] for entry in listed["r1"]] == ["b", "a", "c"]
+    assert listed["r2"] == []
+    assert [entry["id"] for entry in removed] == ["c"]
+    assert [entry and entry["id"] for entry in popped] == ["b", "a", None]
+    assert flags == (True, None)
+
+
+def test_replicated_changes_are_applied_without_republishing(robot_manager):
+    published = []
+    robot_manager.backend.publish = lambda channel, message: published.append(message)
+    try:
+        robot_manager._on_remote_change({"method": "update_robot_state", "args": ["replicated", {"status": "connected"}]})
+        robot_manager._on_remote_change({"method": "restore", "args": []})
+        robot_manager.update_robot_status("replicated", "disconnected")
+    finally:
+        del robot_manager.backend.publish
+    assert robot_manager.connected_cabots["replicated"].status == "disconnected"
+    # Only the local change goes out; the remote one is not echoed and the unknown one is ignored
+    assert published == [{"method": "update_robot_status", "args": ("replicated", "disconnected")}]
@@ -0,0 +1,149 @@
+import asyncio
+
+from fastapi import Response, WebSocketDisconnect
+
+from app.config import settings
+from app.routers import client
+from app.services.backend import InMemoryBackend
+from app.services.command_queue import CommandQueueManager
+from app.services.persistence import StatePersistence
+
+
+class RobotSocket:
+    """The robot's end of its WebSocket channel, driven by the test"""
+
+    def __init__(self, api_key: str = settings.api_key):
+        self.headers = {"X-API-Key": api_key}
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        self.closed = code
+        self.incoming.put_nowait(WebSocketDisconnect(code))
+
+    async def receive_json(self):
+        message = await self.incoming.get()
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    async def received(self, message_type: str) -> dict:
+        for _ in range(100):
+            for message in self.sent:
+                if message["type"] == message_type:
+                    self.sent.remove(message)
+                    return message
+            await asyncio.sleep(0.01)
+        raise AssertionError(f"no {message_type} in {self.sent}")
+
+
+class PollRequest:
+    def __init__(self, body: dict):
+        self.body = body
+
+    async def json(self):
+        return self.body
+
+
+def test_robot_channel_acks_heartbeats_pushes_commands_and_takes_results(robot_manager):
+    async def run():
+        queue = CommandQueueManager(InMemoryBackend())
+        await client.connect("channel", robot_manager, queue)
+        socket = RobotSocket()
+        channel = asyncio.ensure_future(client.robot_websocket(socket, "channel", robot_manager, queue))
+
+        socket.incoming.put_nowait({"type": "heartbeat", "cabot_system_status": "active", "status_seq": 1, "base_seq": 0})
+        ack = await socket.received("status_ack")
+        get_env = await socket.received("command")  # Asked for its env after connecting
+        await queue.add_command("channel", {"command": "ros-stop", "commandOption": {}})
+        ros_stop = await socket.received("command")
+        socket.incoming.put_nowait({"type": "send", "status": {"status": "success", "type": "command", "message": "stopped",
+                                                               "commandId": ros_stop["command"]["commandId"]}})
+        for _ in range(100):
+            if ros_stop["command"]["commandId"] not in queue.tracker.in_flight["channel"]:
+                break
+            await asyncio.sleep(0.01)
+        in_flight = [record.command for record in queue.tracker.in_flight["channel"].values()]
+
+        socket.incoming.put_nowait(WebSocketDisconnect(1000))
+        await channel
+        return ack, get_env, ros_stop, in_flight, queue.tracker.outcomes
+
+    ack, get_env, ros_stop, in_flight, outcomes = asyncio.run(run())
+    assert ack == {"type": "status_ack", "status_seq": 1}
+    assert get_env["command"]["command"] == "get-env"
+    assert ros_stop["command"]["command"] == "ros-stop"
+    assert in_flight == ["get-env"]
+    assert outcomes["ros-stop"] == {"success": 1}
+    record = robot_manager.connected_cabots["channel"]
+    assert (record.status, record.connected, record.system_status) == ("disconnected", False, "active")
+    assert [message["message"] for message in record.all_messages.history()][0] == "stopped"
+
+
+def test_robot_channel_refuses_wrong_key_and_unknown_robot(robot_manager):
+    async def run():
+        queue = CommandQueueManager(InMemoryBackend())
+        wrong_key, unknown = RobotSocket("wrong"), RobotSocket()
+        await client.robot_websocket(wrong_key, "refused", robot_manager, queue)
+        await client.robot_websocket(unknown, "refused", robot_manager, queue)
+        return wrong_key.closed, unknown.closed
+
+    assert asyncio.run(run()) == (4003, 4004)
+
+
+def test_new_channel_supersedes_the_old_one_without_disconnecting(robot_manager):
+    async def run():
+        queue = CommandQueueManager(InMemoryBackend())
+        await client.connect("superseded", robot_manager, queue)
+        old, new = RobotSocket(), RobotSocket()
+        old_channel = asyncio.ensure_future(client.robot_websocket(old, "superseded", robot_manager, queue))
+        await asyncio.sleep(0.02)
+        new_channel = asyncio.ensure_future(client.robot_websocket(new, "superseded", robot_manager, queue))
+        await asyncio.wait_for(old_channel, 1)
+        status = robot_manager.connected_cabots["superseded"].status
+        new.incoming.put_nowait(WebSocketDisconnect(1000))
+        await new_channel
+        return old.closed, status
+
+    closed, status = asyncio.run(run())
+    assert closed == 1000
+    assert status == "connected"
+
+
+def test_poll_asks_for_env_unless_it_was_restored(tmp_path, robot_manager):
+    async def run():
+        store = StatePersistence(str(tmp_path / "state.db"), 60, 100)
+        store.save_robot("restored", {}, {"CABOT_NAME": "restored"}, None)
+        await store.close()
+        robot_manager.restore(StatePersistence(str(tmp_path / "state.db"), 60, 100))
+        queue = CommandQueueManager(InMemoryBackend())
+        try:
+            polled = {}
+            for robot_id in ("restored", "fresh"):
+                await client.connect(robot_id, robot_manager, queue)
+                await queue.add_command(robot_id, {"command": "ros-stop", "commandOption": {}})
+                polled[robot_id] = await client.poll(PollRequest({}), Response(), robot_id, robot_manager, queue)
+            return polled
+        finally:
+            await robot_manager.close()
+
+    polled = asyncio.run(run())
+    assert polled["restored"]["command"] == "ros-stop"
+    assert polled["fresh"]["command"] == "get-env"
+
+
+def test_image_tags_report_is_recorded_once(robot_manager):
+    queue = CommandQueueManager(InMemoryBackend())
+    robot_manager.update_robot_state("tagged", {"status": "connected"})
+    client.handle_status(robot_manager, queue, "tagged", {"type": "image_tags", "status": "success", "tags": {"cabot-bag": "v2"}})
+
+    record = robot_manager.connected_cabots["tagged"]
+    assert record.images == {"cabot-bag": "v2"}
+    assert [message["message"] for message in record.all_messages.history()] == ["Image tags updated successfully"]
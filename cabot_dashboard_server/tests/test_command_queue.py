@@ -0,0 +1,150 @@
+import asyncio
+
+import pytest
+
+from app.services.backend import InMemoryBackend
+from app.services.command_queue import CommandQueueFull, CommandQueueManager, command_allowed
+
+
+def make_manager(**settings) -> CommandQueueManager:
+    manager = CommandQueueManager(InMemoryBackend())
+    manager.POLL_TIMEOUT = 0.1
+    manager.PREEMPTION = True
+    manager.COMMAND_TTL = 0
+    for name, value in settings.items():
+        setattr(manager, name, value)
+    return manager
+
+
+async def drain(manager: CommandQueueManager, client_id: str) -> list:
+    commands = []
+    while True:
+        try:
+            commands.append((await manager.wait_for_update(client_id))["command"])
+        except asyncio.TimeoutError:
+            return commands
+
+
+def test_parked_poll_is_woken_by_add_and_superseded_by_new_poll():
+    async def run():
+        manager = make_manager(POLL_TIMEOUT=5)
+        poll = asyncio.ensure_future(manager.wait_for_update("r1"))
+        await asyncio.sleep(0.01)
+        await manager.add_command("r1", {"command": "ros-stop", "commandOption": {}})
+        command = await asyncio.wait_for(poll, 1)
+
+        stale = asyncio.ensure_future(manager.wait_for_update("r1"))
+        await asyncio.sleep(0.01)
+        fresh = asyncio.ensure_future(manager.wait_for_update("r1"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(ConnectionResetError):
+            await asyncio.wait_for(stale, 1)
+        fresh.cancel()
+        return command
+
+    command = asyncio.run(run())
+    assert command["command"] == "ros-stop"
+    assert command["commandId"]
+
+
+def test_parked_poll_times_out_without_a_command():
+    async def run():
+        manager = make_manager(POLL_TIMEOUT=0.2)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with pytest.raises(asyncio.TimeoutError):
+            await manager.wait_for_update("r1")
+        return loop.time() - started, manager.waiters
+
+    elapsed, waiters = asyncio.run(run())
+    assert 0.19 <= elapsed < 0.5
+    assert waiters == {}
+
+
+@pytest.mark.parametrize("command, system_status, allowed", [
+    ("ros_stop", "active", True),
+    ("ros-stop", "active", True),
+    ("cancel", "activating", True),
+    ("get-env", "active", True),
+    ("ros_start", "active", False),
+    ("software_update", "active", False),
+    ("reboot", "active", False),
+    ("ros_start", "inactive", True),
+    ("power_off", "failed", True),
+])
+def test_command_allowed(command, system_status, allowed):
+    assert command_allowed(command, system_status) is allowed
+
+
+def test_safety_lane_first_then_control_then_background():
+    async def run():
+        manager = make_manager()
+        await manager.add_command("r1", {"command": "get-env", "commandOption": {}})
+        await manager.add_command("r1", {"command": "software_update", "commandOption": {}})
+        await manager.add_command("r1", {"command": "ros-stop", "commandOption": {}})
+        return await drain(manager, "r1"), manager.stats()
+
+    commands, stats = asyncio.run(run())
+    assert commands == ["ros-stop", "software_update", "get-env"]
+    assert [stats[lane]["dispatched"] for lane in ("safety", "control", "background")] == [1, 1, 1]
+
+
+def test_ros_stop_preempts_queued_ros_start():
+    async def run(preemption):
+        manager = make_manager(PREEMPTION=preemption)
+        await manager.add_command("r1", {"command": "ros-start", "commandOption": {}})
+        await manager.add_command("r1", {"command": "ros-stop", "commandOption": {}})
+        return await drain(manager, "r1"), manager.stats()["control"]["preempted"]
+
+    assert asyncio.run(run(True)) == (["ros-stop"], 1)
+    assert asyncio.run(run(False)) == (["ros-stop", "ros-start"], 0)
+
+
+def test_identical_command_collapses_into_queued_one():
+    async def run():
+        manager = make_manager()
+        command = {"command": "ros-start", "commandOption": {}}
+        results = [await manager.add_command("r1", command) for _ in range(3)]
+        return results, await drain(manager, "r1")
+
+    results, commands = asyncio.run(run())
+    assert results == ["queued", "collapsed", "collapsed"]
+    assert commands == ["ros-start"]
+
+
+def test_expired_command_is_not_dispatched():
+    async def run():
+        manager = make_manager()
+        await manager.add_command("r1", {"command": "software_update", "commandOption": {}}, ttl=0.01)
+        await manager.add_command("r1", {"command": "get-env", "commandOption": {}}, ttl=0)
+        await asyncio.sleep(0.05)
+        return await drain(manager, "r1"), manager.stats()["control"]["expired"]
+
+    assert asyncio.run(run()) == (["get-env"], 1)
+
+
+def test_full_queue_evicts_lower_lane_and_refuses_same_lane():
+    async def run():
+        manager = make_manager(MAX_DEPTH=2)
+        await manager.add_command("r1", {"command": "get-env", "commandOption": {}})
+        await manager.add_command("r1", {"command": "site_update", "commandOption": {"n": 1}})
+        # Makes room by dropping the background get-env
+        await manager.add_command("r1", {"command": "software_update", "commandOption": {}})
+        with pytest.raises(CommandQueueFull):
+            await manager.add_command("r1", {"command": "site_update", "commandOption": {"n": 2}})
+        return await drain(manager, "r1"), manager.stats()
+
+    commands, stats = asyncio.run(run())
+    assert commands == ["site_update", "software_update"]
+    assert stats["background"]["evicted"] == 1
+    assert stats["control"]["refused"] == 1
+
+
+def test_cancel_drops_a_queued_command():
+    async def run():
+        manager = make_manager()
+        await manager.add_command("r1", {"command": "software_update", "commandOption": {}})
+        command_id = next(iter(manager.tracker.in_flight["r1"]))
+        return await manager.cancel_command("r1", command_id), await drain(manager, "r1")
+
+    assert asyncio.run(run()) == ("dropped", [])
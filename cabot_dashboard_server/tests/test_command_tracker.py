@@ -0,0 +1,55 @@
+import asyncio
+from collections import deque
+import time
+
+from app.services.backend import InMemoryBackend
+from app.services.command_tracker import CommandOutput, CommandTracker
+
+
+def entry(command_id: str, command: str, enqueued_at: float) -> dict:
+    return {"id": command_id, "command": {"command": command, "commandOption": {}}, "lane": "control", "enqueued_at": enqueued_at}
+
+
+def test_stages_and_outcomes_are_recorded():
+    async def run():
+        tracker = CommandTracker(InMemoryBackend())
+        tracker.enqueued("r1", entry("a", "ros-start", time.time()))
+        tracker.dequeued("r1", "a")
+        tracker.reported("r1", "a", "start")
+        in_flight = tracker.get_in_flight("r1")
+        tracker.reported("r1", "a", "success")
+        tracker.enqueued("r1", entry("b", "ros-start", time.time()))
+        tracker.dropped("r1", "b", "preempted")
+        tracker.reported("r1", "unknown", "success")
+        return in_flight, tracker.get_latency(), tracker.get_in_flight("r1")
+
+    in_flight, latency, left = asyncio.run(run())
+    assert [record["id"] for record in in_flight["r1"]] == ["a"]
+    stages = latency["ros-start"]["stages"]
+    assert {stage: stats["count"] for stage, stats in stages.items()} == {"queue": 1, "start": 1, "run": 1, "total": 1}
+    assert latency["ros-start"]["outcomes"] == {"success": 1, "preempted": 1}
+    assert left == {"r1": []}
+
+
+def test_output_is_named_after_the_in_flight_command():
+    async def run():
+        tracker = CommandTracker(InMemoryBackend())
+        tracker.enqueued("r1", entry("a", "software_update", time.time()))
+        tracker.output("r1", "a", "progress", [["stdout", "pulling"]])
+        tracker.output("r1", "a", None, [["stderr", "retrying"]])
+        tracker.output("r1", "b", "get-env", [["stdout", "CABOT_NAME=r1"]])
+        return tracker.get_output("r1")["r1"]
+
+    outputs = asyncio.run(run())
+    assert [(output["command"], output["lines"]) for output in outputs] == [
+        ("software_update", [["stdout", "pulling"], ["stderr", "retrying"]]),
+        ("get-env", [["stdout", "CABOT_NAME=r1"]]),
+    ]
+
+
+def test_output_is_kept_up_to_max_encoded_bytes():
+    output = CommandOutput("a", "software_update", 10)
+    output.append([["stdout", "é" * 4], ["stdout", "ok"], ["stderr", "日本"]])
+
+    assert output.lines == deque([["stdout", "ok"], ["stderr", "日本"]])
+    assert (output.bytes, output.dropped_bytes) == (8, 8)
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.routers import dashboard
+from app.services.backend import InMemoryBackend
+from app.services.command_queue import CommandQueueManager
+
+
+class AuthService:
+    async def validate_token(self, token):
+        return token == "valid"
+
+
+@pytest.mark.parametrize("robot_ids", [[], "r1", ["r1", 2], None])
+def test_batch_rejects_robot_ids_that_are_not_a_list_of_ids(robot_manager, robot_ids):
+    async def run():
+        queue = CommandQueueManager(InMemoryBackend())
+        body = {"command": "ros-stop", "robot_ids": robot_ids}
+        with pytest.raises(HTTPException) as raised:
+            await dashboard.send_batch_command(body, "valid", AuthService(), robot_manager, queue)
+        return raised.value.status_code
+
+    assert asyncio.run(run()) == 400
+
+
+def test_batch_queues_for_listed_robots(robot_manager):
+    async def run():
+        robot_manager.update_robot_state("r1", {"status": "connected"})
+        queue = CommandQueueManager(InMemoryBackend())
+        body = {"command": "ros-stop", "robot_ids": ["r1"]}
+        return await dashboard.send_batch_command(body, "valid", AuthService(), robot_manager, queue)
+
+    result = asyncio.run(run())
+    assert result["accepted"] == ["r1"]
+    assert result["command"]["command"] == "ros-stop"
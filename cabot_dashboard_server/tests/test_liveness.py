@@ -0,0 +1,39 @@
+import asyncio
+
+from app.services.liveness import LivenessTracker
+
+
+def test_robots_expire_at_their_deadline_unless_touched():
+    async def run():
+        expired = []
+        tracker = LivenessTracker(0.1, expired.extend)
+        tracker.touch("r1")
+        tracker.touch("r2")
+        tracker.touch("r3", timeout=0.3)
+        await asyncio.sleep(0.05)
+        tracker.touch("r2")  # Pushed back to 0.15
+        await asyncio.sleep(0.07)
+        after_first = list(expired)
+        await asyncio.sleep(0.06)
+        after_second = list(expired)
+        await asyncio.sleep(0.2)
+        return after_first, after_second, list(expired), len(tracker)
+
+    after_first, after_second, after_all, left = asyncio.run(run())
+    assert after_first == ["r1"]
+    assert after_second == ["r1", "r2"]
+    assert after_all == ["r1", "r2", "r3"]
+    assert left == 0
+
+
+def test_discarded_robot_does_not_expire():
+    async def run():
+        expired = []
+        tracker = LivenessTracker(0.05, expired.extend)
+        tracker.touch("r1")
+        tracker.touch("r2")
+        tracker.discard("r1")
+        await asyncio.sleep(0.1)
+        return expired
+
+    assert asyncio.run(run()) == ["r2"]
@@ -0,0 +1,37 @@
+from app.services.message_buffer import MessageBuffer
+
+
+def filled(count: int, capacity: int) -> MessageBuffer:
+    buffer = MessageBuffer(capacity)
+    for seq in range(1, count + 1):
+        buffer.append({"seq": seq, "level": "error" if seq % 3 == 0 else "info"}, epoch=1000.0 + seq)
+    return buffer
+
+
+def test_oldest_messages_are_overwritten():
+    buffer = filled(7, 5)
+    assert len(buffer) == 5
+    assert [message["seq"] for message in buffer.history()] == [7, 6, 5, 4, 3]
+
+
+def test_latest_is_newest_first_and_limited_by_age():
+    buffer = filled(7, 5)
+    assert [message["seq"] for message in buffer.latest(2)] == [7, 6]
+    assert [message["seq"] for message in buffer.latest(10, within=2.5, now=1007.0)] == [7, 6, 5]
+    assert buffer.latest_entries(1) == [(1007.0, {"seq": 7, "level": "info"})]
+
+
+def test_pages_follow_the_seq_cursor():
+    buffer = filled(10, 10)
+    first = buffer.page(4)
+    second = buffer.page(4, before=first[-1]["seq"])
+    last = buffer.page(4, before=second[-1]["seq"])
+    assert [[message["seq"] for message in page] for page in (first, second, last)] == [[10, 9, 8, 7], [6, 5, 4, 3], [2, 1]]
+    assert (buffer.oldest_seq(), buffer.latest_seq()) == (1, 10)
+
+
+def test_page_filters_by_level_and_time():
+    buffer = filled(10, 10)
+    assert [message["seq"] for message in buffer.page(10, level="error")] == [9, 6, 3]
+    assert [message["seq"] for message in buffer.page(10, before=9, level="error")] == [6, 3]
+    assert [message["seq"] for message in buffer.page(10, since=1004.0, until=1007.0)] == [6, 5, 4]
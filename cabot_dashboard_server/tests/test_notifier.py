@@ -0,0 +1,40 @@
+import asyncio
+
+from app.services.notifier import CoalescingNotifier
+
+
+def test_changes_within_a_window_are_flushed_together():
+    async def run():
+        flushes = []
+
+        async def flush(robot_ids, messages):
+            flushes.append((asyncio.get_running_loop().time(), sorted(robot_ids), messages))
+
+        notifier = CoalescingNotifier(flush, 0.1)
+        started = asyncio.get_running_loop().time()
+        notifier.mark(["r1"])
+        await asyncio.sleep(0.01)  # The first change after a quiet period goes out right away
+        notifier.mark(["r2"])
+        notifier.mark(["r3"])
+        notifier.mark(messages=True)
+        await asyncio.sleep(0.2)
+        return started, flushes, notifier.stats()
+
+    started, flushes, stats = asyncio.run(run())
+    assert [(robot_ids, messages) for _, robot_ids, messages in flushes] == [(["r1"], False), (["r2", "r3"], True)]
+    assert flushes[0][0] - started < 0.05
+    # The second flush waits for the window, not longer
+    assert 0.09 <= flushes[1][0] - flushes[0][0] < 0.15
+    assert stats["sent"] == 2
+    assert stats["suppressed"] == 2
+
+
+def test_mark_without_a_loop_is_ignored():
+    flushes = []
+
+    async def flush(robot_ids, messages):
+        flushes.append(robot_ids)
+
+    notifier = CoalescingNotifier(flush, 0.1)
+    notifier.mark(["r1"])
+    assert notifier.stats()["pending"] == 0
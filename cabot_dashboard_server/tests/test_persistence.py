@@ -0,0 +1,80 @@
+import asyncio
+
+from app.services.persistence import StatePersistence
+from app.services.robot_state import RobotStateManager
+
+
+def message(seq: int, robot_id: str) -> dict:
+    return {"seq": seq, "cabot_id": robot_id, "message": f"message {seq}", "level": "info"}
+
+
+async def save(path: str, history_limit: int, messages: int):
+    store = StatePersistence(path, 60, history_limit)
+    store.save_robot("restored", {"cabot-bag": "v1"}, {"CABOT_NAME": "restored"}, "2024-06-27T12:34:56+00:00")
+    for seq in range(1, messages + 1):
+        store.save_message("restored", message(seq, "restored"), 1000.0 + seq)
+    store.save_message(None, message(messages + 1, None), 2000.0)
+    await store.close()
+
+
+def test_history_is_pruned_per_robot(tmp_path):
+    path = str(tmp_path / "state.db")
+    asyncio.run(save(path, 3, 5))
+
+    async def load():
+        store = StatePersistence(path, 60, 3)
+        snapshot = store.load(10)
+        page = await store.read_messages("restored", 10, before=5)
+        await store.close()
+        return snapshot, page
+
+    snapshot, page = asyncio.run(load())
+    assert snapshot["robots"][0][:4] == ("restored", {"cabot-bag": "v1"}, {"CABOT_NAME": "restored"}, "2024-06-27T12:34:56+00:00")
+    assert [m["seq"] for _, m in snapshot["messages"]["restored"]] == [3, 4, 5]
+    assert [m["seq"] for _, m in snapshot["messages"][None]] == [6]
+    assert snapshot["max_seq"] == 6
+    assert [m["seq"] for m in page] == [4, 3]
+
+
+def test_restore_brings_robots_back_disconnected(tmp_path, robot_manager):
+    path = str(tmp_path / "state.db")
+    asyncio.run(save(path, 100, 3))
+
+    async def restore():
+        store = StatePersistence(path, 60, 100)
+        robot_manager.restore(store)
+        try:
+            return (RobotStateManager.get_robot_state("restored"), robot_manager.has_restored_env("restored"),
+                    robot_manager.has_restored_env("not_restored"), robot_manager.message_seq)
+        finally:
+            await robot_manager.close()
+
+    state, restored_env, other_env, message_seq = asyncio.run(restore())
+    assert state["status"] == "disconnected"
+    assert state["env"] == {"CABOT_NAME": "restored"}
+    assert state["images"] == {"cabot-bag": "v1"}
+    assert [m["seq"] for m in state["messages"]] == [3, 2, 1]
+    assert restored_env and not other_env
+    assert message_seq >= 4
+    assert robot_manager.persistence is None
+
+
+def test_history_pages_continue_on_disk(tmp_path, robot_manager):
+    path = str(tmp_path / "state.db")
+    asyncio.run(save(path, 100, 8))
+
+    async def pages():
+        robot_manager.MAX_MESSAGES = 3  # Only the newest three are restored into memory
+        robot_manager.restore(StatePersistence(path, 60, 100))
+        try:
+            first = await robot_manager.get_robot_messages("restored", 5)
+            second = await robot_manager.get_robot_messages("restored", 5, before=first["next"])
+            return first, second
+        finally:
+            await robot_manager.close()
+
+    first, second = asyncio.run(pages())
+    assert [m["seq"] for m in first["messages"]] == [8, 7, 6, 5, 4]
+    assert first["next"] == 4
+    assert [m["seq"] for m in second["messages"]] == [3, 2, 1]
+    assert second["next"] is None
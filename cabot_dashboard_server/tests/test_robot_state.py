@@ -0,0 +1,52 @@
+FULL = {"cabot_system_status": "inactive", "cabot_wifi_status": "", "cabot_disk_usage": "42%",
+        "cabot_metrics": {"disk_used_percent": 42, "load_1m": 0.5}}
+
+
+def test_unnumbered_report_is_applied_and_not_acknowledged(robot_manager):
+    assert robot_manager.report_status("seq_plain", dict(FULL)) is None
+    state = robot_manager.get_robot_state("seq_plain")
+    assert state["status"] == "connected"
+    assert state["system_status"] == "inactive"
+    assert state["metrics"] == FULL["cabot_metrics"]
+
+
+def test_partial_report_is_merged_onto_acknowledged_one(robot_manager):
+    assert robot_manager.report_status("seq_partial", {**FULL, "status_seq": 1, "base_seq": 0}) == 1
+    assert robot_manager.report_status("seq_partial", {"cabot_system_status": "active", "status_seq": 2, "base_seq": 1}) == 2
+    state = robot_manager.get_robot_state("seq_partial")
+    assert state["system_status"] == "active"
+    assert state["disk_usage"] == "42%"
+    assert state["metrics"] == FULL["cabot_metrics"]
+
+
+def test_partial_report_on_unknown_base_asks_for_full_report(robot_manager):
+    assert robot_manager.report_status("seq_gap", {**FULL, "status_seq": 1, "base_seq": 0}) == 1
+    # Report 2 went elsewhere
+    assert robot_manager.report_status("seq_gap", {"cabot_system_status": "active", "status_seq": 3, "base_seq": 2}) == 0
+    assert robot_manager.get_robot_state("seq_gap")["system_status"] == "active"
+    assert robot_manager.report_status("seq_gap", {**FULL, "status_seq": 4, "base_seq": 0}) == 4
+
+
+def test_state_update_not_from_robot_resets_acknowledged_report(robot_manager):
+    assert robot_manager.report_status("seq_reset", {**FULL, "status_seq": 1, "base_seq": 0}) == 1
+    robot_manager.update_robot_state("seq_reset", {"status": "connected"})
+    assert robot_manager.report_status("seq_reset", {"cabot_wifi_status": "", "status_seq": 2, "base_seq": 1}) == 0
+
+
+def test_patches_are_numbered_after_the_snapshot(robot_manager):
+    robot_manager.update_robot_state("patch_kept", {"status": "connected"})
+    robot_manager.update_robot_state("patch_removed", {"status": "connected"})
+    version = robot_manager.get_snapshot()["version"]
+
+    patch = robot_manager._build_patch(["patch_kept"])
+    assert patch["version"] == version + 1
+    assert [cabot["id"] for cabot in patch["cabots"]] == ["patch_kept"]
+
+    robot_manager._remove_robot("patch_removed")
+    patch = robot_manager._build_patch(["patch_removed"], messages=True)
+    assert patch["version"] == version + 2
+    assert patch["removed"] == ["patch_removed"]
+    assert "messages" in patch
+    snapshot = robot_manager.get_snapshot()
+    assert snapshot["version"] == version + 2
+    assert "patch_removed" not in [cabot["id"] for cabot in snapshot["cabots"]]
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+from app.services.websocket import ConnectionManager
+
+
+class SlowWebSocket:
+    """A dashboard whose sends wait until it is released"""
+
+    def __init__(self):
+        self.client = None
+        self.released = asyncio.Event()
+        self.received = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        await self.released.wait()
+        self.received.append(json.loads(text))
+
+
+def test_overflowing_patches_collapse_into_one_snapshot():
+    async def run():
+        manager = ConnectionManager()
+        manager.MAX_QUEUE = 2
+        manager.snapshot = lambda: {"type": "robot_state", "version": 5}
+        websocket = SlowWebSocket()
+        await manager.connect(websocket)
+
+        await manager.broadcast({"type": "robot_patch", "version": 1})
+        await asyncio.sleep(0)  # Patch 1 is being sent
+        await manager.broadcast({"type": "robot_patch", "version": 2})
+        await manager.broadcast({"type": "robot_patch", "version": 3})
+        await manager.broadcast({"type": "notice"})
+        await manager.broadcast({"type": "robot_patch", "version": 4})
+        await manager.broadcast({"type": "robot_patch", "version": 5})
+        await manager.send_personal(websocket, {"type": "robot_state", "version": 0})
+        stats = manager.stats()[0]
+
+        websocket.released.set()
+        await asyncio.sleep(0.05)
+        manager.disconnect(websocket)
+        return websocket.received, stats
+
+    received, stats = asyncio.run(run())
+    assert received == [
+        {"type": "robot_patch", "version": 1},
+        {"type": "notice"},
+        {"type": "robot_state", "version": 5},
+        {"type": "robot_state", "version": 0},
+    ]
+    assert stats["collapsed"] == 4
+    assert stats["queue_depth"] == 3
+
+
+def test_patches_below_the_limit_are_sent_in_order():
+    async def run():
+        manager = ConnectionManager()
+        manager.MAX_QUEUE = 10
+        manager.snapshot = lambda: {"type": "robot_state", "version": 0}
+        websocket = SlowWebSocket()
+        websocket.released.set()
+        await manager.connect(websocket)
+        for version in range(1, 6):
+            await manager.broadcast({"type": "robot_patch", "version": version})
+        await asyncio.sleep(0.05)
+        manager.disconnect(websocket)
+        return [message["version"] for message in websocket.received]
+
+    assert asyncio.run(run()) == [1, 2, 3, 4, 5]
+
+
+def test_overflowing_command_updates_are_replaced_by_a_resync():
+    async def run():
+        manager = ConnectionManager()
+        manager.MAX_QUEUE = 2
+        websocket = SlowWebSocket()
+        await manager.connect(websocket)
+
+        await manager.broadcast({"type": "command_output", "output": {"r1": 1}})
+        await asyncio.sleep(0)  # Output 1 is being sent
+        for n in range(2, 6):
+            await manager.broadcast({"type": "command_output", "output": {"r1": n}})
+        await manager.broadcast({"type": "command_status", "in_flight": {"r1": []}})
+        stats = manager.stats()[0]
+
+        websocket.released.set()
+        await asyncio.sleep(0.05)
+        await manager.broadcast({"type": "command_output", "output": {"r1": 6}})
+        await asyncio.sleep(0.05)
+        manager.disconnect(websocket)
+        return websocket.received, stats
+
+    received, stats = asyncio.run(run())
+    assert received == [
+        {"type": "command_output", "output": {"r1": 1}},
+        {"type": "command_resync"},
+        {"type": "command_output", "output": {"r1": 6}},
+    ]
+    assert stats["collapsed"] == 5
+    assert stats["queue_depth"] == 1